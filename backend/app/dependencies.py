@@ -0,0 +1,174 @@
+"""Process-wide services shared by every router.
+
+Nothing is created at import time. Each service is built on first use,
+once per process; the app lifespan warms them up in the background, and
+routes receive them through the async get_* dependencies. Instances are
+forgotten in forked children, so every worker opens its own connections.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+
+from app.services.conversation import ConversationStore
+from app.services.firebase_service import FirebaseService
+from app.services.history_writer import HistoryWriteQueue
+from app.services.rag_service import RAGService
+from app.services.rate_limiter import UserRateLimiter, create_rate_limiter
+from app.utils import metrics
+
+_instances = {}
+_locks = {}
+_readiness = {"ready": False, "warmup_seconds": None, "error": None}
+
+
+def _singleton(factory):
+    """Build on first call and return the same instance afterwards, from any thread"""
+    name = factory.__name__
+
+    @functools.wraps(factory)
+    def get():
+        instance = _instances.get(name)
+        if instance is None:
+            with _locks.setdefault(name, threading.Lock()):
+                instance = _instances.get(name)
+                if instance is None:
+                    instance = _instances[name] = factory()
+        return instance
+
+    return get
+
+
+@_singleton
+def firebase_service():
+    return FirebaseService()
+
+
+@_singleton
+def rag_service():
+    return RAGService()
+
+
+@_singleton
+def history_writer():
+    # Chat messages are persisted off the request path; started and stopped by the app lifespan
+    return HistoryWriteQueue(firebase_service())
+
+
+@_singleton
+def conversations():
+    # Recent turns per user, so follow-up questions don't re-read Firestore
+    return ConversationStore(history_writer().recent_history)
+
+
+@_singleton
+def rate_limiter():
+    # Per-user token budgets for the LLM-bound chat endpoints
+    return create_rate_limiter()
+
+
+def install(**instances):
+    """Use the given instances (e.g. firebase_service=...) instead of creating them"""
+    _instances.update(instances)
+
+
+def reset():
+    """Forget every instance; the next use creates new ones"""
+    _instances.clear()
+    _locks.clear()
+    _readiness.update(ready=False, warmup_seconds=None, error=None)
+
+
+# A forked worker must not reuse the parent's gRPC/HTTP connections or thread locks
+os.register_at_fork(after_in_child=reset)
+
+
+async def _provide(get):
+    # Already created is the common case and needs no thread hop
+    instance = _instances.get(get.__name__)
+    if instance is not None:
+        return instance
+    # Still warming up: wait off the event loop instead of blocking it on the lock
+    return await asyncio.to_thread(get)
+
+
+async def get_firebase_service() -> FirebaseService:
+    return await _provide(firebase_service)
+
+
+async def get_rag_service() -> RAGService:
+    return await _provide(rag_service)
+
+
+async def get_history_writer() -> HistoryWriteQueue:
+    return await _provide(history_writer)
+
+
+async def get_conversations() -> ConversationStore:
+    return await _provide(conversations)
+
+
+async def get_rate_limiter() -> UserRateLimiter:
+    return await _provide(rate_limiter)
+
+
+def _warm_up_blocking():
+    firebase_service()
+    # Loads the tokenizer, vector index and BM25 index
+    rag_service()
+
+
+async def warm_up():
+    """Create every service off the event loop and record readiness for /ready"""
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(_warm_up_blocking)
+        await firebase_service().prefetch_certs()
+    except Exception as e:
+        print(f"Warning: warm-up failed: {str(e)}")
+        _readiness["error"] = str(e)
+        return
+    _readiness.update(ready=True, warmup_seconds=time.perf_counter() - start)
+
+
+def readiness():
+    return dict(_readiness)
+
+
+async def shutdown():
+    if "history_writer" in _instances:
+        await _instances["history_writer"].stop()
+    if "rag_service" in _instances:
+        await _instances["rag_service"].llm.close()
+        if _instances["rag_service"].answer_cache is not None:
+            await asyncio.to_thread(_instances["rag_service"].answer_cache.close)
+    if "firebase_service" in _instances:
+        await _instances["firebase_service"].close()
+    if "rate_limiter" in _instances:
+        await _instances["rate_limiter"].close()
+
+
+def _register_stats(prefix, name, stats):
+    # Empty until the service exists, so scraping /metrics never creates one
+    metrics.register_stats(prefix, lambda: stats(_instances[name]) if name in _instances else {})
+
+
+_register_stats(
+    "huberman_semantic_cache", "rag_service", lambda s: s.answer_cache.stats() if s.answer_cache else {}
+)
+_register_stats(
+    "huberman_precomputed_answers", "rag_service", lambda s: s.precomputed.stats() if s.precomputed else {}
+)
+_register_stats("huberman_embedding_cache", "rag_service", lambda s: s.embeddings.stats())
+_register_stats("huberman_reranker", "rag_service", lambda s: s.reranker.stats() if s.reranker else {})
+_register_stats("huberman_single_flight", "rag_service", lambda s: s.single_flight.stats())
+_register_stats("huberman_llm_admission", "rag_service", lambda s: s.llm.admission.stats())
+_register_stats("huberman_upstream_llm", "rag_service", lambda s: s.llm.upstream.stats())
+_register_stats("huberman_upstream_embedding", "rag_service", lambda s: s.embedding_upstream.stats())
+_register_stats("huberman_upstream_retrieval", "rag_service", lambda s: s.retrieval_upstream.stats())
+_register_stats("huberman_upstream_firestore", "firebase_service", lambda s: s.firestore.stats())
+_register_stats("huberman_rate_limit", "rate_limiter", lambda s: s.stats())
+_register_stats("huberman_id_token_cache", "firebase_service", lambda s: s.id_token_cache.stats())
+_register_stats("huberman_history_queue", "history_writer", lambda s: s.stats())
+_register_stats("huberman_conversations", "conversations", lambda s: s.stats())
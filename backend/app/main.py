@@ -1,8 +1,26 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import dependencies
 from app.routers import auth, chat
+from app.utils.metrics import http_request_duration, render_metrics, setup_tracing
 
-app = FastAPI(title="Huberman RAG API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index, tokenizer and clients load in the background; /ready reports when they are done
+    warm_up = asyncio.create_task(dependencies.warm_up())
+    await (await dependencies.get_history_writer()).start()
+    yield
+    warm_up.cancel()
+    await dependencies.shutdown()
+
+
+app = FastAPI(title="Huberman RAG API", lifespan=lifespan)
+setup_tracing(app)
 
 # Configure CORS
 app.add_middleware(
@@ -17,6 +35,29 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep cardinality bounded
+    route = request.scope.get("route")
+    http_request_duration.observe(
+        time.perf_counter() - start,
+        request.method,
+        route.path if route is not None else "unmatched",
+        response.status_code
+    )
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    readiness = dependencies.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Huberman RAG API"} 
\ No newline at end of file
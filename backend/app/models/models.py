@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Literal
+from datetime import date
+from typing import List, Literal, Optional
 
 
 class UserCredentials(BaseModel):
@@ -20,13 +21,50 @@ class Message(BaseModel):
 
 class ChatHistory(BaseModel):
     messages: List[Message] = Field(default_factory=list)
+    # Opaque; pass back as ?cursor= to load the page of older messages. None on the oldest page
+    next_cursor: Optional[str] = None
+
+
+class RetrievalFilters(BaseModel):
+    # Restrict retrieval to these episodes; criteria are combined with AND
+    episode_ids: Optional[List[str]] = None
+    # Case-insensitive substring match on the guest name, any of them
+    guests: Optional[List[str]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+
+# Longer messages are refused up front rather than failing later in the prompt or in Firestore
+MAX_MESSAGE_CHARS = 8000
 
 
 class ChatRequest(BaseModel):
-    message: str
+    message: str = Field(max_length=MAX_MESSAGE_CHARS)
     use_rag: bool = True
+    filters: Optional[RetrievalFilters] = None
+
+
+class BatchRequest(BaseModel):
+    questions: List[str] = Field(min_length=1)
+    # Answer each question with retrieval, without it, or both for side-by-side evaluation
+    modes: List[Literal["rag", "no_rag"]] = Field(default_factory=lambda: ["rag"], min_length=1)
+    filters: Optional[RetrievalFilters] = None
+    # Concurrent LLM calls for this batch, capped by BATCH_LLM_CONCURRENCY
+    concurrency: int = Field(8, ge=1)
+
+
+class Source(BaseModel):
+    episode_id: str
+    title: str
+    guest: str = ""
+    date: str = ""
 
 
 class ChatResponse(BaseModel):
     response: str
-    chat_history: List[Message] 
\ No newline at end of file
+    chat_history: List[Message]
+    # Episodes the answer's context came from, in retrieval order
+    sources: List[Source] = Field(default_factory=list)
+    # Dependencies this answer had to do without: "embedding" (lexical retrieval only),
+    # "retrieval" (answered without context) or "history" (conversation not loaded or not saved)
+    degraded: List[str] = Field(default_factory=list) 
\ No newline at end of file
@@ -1,19 +1,95 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.models.models import ChatRequest, ChatResponse, ChatHistory, Message
+import json
+import math
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.models.models import BatchRequest, ChatRequest, ChatResponse, ChatHistory, Message
+from app.services.batch import BATCH_MAX_QUESTIONS, run_batch
 from app.services.rag_service import RAGService
-from app.services.firebase_service import FirebaseService
-from app.utils.auth import get_current_user
-from typing import Dict, Any, List
+from app.services.firebase_service import FirebaseService, HISTORY_PAGE_SIZE
+from app.services.history_writer import HistoryWriteQueue
+from app.services.conversation import ConversationStore
+from app.services.episodes import cite_sources
+from app.services.rate_limiter import RateLimitExceeded, UserRateLimiter
+from app.dependencies import (
+    get_conversations, get_firebase_service, get_history_writer, get_rag_service, get_rate_limiter
+)
+from app.utils.admission import Overloaded
+from app.utils.auth import get_current_user, get_eval_user
+from app.utils.resilience import CircuitOpen, DeadlineExceeded, UpstreamFailed
+from typing import Dict, Any, List, Optional
 
 router = APIRouter()
-rag_service = RAGService()
-firebase_service = FirebaseService()
+
+
+async def _load_conversation(conversations, user_id, degraded=None):
+    try:
+        return await conversations.get(user_id)
+    except Exception as firebase_error:
+        print(f"Warning: Could not load chat history: {str(firebase_error)}")
+        if degraded is not None:
+            degraded.append("history")
+        return []
+
+
+def _remember(history_writer, conversations, user_id, message, degraded=None):
+    """Queue a message for persistence and add it to the in-memory conversation"""
+    if not history_writer.enqueue(user_id, message) and degraded is not None:
+        degraded.append("history")
+    conversations.append(user_id, message)
+
+
+def _retry_after(seconds):
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+async def _charge(rate_limiter, user_id, cost):
+    try:
+        await rate_limiter.acquire(user_id, cost)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=_retry_after(e.retry_after))
+
+
+async def _admit(rate_limiter, rag_service, user_id, request, history):
+    """429 when the user is over their token budget, 503 when the LLM queue is full or its circuit open"""
+    await _charge(rate_limiter, user_id, rag_service.estimate_tokens(request.message, request.use_rag, history))
+    _check_capacity(rag_service)
+
+
+def _check_capacity(rag_service):
+    """503 when the LLM queue is full or its circuit open"""
+    if rag_service.llm.admission.saturated():
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly",
+            headers=_retry_after(rag_service.llm.admission.queue_timeout)
+        )
+    breaker = rag_service.llm.upstream.breaker
+    if breaker.is_open():
+        raise HTTPException(
+            status_code=503,
+            detail=str(CircuitOpen(breaker.name, breaker.retry_after())),
+            headers=_retry_after(breaker.retry_after())
+        )
+
+
+def _sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @router.get("/history", response_model=ChatHistory)
-async def get_chat_history(current_user: dict = Depends(get_current_user)):
+async def get_chat_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=200),
+    # Opaque to clients: a next_cursor from an earlier page. It holds a nanosecond seq, too large for a
+    # JavaScript number, so it stays a string; anything but digits is a 422, not a failed query
+    cursor: Optional[str] = Query(None, pattern=r"^\d{1,20}$"),
+    current_user: dict = Depends(get_current_user),
+    firebase_service: FirebaseService = Depends(get_firebase_service)
+):
     try:
         user_id = current_user["user_id"]
-        chat_history = firebase_service.get_chat_history(user_id)
+        chat_history, next_cursor = await firebase_service.get_chat_history(
+            user_id, limit=limit, cursor=int(cursor) if cursor is not None else None
+        )
         
         # Ensure each message has role and content fields
         validated_history = []
@@ -21,53 +97,53 @@ async def get_chat_history(current_user: dict = Depends(get_current_user)):
             if isinstance(msg, dict) and "role" in msg and "content" in msg:
                 validated_history.append(msg)
         
-        return {"messages": validated_history}
+        return {"messages": validated_history, "next_cursor": next_cursor}
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e.retry_after))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UpstreamFailed as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/message", response_model=ChatResponse)
-async def send_message(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+async def send_message(
+    request: ChatRequest,
+    current_user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    history_writer: HistoryWriteQueue = Depends(get_history_writer),
+    conversations: ConversationStore = Depends(get_conversations),
+    rate_limiter: UserRateLimiter = Depends(get_rate_limiter)
+):
+    user_id = current_user["user_id"]
+
+    # Earlier turns, for follow-up questions; answered without them if history is unavailable
+    degraded = []
+    history = await _load_conversation(conversations, user_id, degraded)
+    await _admit(rate_limiter, rag_service, user_id, request, history)
+
     try:
-        user_id = current_user["user_id"]
-        
-        # Save user message
+        # Queue user message for persistence
         user_message = {"role": "user", "content": request.message}
-        
-        try:
-            # Try to save the user message, which might fail due to permissions
-            firebase_service.save_message(user_id, user_message)
-        except Exception as firebase_error:
-            # Check if it's a permissions error
-            if "403" in str(firebase_error) or "permission" in str(firebase_error).lower():
-                raise HTTPException(
-                    status_code=403, 
-                    detail="Firebase permission error. Possible causes: 1) Firestore security rules are too restrictive, "
-                           "2) The service account lacks proper permissions, or "
-                           "3) The 'chats' collection doesn't exist yet."
-                )
-            else:
-                # Re-raise if it's not a permissions error
-                raise firebase_error
+        _remember(history_writer, conversations, user_id, user_message, degraded)
         
         # Generate response
+        sources = []
         if request.use_rag:
-            response_text = rag_service.query_with_rag(request.message)
+            response_text, retrieved_docs, rag_degraded = await rag_service.query_with_rag(
+                request.message, history, request.filters
+            )
+            sources = cite_sources(retrieved_docs)
+            degraded += rag_degraded
         else:
-            response_text = rag_service.query_without_rag(request.message)
+            response_text = await rag_service.query_without_rag(request.message, history)
         
-        # Save assistant response
+        # Queue assistant response for persistence
         assistant_message = {"role": "assistant", "content": response_text}
+        _remember(history_writer, conversations, user_id, assistant_message, degraded)
         
-        try:
-            chat_history = firebase_service.save_message(user_id, assistant_message)
-        except Exception as firebase_error:
-            # If we can't save the assistant message, still return the response
-            # but with a warning and without updated chat history
-            print(f"Warning: Could not save assistant message: {str(firebase_error)}")
-            return {
-                "response": response_text + "\n\nNote: Your message history could not be saved due to a database permission issue.",
-                "chat_history": [user_message, assistant_message]  # Return just the current conversation
-            }
+        chat_history = await _load_conversation(conversations, user_id) or [user_message, assistant_message]
         
         # Ensure each message in chat_history has role and content fields
         validated_history = []
@@ -78,8 +154,99 @@ async def send_message(request: ChatRequest, current_user: dict = Depends(get_cu
         
         return {
             "response": response_text,
-            "chat_history": validated_history
+            "chat_history": validated_history,
+            "sources": sources,
+            "degraded": list(dict.fromkeys(degraded))
         }
+    except (Overloaded, CircuitOpen) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after(e.retry_after))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UpstreamFailed as e:
+        print(e)
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         print(e)
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/message/stream")
+async def stream_message(
+    request: ChatRequest,
+    current_user: dict = Depends(get_current_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    history_writer: HistoryWriteQueue = Depends(get_history_writer),
+    conversations: ConversationStore = Depends(get_conversations),
+    rate_limiter: UserRateLimiter = Depends(get_rate_limiter)
+):
+    user_id = current_user["user_id"]
+    degraded = []
+    history = await _load_conversation(conversations, user_id, degraded)
+    await _admit(rate_limiter, rag_service, user_id, request, history)
+    _remember(history_writer, conversations, user_id, {"role": "user", "content": request.message}, degraded)
+
+    async def event_stream():
+        tokens = []
+        retrieved_docs = []
+        try:
+            async for event, data in rag_service.stream_query(
+                request.message, request.use_rag, history, request.filters
+            ):
+                if event == "degraded":
+                    degraded.extend(data)
+                    yield _sse_event("degraded", list(dict.fromkeys(degraded)))
+                elif event == "sources":
+                    retrieved_docs = data
+                    sources = [
+                        {"content": doc.page_content, "metadata": doc.metadata}
+                        for doc in data
+                    ]
+                    yield _sse_event("sources", sources)
+                else:
+                    tokens.append(data)
+                    yield _sse_event("token", {"content": data})
+        except Exception as e:
+            print(e)
+            yield _sse_event("error", {"detail": str(e)})
+            return
+
+        response_text = "".join(tokens)
+        _remember(history_writer, conversations, user_id, {"role": "assistant", "content": response_text}, degraded)
+
+        yield _sse_event("done", {
+            "response": response_text,
+            "sources": cite_sources(retrieved_docs),
+            "degraded": list(dict.fromkeys(degraded)),
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch")
+async def batch_answer(
+    request: BatchRequest,
+    current_user: dict = Depends(get_eval_user),
+    rag_service: RAGService = Depends(get_rag_service),
+    rate_limiter: UserRateLimiter = Depends(get_rate_limiter)
+):
+    """Answer many standalone questions; records stream back as JSON lines in completion order"""
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    modes = list(dict.fromkeys(request.modes))
+    _check_capacity(rag_service)
+    user_id = current_user["user_id"]
+
+    async def charge(cost):
+        # Each group pays its full estimate; a batch larger than the budget runs at the budget's refill rate
+        await rate_limiter.consume(user_id, cost)
+
+    async def ndjson():
+        async for record in run_batch(
+            rag_service, request.questions, modes, request.filters, request.concurrency, charge=charge
+        ):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from app.services.bm25_index import tokenize
+from app.utils.text import normalize_query
+
+# Answers built offline by precompute_answers.py; an empty path turns the tier off
+ANSWER_STORE_PATH = os.getenv("ANSWER_STORE_PATH", "../db/answer_store.sqlite")
+# Questions whose SimHashes differ in at most this many of 64 bits share an answer
+ANSWER_STORE_MAX_DISTANCE = int(os.getenv("ANSWER_STORE_MAX_DISTANCE", "3"))
+# Shorter questions only match exactly; a word or two says too little to call them duplicates
+ANSWER_STORE_NEAR_MIN_TOKENS = 3
+# How often a server checks whether the store file was rebuilt or invalidated
+ANSWER_STORE_RELOAD_SECONDS = float(os.getenv("ANSWER_STORE_RELOAD_SECONDS", "10"))
+SIMHASH_BITS = 64
+
+
+def question_key(question):
+    return hashlib.sha1(normalize_query(question).encode()).hexdigest()
+
+
+def question_tokens(question):
+    """Content words only: stopwords, punctuation and single letters do not change what is asked"""
+    return [token for token in tokenize(question) if len(token) > 1]
+
+
+def simhash(tokens):
+    """64-bit SimHash over words and word pairs; similar questions get hashes a few bits apart"""
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def simhash_bands(value, max_distance=ANSWER_STORE_MAX_DISTANCE):
+    """Split a hash into max_distance + 1 bands; hashes within max_distance bits share at least one"""
+    bands = max_distance + 1
+    band_bits = SIMHASH_BITS // bands
+    mask = (1 << band_bits) - 1
+    return [(band, value >> (band * band_bits) & mask) for band in range(bands)]
+
+
+def near_hash(question):
+    """SimHash of a question, or None when it is too short for near-duplicate matching"""
+    tokens = question_tokens(question)
+    return simhash(tokens) if len(tokens) >= ANSWER_STORE_NEAR_MIN_TOKENS else None
+
+
+@dataclass
+class PrecomputedAnswer:
+    key: str
+    question: str
+    near_hash: Optional[int]
+    answer: str
+    documents: List[dict]
+    count: int = 0
+    created_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def build(cls, question, answer, docs, count=0):
+        documents = [
+            {"id": doc.id, "page_content": doc.page_content, "metadata": dict(doc.metadata)} for doc in docs
+        ]
+        return cls(question_key(question), question, near_hash(question), answer, documents, count)
+
+    @property
+    def chunk_ids(self):
+        return [document["id"] for document in self.documents]
+
+    @property
+    def sources(self):
+        return sorted({document["metadata"].get("source") for document in self.documents} - {None})
+
+    def docs(self):
+        return [Document(**document) for document in self.documents]
+
+
+class SQLiteAnswerStore:
+    """The answer table, written by precompute_answers.py and invalidated by ingestion"""
+
+    def __init__(self, path=ANSWER_STORE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, question TEXT, near_hash TEXT, answer TEXT, documents TEXT, "
+                "chunk_ids TEXT, sources TEXT, count INTEGER, created_at REAL)"
+            )
+
+    def load(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, question, near_hash, answer, documents, count, created_at FROM answers"
+            ).fetchall()
+        return [
+            PrecomputedAnswer(
+                key, question, int(near) if near else None, answer, json.loads(documents), count, created_at
+            )
+            for key, question, near, answer, documents, count, created_at in rows
+        ]
+
+    def replace_all(self, entries):
+        """Swap in a new set of answers in one transaction, so servers never load a half-built store"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM answers")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        entry.key,
+                        entry.question,
+                        None if entry.near_hash is None else str(entry.near_hash),
+                        entry.answer,
+                        json.dumps(entry.documents),
+                        json.dumps(entry.chunk_ids),
+                        json.dumps(entry.sources),
+                        entry.count,
+                        entry.created_at,
+                    )
+                    for entry in entries
+                ],
+            )
+
+    def invalidate_sources(self, filenames):
+        """Delete answers citing any chunk of these transcript files; returns how many"""
+        filenames = set(filenames)
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT key, sources FROM answers").fetchall()
+            stale = [(key,) for key, sources in rows if filenames & set(json.loads(sources))]
+            self.conn.executemany("DELETE FROM answers WHERE key = ?", stale)
+        return len(stale)
+
+    def close(self):
+        self.conn.close()
+
+
+def invalidate_answers(filenames, path=ANSWER_STORE_PATH):
+    """Drop precomputed answers built on chunks of re-indexed or deleted files"""
+    if not filenames or not path or not os.path.exists(path):
+        return 0
+    store = SQLiteAnswerStore(path)
+    try:
+        return store.invalidate_sources(filenames)
+    finally:
+        store.close()
+
+
+class PrecomputedAnswers:
+    """In-memory lookup over the answer store: exact normalized question, then near-duplicate SimHash.
+
+    Near-duplicate search only compares entries sharing a SimHash band with the
+    question (see simhash_bands) instead of scanning every entry. The store file
+    is reloaded when it changes on disk (a rebuild, or invalidation by ingest.py).
+    The check and the reload run in a thread in the background; lookups keep
+    reading the current entries until the new ones are swapped in whole.
+    """
+
+    def __init__(self, path=ANSWER_STORE_PATH, max_distance=ANSWER_STORE_MAX_DISTANCE,
+                 reload_seconds=ANSWER_STORE_RELOAD_SECONDS):
+        self.path = path
+        self.max_distance = max_distance
+        self.reload_seconds = reload_seconds
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._by_key = {}
+        self._by_band = {}
+        self._version = None
+        self._reloading = None
+        self._checked_at = time.monotonic()
+        self._swap(self._load_if_changed())
+
+    def lookup(self, question) -> Optional[PrecomputedAnswer]:
+        self.maybe_reload()
+        # One read of both maps, so a reload swapping them in between cannot mix two versions
+        by_key, by_band = self._by_key, self._by_band
+        if not by_key:
+            self.misses += 1
+            return None
+        entry = by_key.get(question_key(question))
+        if entry is not None:
+            self.exact_hits += 1
+            return entry
+        entry = self._nearest(by_band, near_hash(question))
+        if entry is not None:
+            self.near_hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def stats(self):
+        total = self.exact_hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._by_key),
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "hit_rate": (self.exact_hits + self.near_hits) / total if total else 0.0,
+        }
+
+    def _nearest(self, by_band, value):
+        if value is None:
+            return None
+        best, best_distance = None, self.max_distance + 1
+        for band_key in simhash_bands(value, self.max_distance):
+            for entry in by_band.get(band_key, ()):
+                distance = bin(entry.near_hash ^ value).count("1")
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+        return best
+
+    def maybe_reload(self):
+        """Every reload_seconds, start checking the store file in the background"""
+        if time.monotonic() - self._checked_at < self.reload_seconds or self._reloading is not None:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Scripts without an event loop reload inline
+            self._swap(self._load_if_changed())
+            return
+        self._reloading = loop.create_task(self._reload_in_background())
+
+    async def _reload_in_background(self):
+        try:
+            self._swap(await asyncio.to_thread(self._load_if_changed))
+        except Exception as e:
+            print(f"Warning: could not reload precomputed answers, keeping the loaded ones: {str(e)}")
+        finally:
+            self._reloading = None
+
+    def _load_if_changed(self):
+        """(version, by_key, by_band) read from disk, or None when the file is unchanged"""
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version == self._version:
+            return None
+        entries = []
+        if version is not None:
+            store = SQLiteAnswerStore(self.path)
+            try:
+                entries = store.load()
+            finally:
+                store.close()
+        by_key, by_band = {}, {}
+        for entry in entries:
+            by_key[entry.key] = entry
+            if entry.near_hash is not None:
+                for band_key in simhash_bands(entry.near_hash, self.max_distance):
+                    by_band.setdefault(band_key, []).append(entry)
+        return version, by_key, by_band
+
+    def _swap(self, loaded):
+        if loaded is None:
+            return
+        self._version, self._by_key, self._by_band = loaded
+        self.reloads += 1
+
+
+def create_precomputed_answers(path=ANSWER_STORE_PATH):
+    """The lookup tier, or None when ANSWER_STORE_PATH is empty"""
+    return PrecomputedAnswers(path) if path else None
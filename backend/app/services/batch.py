@@ -0,0 +1,134 @@
+import asyncio
+import os
+import random
+import time
+
+from app.services.episodes import cite_sources
+from app.utils.admission import Overloaded
+from app.utils.metrics import stage_timer
+from app.utils.resilience import CircuitOpen
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "10000"))
+# LLM calls in flight per batch; kept under LLM_MAX_CONCURRENCY so chat traffic still gets through
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+# Questions embedded and retrieved together; the next group is prepared while the LLM answers this one
+BATCH_GROUP_SIZE = int(os.getenv("BATCH_GROUP_SIZE", "256"))
+BATCH_OVERLOAD_RETRIES = 3
+
+
+async def run_batch(
+    rag_service, questions, modes=("rag",), filters=None, concurrency=BATCH_LLM_CONCURRENCY, charge=None
+):
+    """Answer many standalone questions, yielding one record per (question, mode) as it completes.
+
+    Each group of questions is embedded with grouped requests and retrieved in
+    one vectorized pass, then answered by at most `concurrency` LLM calls at a
+    time. Records are {"index", "question", "mode", "answer", "sources",
+    "latency_ms", "error"}; a final {"summary": ...} record follows. Answers
+    bypass the semantic cache and chat history.
+
+    charge(tokens), when given, is awaited with each group's estimated LLM
+    tokens before the group is retrieved, so it can pace the batch to a budget.
+    """
+    semaphore = asyncio.Semaphore(min(concurrency, BATCH_LLM_CONCURRENCY))
+    results = asyncio.Queue()
+    tasks = []
+    start = time.perf_counter()
+
+    def blank_record(index, mode):
+        return {
+            "index": index,
+            "question": questions[index],
+            "mode": mode,
+            "answer": None,
+            "sources": [],
+            "latency_ms": None,
+            "error": None,
+        }
+
+    async def answer(index, mode, docs):
+        question = questions[index]
+        record = blank_record(index, mode)
+        async with semaphore:
+            call_start = time.perf_counter()
+            try:
+                prompt = rag_service.build_rag_query(question, docs) if mode == "rag" else question
+                record["answer"] = await _complete(rag_service, prompt)
+                record["sources"] = cite_sources(docs)
+            except Exception as e:
+                record["error"] = str(e) or type(e).__name__
+            record["latency_ms"] = round((time.perf_counter() - call_start) * 1000, 1)
+        await results.put(record)
+
+    async def fail(indexes, e):
+        for index in indexes:
+            for mode in modes:
+                await results.put({**blank_record(index, mode), "error": str(e) or type(e).__name__})
+
+    async def prepare():
+        handed_off = 0
+        try:
+            for group_start in range(0, len(questions), BATCH_GROUP_SIZE):
+                group = range(group_start, min(group_start + BATCH_GROUP_SIZE, len(questions)))
+                retrieved = [[] for _ in group]
+                try:
+                    if charge is not None:
+                        await charge(sum(
+                            rag_service.estimate_tokens(questions[i], mode == "rag") for i in group for mode in modes
+                        ))
+                    if "rag" in modes:
+                        retrieved = await _retrieve_group(rag_service, [questions[i] for i in group], filters)
+                except Exception as e:
+                    # The group's questions are reported as failed; the rest of the batch carries on
+                    await fail(group, e)
+                    handed_off = group.stop
+                    continue
+                for index, docs in zip(group, retrieved):
+                    for mode in modes:
+                        tasks.append(asyncio.create_task(answer(index, mode, docs if mode == "rag" else [])))
+                handed_off = group.stop
+        except Exception as e:
+            # Whatever stopped the producer, every question it had not handed off gets a record,
+            # so the consumer below always receives the number of records it waits for
+            await fail(range(handed_off, len(questions)), e)
+
+    producer = asyncio.create_task(prepare())
+    expected = len(questions) * len(modes)
+    errors = 0
+    try:
+        for _ in range(expected):
+            record = await results.get()
+            errors += record["error"] is not None
+            yield record
+    finally:
+        # The client may disconnect mid-stream; stop any work still queued for it
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+    elapsed = time.perf_counter() - start
+    yield {
+        "summary": {
+            "questions": len(questions),
+            "answers": expected - errors,
+            "errors": errors,
+            "seconds": round(elapsed, 2),
+            "answers_per_second": round((expected - errors) / elapsed, 2) if elapsed else None,
+        }
+    }
+
+
+async def _retrieve_group(rag_service, group, filters):
+    with stage_timer("batch_embedding", queries=len(group)):
+        embeddings = await rag_service.embeddings.aembed_queries(group)
+    return await rag_service.retrieve_batch(group, embeddings, filters=filters)
+
+
+async def _complete(rag_service, prompt):
+    """One LLM call, waiting and retrying when the admission queue is full or the circuit is open"""
+    for attempt in range(BATCH_OVERLOAD_RETRIES + 1):
+        try:
+            return await rag_service.get_llm_response(prompt)
+        except (Overloaded, CircuitOpen) as e:
+            if attempt == BATCH_OVERLOAD_RETRIES:
+                raise
+            await asyncio.sleep(e.retry_after * (0.5 + random.random()))
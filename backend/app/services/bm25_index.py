@@ -0,0 +1,176 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.vector_index import (
+    EpisodePartitions,
+    SnapshotStrings,
+    publish_snapshot,
+    snapshot_version,
+    write_string_blob,
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or "
+    "our she so that the their them then there these they this to was we were what when where which who "
+    "why will with you your do does did can how".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index stored as flat numpy arrays.
+
+    Postings for term t are postings[indptr[t]:indptr[t + 1]] (int32 row ids)
+    with matching term frequencies in tfs (uint16), CSR style.
+    """
+
+    def __init__(self, vocabulary, indptr, postings, tfs, doc_lengths, ids, documents, metadatas, partitions=None):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self._partitions = partitions
+        # The published index directory this was loaded from, if any
+        self.version = None
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, ids, documents, metadatas):
+        vocabulary = {}
+        term_ids, rows, counts = [], [], []
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+        for row, text in enumerate(documents):
+            tokens = tokenize(text)
+            doc_lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                rows.append(row)
+                counts.append(min(count, np.iinfo(np.uint16).max))
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        postings = np.asarray(rows, dtype=np.int32)[order]
+        tfs = np.asarray(counts, dtype=np.uint16)[order]
+        return cls(vocabulary, indptr, postings, tfs, doc_lengths, list(ids), list(documents), list(metadatas))
+
+    @classmethod
+    def from_chroma(cls, collection, page_size=5000):
+        ids, documents, metadatas = [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(metadata or {} for metadata in page["metadatas"])
+            offset += len(page["ids"])
+        return cls.build(ids, documents, metadatas)
+
+    def save(self, path):
+        """Publish the index as a new version; servers with the current one mapped are unaffected"""
+        publish_snapshot(path, self._write)
+
+    def _write(self, path):
+        for name in ("indptr", "postings", "tfs", "doc_lengths"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        write_string_blob(path, "ids", self.ids)
+        write_string_blob(path, "documents", self.documents)
+        write_string_blob(path, "metadatas", (json.dumps(metadata) for metadata in self.metadatas))
+        self.partitions.save(path)
+        with open(os.path.join(path, "vocabulary.json"), "w") as f:
+            json.dump(self.vocabulary, f)
+
+    @classmethod
+    def load(cls, path):
+        # Resolve the published version once, so a publish during loading cannot mix two versions
+        path = snapshot_version(path)
+        with open(os.path.join(path, "vocabulary.json")) as f:
+            vocabulary = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ("indptr", "postings", "tfs", "doc_lengths")
+        }
+        index = cls(
+            vocabulary,
+            ids=SnapshotStrings(path, "ids"),
+            documents=SnapshotStrings(path, "documents"),
+            metadatas=SnapshotStrings(path, "metadatas", decode=json.loads),
+            partitions=EpisodePartitions.load(path) if EpisodePartitions.exists(path) else None,
+            **arrays,
+        )
+        index.version = path
+        return index
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "vocabulary.json"))
+
+    @property
+    def partitions(self):
+        if self._partitions is None:
+            self._partitions = EpisodePartitions.build(self.metadatas)
+        return self._partitions
+
+    def scores(self, query):
+        scores = np.zeros(len(self), dtype=np.float32)
+        n = len(self)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            rows = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = np.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[rows] / self.avg_doc_length)
+            # Each row appears once per term, so fancy-index accumulation is safe
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=20, episode_ids=None) -> List[Document]:
+        scores = self.scores(query)
+        if episode_ids is None:
+            matched = np.flatnonzero(scores)
+        else:
+            rows = self.partitions.rows_for(episode_ids)
+            matched = rows[scores[rows] > 0]
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k)[:k]]
+        ranked = matched[np.argsort(-scores[matched])]
+        return [
+            Document(id=self.ids[row], page_content=self.documents[row], metadata=dict(self.metadatas[row]))
+            for row in map(int, ranked)
+        ]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked Document lists; documents are matched on id (or text when unset)"""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
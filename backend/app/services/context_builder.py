@@ -0,0 +1,142 @@
+import os
+
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+LLM_TOTAL_TOKEN_BUDGET = int(os.getenv("LLM_TOTAL_TOKEN_BUDGET", "8192"))
+LLM_MAX_COMPLETION_TOKENS = int(os.getenv("LLM_MAX_COMPLETION_TOKENS", "4096"))
+LLM_MIN_COMPLETION_TOKENS = int(os.getenv("LLM_MIN_COMPLETION_TOKENS", "256"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1000"))
+# Chat format overhead per message and per reply (OpenAI cookbook figures for cl100k models)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+# Shortest shared edge treated as splitter overlap rather than coincidence
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 150
+# Don't bother appending a truncated chunk smaller than this
+MIN_PARTIAL_CHUNK_TOKENS = 50
+
+
+class _Block:
+    def __init__(self, text, rank, source=None, start=None):
+        self.text = text
+        self.rank = rank
+        self.source = source
+        self.start = start
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+
+def _edge_overlap(left, right):
+    """Length of the longest suffix of `left` that is a prefix of `right`"""
+    for size in range(min(MAX_OVERLAP_CHARS, len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+
+class ContextBuilder:
+    """Assembles retrieved chunks into a prompt context that fits a token budget.
+
+    Duplicate chunks are dropped, chunks from the same episode that overlap or
+    touch are merged (the splitter repeats 100 characters between neighbours),
+    and blocks are added in retrieval order until the budget is spent.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        context_budget=RAG_CONTEXT_TOKEN_BUDGET,
+        total_budget=LLM_TOTAL_TOKEN_BUDGET,
+        max_completion_tokens=LLM_MAX_COMPLETION_TOKENS,
+        min_completion_tokens=LLM_MIN_COMPLETION_TOKENS,
+        history_budget=HISTORY_TOKEN_BUDGET,
+    ):
+        self.tokenizer = tokenizer
+        self.context_budget = context_budget
+        self.total_budget = total_budget
+        self.max_completion_tokens = max_completion_tokens
+        self.min_completion_tokens = min_completion_tokens
+        self.history_budget = history_budget
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text))
+
+    def count_message_tokens(self, messages):
+        return sum(TOKENS_PER_MESSAGE + self.count_tokens(m["content"]) for m in messages) + TOKENS_PER_REPLY
+
+    def completion_tokens(self, messages):
+        """max_tokens for a request: what is left of the total budget, within [min, max]"""
+        remaining = self.total_budget - self.count_message_tokens(messages)
+        return max(self.min_completion_tokens, min(self.max_completion_tokens, remaining))
+
+    def history_window(self, history):
+        """The most recent messages that fit the history token budget, oldest first"""
+        window = []
+        remaining = self.history_budget
+        for message in reversed(history or []):
+            tokens = TOKENS_PER_MESSAGE + self.count_tokens(message["content"])
+            if tokens > remaining:
+                break
+            window.append({"role": message["role"], "content": message["content"]})
+            remaining -= tokens
+        return list(reversed(window))
+
+    def build(self, docs):
+        blocks = self._merge([
+            _Block(doc.page_content, rank, doc.metadata.get("source"), doc.metadata.get("start_index"))
+            for rank, doc in enumerate(docs)
+        ])
+        parts = []
+        remaining = self.context_budget
+        for block in sorted(blocks, key=lambda b: b.rank):
+            tokens = self.tokenizer.encode(block.text)
+            if len(tokens) > remaining:
+                if remaining >= MIN_PARTIAL_CHUNK_TOKENS:
+                    parts.append(self.tokenizer.decode(tokens[:remaining]))
+                break
+            parts.append(block.text)
+            remaining -= len(tokens)
+        return "\n\n".join(parts)
+
+    def _merge(self, blocks):
+        unique = []
+        seen = set()
+        for block in blocks:
+            if block.text not in seen:
+                seen.add(block.text)
+                unique.append(block)
+
+        # Chunks with known offsets: merge overlapping/touching spans per episode
+        positioned = sorted(
+            (b for b in unique if b.source is not None and b.start is not None),
+            key=lambda b: (b.source, b.start),
+        )
+        merged = []
+        for block in positioned:
+            previous = merged[-1] if merged else None
+            if previous is not None and previous.source == block.source and block.start <= previous.end:
+                previous.text += block.text[previous.end - block.start:]
+                previous.rank = min(previous.rank, block.rank)
+            else:
+                merged.append(block)
+
+        # Chunks without offsets (older index): merge on a shared suffix/prefix edge
+        loose = [b for b in unique if b.source is None or b.start is None]
+        changed = True
+        while changed:
+            changed = False
+            for left in loose:
+                for right in loose:
+                    if left is right:
+                        continue
+                    overlap = _edge_overlap(left.text, right.text)
+                    if overlap:
+                        left.text += right.text[overlap:]
+                        left.rank = min(left.rank, right.rank)
+                        loose.remove(right)
+                        changed = True
+                        break
+                if changed:
+                    break
+        return merged + loose
@@ -0,0 +1,133 @@
+import os
+import re
+import time
+from collections import OrderedDict
+
+from app.services.bm25_index import tokenize
+
+CONVERSATION_CACHE_USERS = int(os.getenv("CONVERSATION_CACHE_USERS", "10000"))
+# Reload from Firestore after this long, in case another worker served the user meanwhile
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", "900"))
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "50"))
+# heuristic | llm
+QUERY_REWRITE = os.getenv("QUERY_REWRITE", "heuristic")
+QUERY_REWRITE_TURNS = int(os.getenv("QUERY_REWRITE_TURNS", "3"))
+# A question that refers back only leans on the conversation if it names little of its own
+FOLLOW_UP_MAX_KEYWORDS = 4
+CONTEXT_KEYWORDS = 12
+# References to something said earlier: pronouns and phrases that continue the last turn
+# ("that" is left out; it is far more often a conjunction)
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|this|these|those|they|them|their|he|she|his|her|him|"
+    r"else|again|same|instead|what about|how about|and if)\b|^\s*(and|but|or|also|so)\b",
+    re.IGNORECASE,
+)
+# Words that say nothing about the topic of a question
+FILLER_WORDS = frozenset("andrew huberman dr say says said about tell recommend recommends think".split())
+# Words that ask something about a topic without naming one: "How long?", "What dose should I take?"
+GENERIC_WORDS = frozenset(
+    "why much many long often dose dosage amount take taking use using best good bad work works safe time "
+    "should would could more explain mean example examples me".split()
+)
+REWRITE_PROMPT = (
+    "Rewrite the user's last question as a standalone question about Andrew Huberman's teachings, "
+    "resolving references to the earlier conversation. Reply with the question only."
+)
+
+
+class ConversationStore:
+    """Per-user recent messages kept in memory, loaded from history once per TTL"""
+
+    def __init__(
+        self,
+        loader,
+        max_users=CONVERSATION_CACHE_USERS,
+        max_messages=CONVERSATION_MAX_MESSAGES,
+        ttl_seconds=CONVERSATION_TTL_SECONDS,
+    ):
+        self.loader = loader
+        self.max_users = max_users
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._conversations = OrderedDict()
+
+    async def get(self, user_id):
+        entry = self._conversations.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            self._conversations.move_to_end(user_id)
+            self.hits += 1
+            return list(entry[1])
+        self.misses += 1
+        messages = [{"role": m["role"], "content": m["content"]} for m in await self.loader(user_id)]
+        self._put(user_id, messages[-self.max_messages:])
+        return list(messages[-self.max_messages:])
+
+    def append(self, user_id, message):
+        entry = self._conversations.get(user_id)
+        if entry is None:
+            # Not loaded yet; the next get() reads it from history
+            return
+        entry[1].append({"role": message["role"], "content": message["content"]})
+        del entry[1][:-self.max_messages]
+
+    def stats(self):
+        return {"users": len(self._conversations), "hits": self.hits, "misses": self.misses}
+
+    def _put(self, user_id, messages):
+        self._conversations[user_id] = (time.monotonic(), messages)
+        self._conversations.move_to_end(user_id)
+        while len(self._conversations) > self.max_users:
+            self._conversations.popitem(last=False)
+
+
+def topic_words(question):
+    return [token for token in tokenize(question) if token not in FILLER_WORDS and token not in GENERIC_WORDS]
+
+
+def is_follow_up(question):
+    """True when the question cannot be understood without the conversation.
+
+    Either it names no topic at all (ellipsis: "Why?", "How much should I
+    take?"), or it refers back ("does it ...", "what about ...") while naming
+    only a few topic words of its own. Short standalone questions such as
+    "Cold exposure protocol" are not follow-ups.
+    """
+    topic = topic_words(question)
+    if not topic:
+        return True
+    return len(topic) <= FOLLOW_UP_MAX_KEYWORDS and bool(REFERENCE_PATTERN.search(question))
+
+
+def condense_query_heuristic(question, history, turns=QUERY_REWRITE_TURNS):
+    """Add keywords from the last few user turns to a follow-up question"""
+    if not history or not is_follow_up(question):
+        return question
+    previous_questions = [m["content"] for m in history if m["role"] == "user"][-turns:]
+    own = set(tokenize(question))
+    keywords = []
+    for text in reversed(previous_questions):
+        for token in tokenize(text):
+            if token not in own and token not in keywords and token not in FILLER_WORDS:
+                keywords.append(token)
+    if not keywords:
+        return question
+    return f"{question} ({' '.join(keywords[:CONTEXT_KEYWORDS])})"
+
+
+async def condense_query_llm(llm, question, history, turns=QUERY_REWRITE_TURNS):
+    """Ask the model for a standalone question; falls back to the heuristic on failure"""
+    if not history or not is_follow_up(question):
+        return question
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in history[-2 * turns:])
+    messages = [
+        {"role": "system", "content": REWRITE_PROMPT},
+        {"role": "user", "content": f"{transcript}\nuser: {question}"},
+    ]
+    try:
+        rewritten = (await llm.complete(messages, max_tokens=64)).strip()
+    except Exception as e:
+        print(f"Warning: query rewrite failed, using heuristic: {str(e)}")
+        return condense_query_heuristic(question, history, turns)
+    return rewritten or question
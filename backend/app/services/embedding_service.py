@@ -0,0 +1,159 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.utils.resilience import Hedge
+from app.utils.text import normalize_query
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+# Texts per embedding request when many queries are embedded at once (batch QA, evaluation)
+EMBEDDING_BULK_BATCH_SIZE = int(os.getenv("EMBEDDING_BULK_BATCH_SIZE", "256"))
+# A request still unanswered after this is sent again and the first reply wins; 0 disables hedging
+EMBEDDING_HEDGE_AFTER_MS = float(os.getenv("EMBEDDING_HEDGE_AFTER_MS", "400"))
+
+
+class CachedEmbeddings(Embeddings):
+    """Query-embedding layer with an exact-match LRU cache and an async micro-batcher.
+
+    Query vectors are kept as float32 numpy arrays. Concurrent `aembed_query`
+    calls arriving within EMBEDDING_BATCH_WINDOW_MS are sent to the wrapped
+    embeddings as a single `aembed_documents` request, hedged with a
+    duplicate request when the first is slow. Document embedding (ingestion)
+    is passed straight through.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        cache_size=EMBEDDING_CACHE_SIZE,
+        batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+        hedge_after_ms=EMBEDDING_HEDGE_AFTER_MS,
+    ):
+        self.base = base
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.hedge = Hedge(hedge_after_ms / 1000)
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._flush_handle = None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.base.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._cache_get(key)
+        if vector is None:
+            vector = self._cache_put(key, self.base.embed_query(key))
+        return vector.tolist()
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        key = normalize_query(text)
+        vector = self._cache_get(key)
+        if vector is not None:
+            return vector
+
+        # Join an identical request already waiting in the current batch
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            self._schedule_flush()
+        return await asyncio.shield(future)
+
+    async def aembed_queries(self, texts: List[str], batch_size=EMBEDDING_BULK_BATCH_SIZE) -> List[np.ndarray]:
+        """Embed many queries at once: cached and repeated ones are reused, the rest go out in groups"""
+        keys = [normalize_query(text) for text in texts]
+        vectors = {}
+        for key in dict.fromkeys(keys):
+            vector = self._cache_get(key)
+            if vector is not None:
+                vectors[key] = vector
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        groups = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        # Not hedged: large groups are routinely slower than a single query's request
+        embedded = await asyncio.gather(*(self.base.aembed_documents(group) for group in groups))
+        self.batches += len(groups)
+        self.batched_queries += len(missing)
+        for group, embeddings in zip(groups, embedded):
+            for key, embedding in zip(group, embeddings):
+                vectors[key] = self._cache_put(key, embedding)
+        return [vectors[key] for key in keys]
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "batches": self.batches,
+            "batched_queries": self.batched_queries,
+            **self.hedge.stats(),
+        }
+
+    async def _embed(self, texts):
+        # Embedding the same texts twice is harmless, so a slow request can be raced
+        return await self.hedge.run(lambda: self.base.aembed_documents(texts))
+
+    def _cache_get(self, key):
+        vector = self._cache.get(key)
+        if vector is None:
+            self.misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return vector
+
+    def _cache_put(self, key, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return vector
+
+    def _schedule_flush(self):
+        loop = asyncio.get_running_loop()
+        if len(self._pending) >= self.max_batch_size:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush_handle = None
+            loop.create_task(self._flush())
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.batch_window, lambda: loop.create_task(self._flush())
+            )
+
+    async def _flush(self):
+        self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        keys = list(batch)
+        self.batches += 1
+        self.batched_queries += len(keys)
+        try:
+            embeddings = await self._embed(keys)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, embedding in zip(keys, embeddings):
+            vector = self._cache_put(key, embedding)
+            if not batch[key].done():
+                batch[key].set_result(vector)
@@ -0,0 +1,111 @@
+import json
+import os
+import re
+
+# Optional per-episode details, keyed by transcript filename:
+# {"<file>.txt": {"episode_id": "84", "title": "...", "guest": "Dr. Matthew Walker", "date": "2022-08-15"}}
+EPISODE_CATALOG_FILE = "episodes.json"
+EPISODE_NUMBER_PATTERN = re.compile(r"#\s*(\d+)")
+# "Dr. Jane Doe: Topic" or "Topic | Dr. Jane Doe" style titles
+GUEST_PATTERNS = (
+    re.compile(r"^((?:Dr\.?|Prof\.?)\s+[^:|_]+?)\s*[:|_]"),
+    re.compile(r"\b(?:with|ft\.?|featuring)\s+((?:Dr\.?\s+)?[A-Z][\w.'-]*(?:\s+[A-Z][\w.'-]*){1,3})"),
+)
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def load_episode_details(data_folder):
+    path = os.path.join(data_folder, EPISODE_CATALOG_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def episode_metadata(filename, details=None):
+    """Episode id, title, guest and date for a transcript; details override what the filename gives.
+
+    Values are strings, "" when unknown, because Chroma metadata cannot be None.
+    """
+    details = details or {}
+    title = details.get("title") or os.path.splitext(filename)[0]
+    number = EPISODE_NUMBER_PATTERN.search(title)
+    guest = details.get("guest")
+    if guest is None:
+        guest = next((m.group(1).strip() for m in (p.search(title) for p in GUEST_PATTERNS) if m), "")
+    date = details.get("date") or ""
+    if date and not DATE_PATTERN.match(date):
+        raise ValueError(f"{filename}: date must be YYYY-MM-DD, got {date!r}")
+    return {
+        "episode_id": str(details.get("episode_id") or (number.group(1) if number else os.path.splitext(filename)[0])),
+        "title": title,
+        "guest": guest,
+        "date": date,
+    }
+
+
+class EpisodeCatalog:
+    """Episode id -> title, guest and date; resolves request filters to episode ids"""
+
+    def __init__(self, episodes):
+        self.episodes = episodes
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls({})
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.episodes, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def match(self, filters):
+        """Episode ids allowed by the filters, or None when nothing is filtered"""
+        if filters is None:
+            return None
+        episode_ids = getattr(filters, "episode_ids", None)
+        guests = getattr(filters, "guests", None)
+        date_from = getattr(filters, "date_from", None)
+        date_to = getattr(filters, "date_to", None)
+        if not (episode_ids or guests or date_from or date_to):
+            return None
+        if not (guests or date_from or date_to):
+            # Ids alone need no catalog lookup
+            return list(episode_ids)
+        guests = [guest.lower() for guest in guests or []]
+        matched = []
+        for episode_id, episode in self.episodes.items():
+            if episode_ids and episode_id not in episode_ids:
+                continue
+            if guests and not any(guest in episode.get("guest", "").lower() for guest in guests):
+                continue
+            date = episode.get("date", "")
+            if (date_from or date_to) and not date:
+                continue
+            if date_from and date < date_from.isoformat():
+                continue
+            if date_to and date > date_to.isoformat():
+                continue
+            matched.append(episode_id)
+        return matched
+
+
+def cite_sources(docs):
+    """One citation per episode, in the order its first chunk was retrieved"""
+    sources = {}
+    for doc in docs:
+        metadata = doc.metadata or {}
+        episode_id = metadata.get("episode_id") or metadata.get("source")
+        if episode_id and episode_id not in sources:
+            sources[episode_id] = {
+                "episode_id": episode_id,
+                "title": metadata.get("title") or metadata.get("source", ""),
+                "guest": metadata.get("guest", ""),
+                "date": metadata.get("date", ""),
+            }
+    return list(sources.values())
@@ -1,69 +1,217 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
+import httpx
 import firebase_admin
-from firebase_admin import credentials, firestore, auth
-import pyrebase
+from firebase_admin import credentials, firestore, firestore_async, auth
+from google.api_core import exceptions as google_exceptions
 from config import firebase_config
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from app.services.google_auth import FirebaseTokenVerifier
+from app.utils.concurrency import run_blocking
+from app.utils.metrics import stage_timer
+from app.utils.resilience import Upstream
+from app.utils.token_cache import TokenCache
 
 load_dotenv()
 
-# Initialize Firebase with Pyrebase (for auth)
-firebase = pyrebase.initialize_app(firebase_config)
-pyrebase_auth = firebase.auth()
 
-# Initialize Firebase Admin SDK (for Firestore)
-try:
-    app = firebase_admin.get_app()
-except ValueError:
-    # Path to your service account key JSON file
-    cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS"))
-    app = firebase_admin.initialize_app(cred)
+@lru_cache(maxsize=None)
+def firebase_clients():
+    """Async Firestore client and project id, created on first use so importing needs no credentials"""
+    # Initialize Firebase Admin SDK (for Firestore)
+    try:
+        app = firebase_admin.get_app()
+    except ValueError:
+        # Path to your service account key JSON file
+        cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS"))
+        app = firebase_admin.initialize_app(cred)
 
-# Get Firestore client
-db = firestore.client()
+    return firestore_async.client(), app.project_id or firebase_config.get("projectId")
+
+# Email/password auth goes to the Identity Toolkit REST API (what Pyrebase wraps) over one pooled async client
+IDENTITY_TOOLKIT_URL = "https://identitytoolkit.googleapis.com/v1/accounts"
+FIREBASE_AUTH_TIMEOUT_SECONDS = float(os.getenv("FIREBASE_AUTH_TIMEOUT_SECONDS", "10"))
+FIREBASE_AUTH_MAX_CONNECTIONS = int(os.getenv("FIREBASE_AUTH_MAX_CONNECTIONS", "50"))
+ID_TOKEN_CACHE_SIZE = int(os.getenv("ID_TOKEN_CACHE_SIZE", "10000"))
+ID_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("ID_TOKEN_CACHE_TTL_SECONDS", "300"))
+
+# firebase_admin.auth is a blocking client, so without a project id verification runs on a bounded pool
+AUTH_WORKERS = int(os.getenv("FIREBASE_AUTH_WORKERS", "4"))
+auth_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="firebase-auth")
+
+# Messages live in history/{user_id}/messages, one document each, ordered by "seq"
+HISTORY_PAGE_SIZE = 50
+FIRESTORE_BATCH_LIMIT = 500
+# Per Firestore round trip; writes use fixed document ids, so retrying them is safe
+FIRESTORE_DEADLINE_SECONDS = float(os.getenv("FIRESTORE_DEADLINE_SECONDS", "2"))
+FIRESTORE_RETRIES = int(os.getenv("FIRESTORE_RETRIES", "2"))
+# Firestore refused the request itself (too large, not allowed); retrying cannot help
+FIRESTORE_CLIENT_ERRORS = (
+    google_exceptions.InvalidArgument,
+    google_exceptions.PermissionDenied,
+    google_exceptions.FailedPrecondition,
+)
 
 class FirebaseService:
     def __init__(self):
-        self.db = db
-        self.auth = pyrebase_auth
+        self.db, project_id = firebase_clients()
+        self.api_key = firebase_config["apiKey"]
+        self.http = httpx.AsyncClient(
+            timeout=FIREBASE_AUTH_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=FIREBASE_AUTH_MAX_CONNECTIONS,
+                max_keepalive_connections=FIREBASE_AUTH_MAX_CONNECTIONS,
+            ),
+        )
         self.admin_auth = auth
+        # Local signature checks against cached Google certs; the Admin SDK is the fallback
+        self.token_verifier = FirebaseTokenVerifier(project_id, self.http) if project_id else None
+        self.id_token_cache = TokenCache(ID_TOKEN_CACHE_SIZE, ID_TOKEN_CACHE_TTL_SECONDS)
+        self._migrated_users = set()
+        self.firestore = Upstream(
+            "firestore", FIRESTORE_DEADLINE_SECONDS, FIRESTORE_RETRIES, client_errors=FIRESTORE_CLIENT_ERRORS
+        )
 
-    def create_user(self, email, password):
-        return self.auth.create_user_with_email_and_password(email, password)
+    async def _identity_toolkit(self, method, email, password):
+        response = await self.http.post(
+            f"{IDENTITY_TOOLKIT_URL}:{method}",
+            params={"key": self.api_key},
+            json={"email": email, "password": password, "returnSecureToken": True},
+        )
+        if response.status_code != 200:
+            try:
+                message = response.json()["error"]["message"]
+            except Exception:
+                message = response.text
+            # e.g. EMAIL_EXISTS or INVALID_LOGIN_CREDENTIALS, as Pyrebase reported them
+            raise ValueError(message)
+        return response.json()
+
+    async def create_user(self, email, password):
+        with stage_timer("firebase_signup"):
+            return await self._identity_toolkit("signUp", email, password)
     
-    def login_user(self, email, password):
-        return self.auth.sign_in_with_email_and_password(email, password)
+    async def login_user(self, email, password):
+        with stage_timer("firebase_login"):
+            return await self._identity_toolkit("signInWithPassword", email, password)
     
-    def verify_token(self, id_token):
+    async def verify_token(self, id_token):
         """Verify Firebase ID token"""
-        try:
-            decoded_token = self.admin_auth.verify_id_token(id_token)
+        decoded_token = self.id_token_cache.get(id_token)
+        if decoded_token is not None:
             return decoded_token
+        with stage_timer("firebase_verify_token"):
+            if self.token_verifier is not None:
+                decoded_token = await self.token_verifier.verify(id_token)
+            else:
+                decoded_token = await run_blocking(auth_executor, self.admin_auth.verify_id_token, id_token)
+        self.id_token_cache.put(id_token, decoded_token)
+        return decoded_token
+
+    async def prefetch_certs(self):
+        """Load Google's signing certs ahead of the first Google login"""
+        if self.token_verifier is None:
+            return
+        try:
+            await self.token_verifier.refresh()
         except Exception as e:
-            raise e
-    
-    def get_chat_history(self, user_id) -> List[Dict[str, str]]:
-        """Get chat history for a user with validated message format"""
-        chat_history = self.db.collection("history").document(user_id).get()
-        if chat_history.exists:
-            messages = chat_history.to_dict().get("messages", [])
-            # Validate each message has the required fields
-            return self._validate_messages(messages)
-        return []
+            print(f"Warning: could not prefetch Google certificates: {str(e)}")
+
+    async def close(self):
+        await self.http.aclose()
     
-    def save_message(self, user_id, message) -> List[Dict[str, str]]:
-        """Save a message to chat history"""
+    def _messages_ref(self, user_id):
+        return self.db.collection("history").document(user_id).collection("messages")
+
+    async def get_chat_history(
+        self, user_id, limit=HISTORY_PAGE_SIZE, cursor: Optional[int] = None
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Get one page of chat history, oldest first, and the cursor for the page before it"""
+        await self.migrate_legacy_history(user_id)
+        query = self._messages_ref(user_id).order_by("seq", direction="DESCENDING")
+        if cursor is not None:
+            query = query.start_after({"seq": cursor})
+        async def read_page():
+            return [doc.to_dict() async for doc in query.limit(limit).stream()]
+
+        with stage_timer("firestore_history_read"):
+            docs = await self.firestore.call(read_page)
+        next_cursor = str(docs[-1]["seq"]) if len(docs) == limit else None
+        messages = [
+            {"role": doc.get("role"), "content": doc.get("content"), "seq": doc.get("seq")}
+            for doc in reversed(docs)
+        ]
+        return self._validate_messages(messages), next_cursor
+
+    async def save_message(self, user_id, message):
+        """Append a message to chat history"""
+        await self.save_messages(user_id, [message])
+
+    async def save_messages(self, user_id, messages):
+        """Append messages to one user's chat history"""
+        await self.save_many({user_id: messages})
+
+    async def save_many(self, messages_by_user):
+        """Append messages for any number of users using batched writes.
+
+        Cost does not grow with history length. A message may carry its own
+        "seq" (e.g. its enqueue time) to keep ordering when written later.
+        """
         # Validate message format
-        if not self._is_valid_message(message):
-            raise ValueError("Invalid message format. Must have 'role' and 'content' fields")
-            
+        for messages in messages_by_user.values():
+            for message in messages:
+                if not self._is_valid_message(message):
+                    raise ValueError("Invalid message format. Must have 'role' and 'content' fields")
+
+        writes = []
+        base_seq = time.time_ns()
+        for user_id, messages in messages_by_user.items():
+            await self.migrate_legacy_history(user_id)
+            messages_ref = self._messages_ref(user_id)
+            for offset, message in enumerate(messages):
+                seq = message.get("seq", base_seq + offset)
+                writes.append((messages_ref.document(f"{seq:020d}"), {
+                    "role": message["role"],
+                    "content": message["content"],
+                    "seq": seq,
+                    "created_at": firestore.SERVER_TIMESTAMP,
+                }))
+        with stage_timer("firestore_write", messages=len(writes)):
+            for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+                batch = self.db.batch()
+                for ref, data in writes[start:start + FIRESTORE_BATCH_LIMIT]:
+                    batch.set(ref, data)
+                await self.firestore.call(batch.commit)
+
+    async def migrate_legacy_history(self, user_id):
+        """Move a pre-subcollection `messages` array into the messages subcollection.
+
+        Legacy messages get small sequence numbers so they sort before anything
+        written since, and deterministic ids so an interrupted run can be repeated.
+        """
+        if user_id in self._migrated_users:
+            return
         chat_ref = self.db.collection("history").document(user_id)
-        chat_history = self.get_chat_history(user_id)
-        chat_history.append(message)
-        chat_ref.set({"messages": chat_history})
-        return chat_history
-    
+        snapshot = await self.firestore.call(chat_ref.get)
+        legacy_messages = (snapshot.to_dict() or {}).get("messages") if snapshot.exists else None
+        if legacy_messages:
+            messages_ref = self._messages_ref(user_id)
+            valid_messages = self._validate_messages(legacy_messages)
+            for start in range(0, len(valid_messages), FIRESTORE_BATCH_LIMIT):
+                batch = self.db.batch()
+                for seq, message in enumerate(valid_messages[start:start + FIRESTORE_BATCH_LIMIT], start):
+                    batch.set(messages_ref.document(f"{seq:020d}"), {
+                        "role": message["role"],
+                        "content": message["content"],
+                        "seq": seq,
+                    })
+                await self.firestore.call(batch.commit)
+            await self.firestore.call(lambda: chat_ref.update({"messages": firestore.DELETE_FIELD}))
+        self._migrated_users.add(user_id)
+
     def _is_valid_message(self, message) -> bool:
         """Check if a message has valid format"""
         if not isinstance(message, dict):
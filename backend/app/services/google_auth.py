@@ -0,0 +1,82 @@
+import asyncio
+import re
+import time
+
+from jose import jwt
+
+# X.509 certificates Firebase signs ID tokens with, rotated every few hours
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+# Refresh this long before the published max-age runs out, in the background
+CERTS_REFRESH_MARGIN_SECONDS = 300
+DEFAULT_CERTS_MAX_AGE_SECONDS = 3600
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class FirebaseTokenVerifier:
+    """Verifies Firebase ID tokens locally against cached Google public certificates.
+
+    Certificates are fetched with a pooled async client, kept for the
+    Cache-Control max-age and refreshed in the background shortly before they
+    expire, so verification is normally a signature check with no I/O. An
+    unknown key id triggers one refresh, for certificates rotated early.
+    Checks follow the Firebase Admin SDK: RS256, audience, issuer, sub and
+    auth_time.
+    """
+
+    def __init__(self, project_id, http_client):
+        self.project_id = project_id
+        self.http_client = http_client
+        self.certs = {}
+        self.expires_at = 0.0
+        self.refreshes = 0
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task = None
+
+    async def refresh(self):
+        async with self._refresh_lock:
+            response = await self.http_client.get(FIREBASE_CERTS_URL)
+            response.raise_for_status()
+            match = MAX_AGE_PATTERN.search(response.headers.get("cache-control", ""))
+            max_age = int(match.group(1)) if match else DEFAULT_CERTS_MAX_AGE_SECONDS
+            self.certs = response.json()
+            self.expires_at = time.time() + max_age
+            self.refreshes += 1
+
+    async def _cert(self, kid):
+        now = time.time()
+        if now >= self.expires_at or kid not in self.certs:
+            await self.refresh()
+        elif now >= self.expires_at - CERTS_REFRESH_MARGIN_SECONDS and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+        if kid not in self.certs:
+            raise ValueError("ID token signed with an unknown key")
+        return self.certs[kid]
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Warning: could not refresh Google certificates: {str(e)}")
+        finally:
+            self._refresh_task = None
+
+    async def verify(self, id_token):
+        """Decoded claims with "uid" set, or an exception if the token is not valid"""
+        header = jwt.get_unverified_header(id_token)
+        if header.get("alg") != "RS256":
+            raise ValueError("ID token must be signed with RS256")
+        cert = await self._cert(header.get("kid"))
+        claims = jwt.decode(
+            id_token,
+            cert,
+            algorithms=["RS256"],
+            audience=self.project_id,
+            issuer=f"https://securetoken.google.com/{self.project_id}",
+            options={"verify_at_hash": False},
+        )
+        if not isinstance(claims.get("sub"), str) or not claims["sub"] or len(claims["sub"]) > 128:
+            raise ValueError("ID token has an invalid subject")
+        if claims.get("auth_time", 0) > time.time() + 60:
+            raise ValueError("ID token has an auth_time in the future")
+        claims["uid"] = claims["sub"]
+        return claims
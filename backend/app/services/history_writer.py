@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+
+from app.services.firebase_service import FIRESTORE_CLIENT_ERRORS
+
+HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "200"))
+HISTORY_MAX_BACKOFF_SECONDS = float(os.getenv("HISTORY_MAX_BACKOFF_SECONDS", "30"))
+# Empty disables the write-ahead log; queued messages are then lost if the process dies
+HISTORY_WAL_PATH = os.getenv("HISTORY_WAL_PATH", "")
+HISTORY_WAL_FSYNC = os.getenv("HISTORY_WAL_FSYNC", "true").lower() == "true"
+HISTORY_STOP_TIMEOUT_SECONDS = 10
+# While Firestore is down messages wait here; past this many, new ones are not persisted at all
+HISTORY_MAX_QUEUE = int(os.getenv("HISTORY_MAX_QUEUE", "10000"))
+# Well under Firestore's 1 MiB document limit; longer messages are not persisted
+HISTORY_MAX_MESSAGE_BYTES = int(os.getenv("HISTORY_MAX_MESSAGE_BYTES", str(512 * 1024)))
+# Errors no retry can fix; the messages that cause them are dropped instead of blocking the queue
+PERMANENT_ERRORS = (ValueError, *FIRESTORE_CLIENT_ERRORS)
+
+
+def worker_wal_path(path):
+    """Workers started by serve.py each keep their own log; a replacement worker replays its predecessor's"""
+    worker_id = os.getenv("SERVE_WORKER_ID")
+    return f"{path}.{worker_id}" if path and worker_id else path
+
+
+class WriteAheadLog:
+    """JSON-lines log of queued messages, written by its own thread so the event loop never waits on the disk.
+
+    append() and rewrite() return at once. The thread writes everything that
+    has accumulated since its last pass and flushes (and fsyncs) once for the
+    whole group, so a burst of messages costs one fsync. A message is durable
+    once the group it landed in is committed, not when enqueue returns.
+    """
+
+    def __init__(self, path, fsync=HISTORY_WAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self.commits = 0
+        self.errors = 0
+        self._ops = queue.SimpleQueue()
+        self._file = open(path, "a")
+        self._thread = threading.Thread(target=self._run, name="history-wal", daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        self._ops.put(("append", record))
+
+    def rewrite(self, records):
+        """Replace the log with these records (everything still queued), once earlier appends are written"""
+        self._ops.put(("rewrite", records))
+
+    def close(self):
+        """Write what is outstanding and stop the thread; blocks, so call it off the event loop"""
+        self._ops.put(("close", None))
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            ops = [self._ops.get()]
+            while True:
+                try:
+                    ops.append(self._ops.get_nowait())
+                except queue.Empty:
+                    break
+            dirty = False
+            for kind, payload in ops:
+                try:
+                    if kind == "append":
+                        self._file.write(json.dumps(payload) + "\n")
+                        dirty = True
+                    elif kind == "rewrite":
+                        # The records include every message appended before the rewrite was requested
+                        self._rewrite(payload)
+                        dirty = False
+                    else:
+                        if dirty:
+                            self._commit()
+                        self._file.close()
+                        return
+                except OSError as e:
+                    self.errors += 1
+                    print(f"Warning: chat history WAL write failed: {str(e)}")
+            if dirty:
+                try:
+                    self._commit()
+                except OSError as e:
+                    self.errors += 1
+                    print(f"Warning: chat history WAL write failed: {str(e)}")
+
+    def _commit(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.commits += 1
+
+    def _rewrite(self, records):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._file.close()
+        self._file = open(self.path, "a")
+
+
+class HistoryWriteQueue:
+    """Write-behind persistence for chat messages.
+
+    `enqueue` returns immediately; a background task coalesces queued messages
+    per user and writes them with FirebaseService.save_many, retrying with
+    jittered exponential backoff. With a WAL path, messages are also appended
+    to a local log (see WriteAheadLog) and replayed on the next start. If
+    Firestore stays down until max_queue messages are waiting, further
+    messages are dropped rather than held in memory without bound.
+
+    Only transient failures are retried. When Firestore rejects a flush
+    outright (PERMANENT_ERRORS), the batch is split until the rejected
+    messages are found; those are dropped and counted, the rest are written.
+    """
+
+    def __init__(
+        self,
+        firebase_service,
+        flush_interval_ms=HISTORY_FLUSH_INTERVAL_MS,
+        wal_path=HISTORY_WAL_PATH,
+        wal_fsync=HISTORY_WAL_FSYNC,
+        max_backoff=HISTORY_MAX_BACKOFF_SECONDS,
+        max_queue=HISTORY_MAX_QUEUE,
+        max_message_bytes=HISTORY_MAX_MESSAGE_BYTES,
+    ):
+        self.firebase_service = firebase_service
+        self.flush_interval = flush_interval_ms / 1000
+        self.wal_path = worker_wal_path(wal_path) or None
+        self.wal_fsync = wal_fsync
+        self.max_backoff = max_backoff
+        self.max_queue = max_queue
+        self.max_message_bytes = max_message_bytes
+        self._pending = defaultdict(list)
+        self._inflight = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._wal = None
+        self._dropping = False
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.failures = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    async def start(self):
+        if self.wal_path:
+            self._replay_wal()
+            self._wal = WriteAheadLog(self.wal_path, self.wal_fsync)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything still queued, giving up after a timeout (the WAL keeps the rest)"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, HISTORY_STOP_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                print(f"Warning: {self.depth} chat message(s) were not persisted before shutdown")
+            self._task = None
+        if self._wal is not None:
+            await asyncio.to_thread(self._wal.close)
+            self._wal = None
+
+    def enqueue(self, user_id, message):
+        """Queue a message for persistence and return without waiting for Firestore.
+
+        False when the message will not be persisted: the queue is full, or the
+        message is too large for a Firestore document.
+        """
+        if not self.firebase_service._is_valid_message(message):
+            raise ValueError("Invalid message format. Must have 'role' and 'content' fields")
+        if len(message["content"].encode()) > self.max_message_bytes:
+            print(f"Warning: not persisting a chat message over {self.max_message_bytes} bytes for {user_id}")
+            self.rejected += 1
+            return False
+        if self.depth >= self.max_queue:
+            if not self._dropping:
+                print(f"Warning: chat history queue is full ({self.max_queue}), new messages are not persisted")
+            self._dropping = True
+            self.dropped += 1
+            return False
+        self._dropping = False
+        queued = {"role": message["role"], "content": message["content"], "seq": time.time_ns()}
+        if self._wal is not None:
+            self._wal.append({"user_id": user_id, "message": queued})
+        self._pending[user_id].append(queued)
+        self._wakeup.set()
+        return True
+
+    def unsaved_messages(self, user_id):
+        """Messages for a user that are queued or being written"""
+        return list(self._inflight.get(user_id, [])) + list(self._pending.get(user_id, []))
+
+    async def recent_history(self, user_id):
+        """The latest history page including messages not yet written"""
+        unsaved = self.unsaved_messages(user_id)
+        saved, _ = await self.firebase_service.get_chat_history(user_id)
+        # A flush may land between the two reads, so de-duplicate on seq
+        by_seq = {message["seq"]: message for message in saved + unsaved}
+        return [by_seq[seq] for seq in sorted(by_seq)]
+
+    @property
+    def depth(self):
+        return sum(len(messages) for messages in self._pending.values())
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth,
+            "inflight": sum(len(messages) for messages in self._inflight.values()),
+            "flushes": self.flushes,
+            "flushed_messages": self.flushed_messages,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "wal_commits": self._wal.commits if self._wal is not None else 0,
+            "wal_errors": self._wal.errors if self._wal is not None else 0,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+        }
+
+    async def _run(self):
+        while not self._stopping:
+            await self._wakeup.wait()
+            if not self._stopping:
+                # Let messages that arrive close together coalesce into one flush
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self._flush_with_retry()
+
+    async def _flush_with_retry(self):
+        attempt = 0
+        while not await self._flush():
+            attempt += 1
+            delay = min(self.max_backoff, 0.1 * 2 ** attempt)
+            await asyncio.sleep(delay * (0.5 + random.random()))
+
+    async def _flush(self):
+        if not self._pending:
+            return True
+        self._inflight, self._pending = self._pending, defaultdict(list)
+        start = time.perf_counter()
+        rejected_before = self.rejected
+        try:
+            await self._save(self._inflight)
+        except Exception as e:
+            print(f"Warning: Could not persist chat history, will retry: {str(e)}")
+            self.failures += 1
+            # Put the batch back in front of anything queued meanwhile
+            for user_id, messages in self._inflight.items():
+                self._pending[user_id] = messages + self._pending.get(user_id, [])
+            self._inflight = {}
+            return False
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.flushed_messages += (
+            sum(len(messages) for messages in self._inflight.values()) - (self.rejected - rejected_before)
+        )
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+        self._inflight = {}
+        self._compact_wal()
+        return True
+
+    async def _save(self, messages_by_user):
+        """save_many, splitting the batch in halves when Firestore rejects it to drop only the
+        messages it rejects on their own. Transient errors propagate so the caller retries."""
+        try:
+            await self.firebase_service.save_many(messages_by_user)
+            return
+        except PERMANENT_ERRORS as e:
+            error = e
+        items = [(user_id, message) for user_id, messages in messages_by_user.items() for message in messages]
+        if len(items) == 1:
+            self.rejected += 1
+            print(f"Warning: dropping a chat message for {items[0][0]} that Firestore rejected: "
+                  f"{str(error) or type(error).__name__}")
+            return
+        middle = len(items) // 2
+        for half in (items[:middle], items[middle:]):
+            grouped = defaultdict(list)
+            for user_id, message in half:
+                grouped[user_id].append(message)
+            # Messages carry their seq, so anything written before a later failure is just overwritten on retry
+            await self._save(grouped)
+
+    def _replay_wal(self):
+        if not os.path.exists(self.wal_path):
+            return
+        with open(self.wal_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a truncated last line
+                    continue
+                self._pending[record["user_id"]].append(record["message"])
+        if self._pending:
+            print(f"Replaying {self.depth} unsaved chat message(s) from {self.wal_path}")
+            self._wakeup.set()
+
+    def _compact_wal(self):
+        """Have the log rewritten so it only holds messages still queued"""
+        if self._wal is None:
+            return
+        self._wal.rewrite([
+            {"user_id": user_id, "message": message}
+            for user_id, messages in self._pending.items()
+            for message in messages
+        ])
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import chromadb
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from openai import AsyncOpenAI, RateLimitError, APITimeoutError, APIConnectionError
+
+from app.services.answer_store import ANSWER_STORE_PATH, invalidate_answers
+from app.services.bm25_index import BM25Index
+from app.services.episodes import EPISODE_CATALOG_FILE, EpisodeCatalog, episode_metadata, load_episode_details
+from app.services.vector_index import CHROMA_PAGE_SIZE
+
+DATA_FOLDER = "../data"
+PATH_TO_DB = "../db/chroma"
+COLLECTION_NAME = "huberman_lab"
+MANIFEST_PATH = "../db/ingest_manifest.json"
+PATH_TO_BM25 = "../db/bm25"
+EPISODE_CATALOG_PATH = "../db/episodes.json"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = 8
+# Files chunked or embedding at once per chunking process; bounds the chunk lists held in memory
+FILES_PER_WORKER = 2
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_file(path):
+    """Split one transcript into chunks; runs in a worker process"""
+    with open(path, "r") as f:
+        text = f.read()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    documents = splitter.create_documents([text])
+    return [(doc.page_content, doc.metadata["start_index"]) for doc in documents]
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class IngestionPipeline:
+    """Incremental indexer: only files whose content hash changed are re-chunked and re-embedded"""
+
+    def __init__(
+        self,
+        data_folder=DATA_FOLDER,
+        db_path=PATH_TO_DB,
+        manifest_path=MANIFEST_PATH,
+        bm25_path=PATH_TO_BM25,
+        catalog_path=EPISODE_CATALOG_PATH,
+        answer_store_path=ANSWER_STORE_PATH,
+        workers=None,
+        batch_size=EMBED_BATCH_SIZE,
+        concurrency=EMBED_CONCURRENCY,
+    ):
+        self.data_folder = data_folder
+        self.manifest_path = manifest_path
+        self.bm25_path = bm25_path
+        self.catalog_path = catalog_path
+        self.answer_store_path = answer_store_path
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.collection = chromadb.PersistentClient(path=db_path).get_or_create_collection(COLLECTION_NAME)
+        self.client = AsyncOpenAI()
+        self.embed_semaphore = asyncio.Semaphore(concurrency)
+        self.write_lock = asyncio.Lock()
+        self.manifest = load_manifest(manifest_path)
+        self.episode_details = load_episode_details(data_folder)
+
+    def episode(self, filename):
+        return episode_metadata(filename, self.episode_details.get(filename))
+
+    def changed_files(self):
+        """Stream (filename, path, sha256) for files that are new or modified"""
+        with os.scandir(self.data_folder) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if not entry.is_file() or entry.name == EPISODE_CATALOG_FILE:
+                    continue
+                digest = file_sha256(entry.path)
+                if self.manifest.get(entry.name, {}).get("sha256") != digest:
+                    yield entry.name, entry.path, digest
+
+    async def embed_batch(self, texts):
+        """Embed one batch, backing off on rate limits (honouring Retry-After when sent)"""
+        for attempt in range(EMBED_MAX_RETRIES):
+            try:
+                async with self.embed_semaphore:
+                    response = await self.client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except (RateLimitError, APITimeoutError, APIConnectionError) as e:
+                if attempt == EMBED_MAX_RETRIES - 1:
+                    raise
+                retry_after = None
+                response = getattr(e, "response", None)
+                if response is not None and response.headers.get("retry-after"):
+                    retry_after = float(response.headers["retry-after"])
+                await asyncio.sleep(retry_after or min(60, 2 ** attempt) * (0.5 + random.random()))
+
+    async def index_file(self, filename, digest, chunks):
+        texts = [text for text, _ in chunks]
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        embedded = await asyncio.gather(*(self.embed_batch(batch) for batch in batches))
+        embeddings = [vector for batch in embedded for vector in batch]
+
+        ids = [f"{filename}-{i:05d}" for i in range(len(chunks))]
+        episode = self.episode(filename)
+        metadatas = [
+            {
+                "source": filename,
+                "chunk_index": i,
+                "start_index": start,
+                "end_index": start + len(text),
+                **episode,
+            }
+            for i, (text, start) in enumerate(chunks)
+        ]
+        async with self.write_lock:
+            await asyncio.to_thread(self._replace_chunks, filename, ids, embeddings, texts, metadatas)
+            self.manifest[filename] = {"sha256": digest, "chunks": len(chunks), "episode": episode}
+            save_manifest(self.manifest, self.manifest_path)
+            await asyncio.to_thread(self.invalidate_answers, [filename])
+        print(f"Indexed {filename}: {len(chunks)} chunks")
+
+    def _replace_chunks(self, filename, ids, embeddings, texts, metadatas):
+        self.collection.delete(where={"source": filename})
+        max_batch = self.collection._client.get_max_batch_size()
+        for start in range(0, len(ids), max_batch):
+            end = start + max_batch
+            self.collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=texts[start:end],
+                metadatas=metadatas[start:end],
+            )
+
+    def update_episode_metadata(self, skip=()):
+        """Rewrite episode fields in place for unchanged files whose details changed; no re-embedding"""
+        updated = []
+        for filename, entry in self.manifest.items():
+            episode = self.episode(filename)
+            if filename in skip or entry.get("episode") == episode:
+                continue
+            existing = self.collection.get(where={"source": filename}, include=["metadatas"])
+            if existing["ids"]:
+                self.collection.update(
+                    ids=existing["ids"],
+                    metadatas=[{**metadata, **episode} for metadata in existing["metadatas"]],
+                )
+            entry["episode"] = episode
+            updated.append(filename)
+            print(f"Updated episode details for {filename}")
+        if updated:
+            save_manifest(self.manifest, self.manifest_path)
+            # Precomputed answers carry the old titles and guests in their citations
+            self.invalidate_answers(updated)
+        return len(updated)
+
+    def save_catalog(self):
+        episodes = {entry["episode"]["episode_id"]: entry["episode"] for entry in self.manifest.values()
+                    if "episode" in entry}
+        EpisodeCatalog(episodes).save(self.catalog_path)
+
+    def prune_deleted(self):
+        present = set(os.listdir(self.data_folder)) - {EPISODE_CATALOG_FILE}
+        removed = [name for name in self.manifest if name not in present]
+        for filename in removed:
+            self.collection.delete(where={"source": filename})
+            del self.manifest[filename]
+            print(f"Removed {filename}")
+        save_manifest(self.manifest, self.manifest_path)
+        self.invalidate_answers(removed)
+
+    def purge_legacy_chunks(self):
+        """Delete chunks without a source, i.e. from collections built by notebooks/indexing_data.ipynb.
+
+        Those chunks have random ids and no metadata, so re-indexing their file
+        neither replaces them nor lets --prune find them; left in place they
+        duplicate the corpus. Chroma cannot filter on a missing key, so the
+        metadata is scanned page by page (no documents or embeddings are read).
+        """
+        legacy, offset = [], 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=CHROMA_PAGE_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            legacy.extend(chunk_id for chunk_id, metadata in zip(page["ids"], page["metadatas"])
+                          if not (metadata or {}).get("source"))
+            offset += len(page["ids"])
+        max_batch = self.collection._client.get_max_batch_size()
+        for start in range(0, len(legacy), max_batch):
+            self.collection.delete(ids=legacy[start:start + max_batch])
+        if legacy:
+            print(f"Removed {len(legacy)} chunk(s) without a source, left by the indexing notebook")
+        return len(legacy)
+
+    def invalidate_answers(self, filenames):
+        """Drop precomputed answers citing chunks of these files; precompute_answers.py rebuilds them"""
+        invalidated = invalidate_answers(filenames, self.answer_store_path)
+        if invalidated:
+            print(f"Invalidated {invalidated} precomputed answer(s) citing {', '.join(filenames)}")
+
+    async def run(self, prune=False):
+        loop = asyncio.get_running_loop()
+
+        changed = []
+        pending = self.changed_files()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            async def worker():
+                # Each worker takes the next changed file only when it has finished its last one
+                for filename, path, digest in pending:
+                    changed.append(filename)
+                    chunks = await loop.run_in_executor(pool, chunk_file, path)
+                    await self.index_file(filename, digest, chunks)
+
+            # Files are chunked in parallel; each starts embedding as soon as its chunks are ready
+            await asyncio.gather(*(worker() for _ in range(self.workers * FILES_PER_WORKER)))
+        updated = self.update_episode_metadata(skip=set(changed))
+        if not changed and not updated:
+            print("Index is up to date")
+        if prune:
+            self.prune_deleted()
+        # After indexing, so the old chunks keep answering until their replacements are in
+        purged = self.purge_legacy_chunks()
+        if changed or updated or prune or purged or not BM25Index.exists(self.bm25_path):
+            self.rebuild_bm25()
+        self.save_catalog()
+        return len(changed)
+
+    def rebuild_bm25(self):
+        """Rebuild the lexical index over the whole collection (seconds, no API calls)"""
+        bm25_index = BM25Index.from_chroma(self.collection)
+        bm25_index.save(self.bm25_path)
+        print(f"Built BM25 index over {len(bm25_index)} chunks at {self.bm25_path}")
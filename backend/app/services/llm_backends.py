@@ -0,0 +1,175 @@
+import os
+import time
+
+import httpx
+from openai import APIConnectionError, AsyncAzureOpenAI, AsyncOpenAI, BadRequestError, InternalServerError
+
+from app.utils.admission import AdmissionGate
+from app.utils.metrics import record_llm_usage, stage_duration, stage_timer, tracer
+from app.utils.resilience import Upstream
+
+# azure | openai | clarin | stub (an OpenAI-compatible server such as stub_llm_server.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "azure")
+LLM_MODEL = os.getenv("LLM_MODEL")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "1.0"))
+LLM_TOP_P = float(os.getenv("LLM_TOP_P", "1.0"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# Calls waiting for a free slot beyond this, or for longer than the timeout, get a 503
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+# Per attempt, until a stream starts; the SDK's own retries are off
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+# A non-streamed completion arrives whole, so its deadline also allows max_tokens at this generation rate
+LLM_MIN_TOKENS_PER_SECOND = float(os.getenv("LLM_MIN_TOKENS_PER_SECOND", "20"))
+# Only connection errors and 5xx are retried; a missed deadline would only pay for the same slow completion twice
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+LLM_RETRY_ERRORS = (APIConnectionError, InternalServerError)
+
+AZURE_API_VERSION = "2024-12-01-preview"
+CLARIN_BASE_URL = "https://services.clarin-pl.eu/api/v1/oapi"
+STUB_BASE_URL = os.getenv("LLM_STUB_URL", "http://localhost:8001/v1")
+DEFAULT_MODELS = {
+    "azure": "gpt-4o-mini",
+    "openai": "gpt-4o-mini",
+    "clarin": "llama3.1",
+    "stub": "stub",
+}
+# Providers known to accept stream_options={"include_usage": True}
+STREAM_USAGE_BACKENDS = ("azure", "openai")
+
+
+class LLMBackend:
+    """Chat-completion backend over the OpenAI SDK.
+
+    Each backend owns a pooled httpx client, a request timeout and an
+    admission gate capping in-flight requests and the queue behind them, so a
+    slow provider cannot take every worker. Calls have a deadline, are retried
+    with jitter and fail fast while the provider's circuit is open.
+    """
+
+    def __init__(
+        self,
+        name,
+        client,
+        model,
+        temperature=LLM_TEMPERATURE,
+        top_p=LLM_TOP_P,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        max_queue=LLM_MAX_QUEUE,
+        queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+        deadline=LLM_DEADLINE_SECONDS,
+        retries=LLM_RETRIES,
+        min_tokens_per_second=LLM_MIN_TOKENS_PER_SECOND,
+    ):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.top_p = top_p
+        self.min_tokens_per_second = min_tokens_per_second
+        self.admission = AdmissionGate(max_concurrency, max_queue, queue_timeout)
+        # A rejected request (e.g. too many tokens) says nothing about the provider's health
+        self.upstream = Upstream(
+            "llm", deadline, retries, client_errors=(BadRequestError,), retry_errors=LLM_RETRY_ERRORS
+        )
+
+    def completion_deadline(self, max_tokens):
+        """Seconds a whole non-streamed completion of up to max_tokens may take"""
+        return self.upstream.deadline + max_tokens / self.min_tokens_per_second
+
+    async def complete(self, messages, max_tokens):
+        deadline = self.completion_deadline(max_tokens)
+        async with self.admission.admit():
+            with stage_timer("llm_completion", backend=self.name, model=self.model) as span:
+                response = await self.upstream.call(lambda: self.client.chat.completions.create(
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    model=self.model,
+                    # Nothing is read until the completion is done, so the client's read timeout must wait as long
+                    timeout=deadline + 1,
+                ), deadline)
+                record_llm_usage(self.name, response.usage, span)
+        return response.choices[0].message.content
+
+    async def stream(self, messages, max_tokens):
+        """Yield completion tokens as the model produces them"""
+        extra = {"stream_options": {"include_usage": True}} if self.name in STREAM_USAGE_BACKENDS else {}
+        async with self.admission.admit():
+            # Not the current span: context would be switched across the generator's yields
+            span = tracer.start_span("llm_stream", attributes={"backend": self.name, "model": self.model})
+            start = time.perf_counter()
+            first_token = True
+            stream = None
+            try:
+                stream = await self.upstream.call(lambda: self.client.chat.completions.create(
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    model=self.model,
+                    stream=True,
+                    **extra
+                ))
+                async for chunk in stream:
+                    # The usage chunk comes last with no choices
+                    record_llm_usage(self.name, getattr(chunk, "usage", None), span)
+                    # Azure sends a leading chunk with no choices (content filter results)
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        if first_token:
+                            stage_duration.observe(time.perf_counter() - start, "llm_first_token")
+                            first_token = False
+                        yield content
+            except Exception:
+                if stream is not None:
+                    # Broken off mid-stream; the deadline only covered starting it
+                    self.upstream.breaker.record_failure()
+                raise
+            finally:
+                stage_duration.observe(time.perf_counter() - start, "llm_stream")
+                span.end()
+
+    async def close(self):
+        await self.client.close()
+
+
+def _http_client(timeout, max_connections):
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    )
+
+
+def create_llm_backend(
+    name=LLM_BACKEND,
+    model=LLM_MODEL,
+    timeout=LLM_TIMEOUT_SECONDS,
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+):
+    http_client = _http_client(timeout, max_connections)
+    if name == "azure":
+        client = AsyncAzureOpenAI(
+            api_version=AZURE_API_VERSION,
+            azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+            api_key=os.getenv("AZURE_API_KEY"),
+            http_client=http_client,
+            max_retries=0,
+        )
+    elif name == "openai":
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+    elif name == "clarin":
+        client = AsyncOpenAI(
+            base_url=CLARIN_BASE_URL, api_key=os.getenv("CLARIN_TOKEN"), http_client=http_client, max_retries=0
+        )
+    elif name == "stub":
+        client = AsyncOpenAI(base_url=STUB_BASE_URL, api_key="stub", http_client=http_client, max_retries=0)
+    else:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    return LLMBackend(name, client, model or DEFAULT_MODELS[name], max_concurrency=max_concurrency)
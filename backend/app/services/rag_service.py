@@ -1,84 +1,488 @@
 import os
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
-from openai import AzureOpenAI
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 import tiktoken
-
-# Preload the cl100k_base tokenizer
-_ = tiktoken.get_encoding("cl100k_base")
+from app.utils.concurrency import run_blocking
+from app.utils.singleflight import SingleFlight
+from app.utils.text import normalize_query
+from app.utils.metrics import stage_timer
+from app.utils.resilience import Upstream
+from app.services.semantic_cache import create_semantic_cache
+from app.services.answer_store import create_precomputed_answers
+from app.services.embedding_service import CachedEmbeddings
+from app.services.vector_index import InMemoryVectorIndex, snapshot_lock, snapshot_version
+from app.services.episodes import EpisodeCatalog
+from app.services.context_builder import ContextBuilder
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion
+from app.services.reranker import create_reranker
+from app.services.llm_backends import create_llm_backend
+from app.services.conversation import QUERY_REWRITE, condense_query_heuristic, condense_query_llm
 
 load_dotenv()
 
-PATH_TO_DB = "../db/chroma"
+PATH_TO_DB = os.getenv("RAG_CHROMA_PATH", "../db/chroma")
+COLLECTION_NAME = "huberman_lab"
+# "chroma" queries the persistent collection per request; "memory" serves MMR from the
+# memory-mapped snapshot at RAG_INDEX_PATH (see export_snapshot.py)
+RETRIEVER = os.getenv("RAG_RETRIEVER", "chroma")
+PATH_TO_INDEX = os.getenv("RAG_INDEX_PATH", "../db/index")
+# How often a server checks whether export_snapshot.py or ingest.py published a new index version
+INDEX_RELOAD_SECONDS = float(os.getenv("RAG_INDEX_RELOAD_SECONDS", "30"))
+# Hybrid retrieval fuses dense results with a local BM25 index built by ingest.py
+HYBRID_RETRIEVAL = os.getenv("RAG_HYBRID", "true").lower() == "true"
+PATH_TO_BM25 = os.getenv("RAG_BM25_PATH", "../db/bm25")
+# Episode titles, guests and dates written by ingest.py, for filtered retrieval
+PATH_TO_EPISODE_CATALOG = os.getenv("RAG_EPISODE_CATALOG_PATH", "../db/episodes.json")
+LEXICAL_FETCH_K = 20
+# Completion length assumed when estimating a request's token cost for rate limiting
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_EXPECTED_COMPLETION_TOKENS", "500"))
+# Past this, retrieval falls back to BM25 only instead of waiting on the embedding service
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("RAG_EMBEDDING_TIMEOUT_SECONDS", "2.0"))
+# Past this, or while retrieval keeps failing, questions are answered without retrieved context
+RETRIEVAL_DEADLINE_SECONDS = float(os.getenv("RAG_RETRIEVAL_DEADLINE_SECONDS", "3.0"))
 RAG_PROMPT = "You are an advanced AI assistant using retrieval-augmented generation to provide detailed and accurate responses. \
 Use the following pieces of retrieved context from Andrew Huberman's teachings to answer the question. \
 If you don't know the answer, say that you don't know.\n\n"
 
-# setting up LLM
-ENDPOINT = os.getenv("AZURE_ENDPOINT")
-MODEL_NAME = "gpt-4o-mini"
-DEPLOYMENT = "gpt-4o-mini"
-SUBSCRIPTION_KEY = os.getenv("AZURE_API_KEY")
-API_VERSION = "2024-12-01-preview"
+# Chroma has no async API, so searches run on a bounded pool instead of the event loop
+RETRIEVAL_WORKERS = int(os.getenv("RAG_RETRIEVAL_WORKERS", "8"))
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# Read-only indexes opened by preload_indexes() before serve.py forks its workers, keyed by (kind, path)
+_preloaded = {}
+
+
+def preload_indexes():
+    """Open the vector snapshot, BM25 index and episode catalog once, in the parent process.
+
+    Forked workers reuse these objects instead of each opening their own. Their
+    arrays are memory-mapped, so the pages are read into the page cache once
+    and shared by every worker.
+    """
+    if RETRIEVER == "memory":
+        vector_index = open_vector_index()
+        vector_index.prefault()
+        # Snapshots without stored partitions build them here rather than once per worker
+        vector_index.partitions
+        _preloaded["vector_index", PATH_TO_INDEX] = vector_index
+    bm25_index = open_bm25_index()
+    if bm25_index is not None:
+        bm25_index.partitions
+        _preloaded["bm25", PATH_TO_BM25] = bm25_index
+    _preloaded["episode_catalog", PATH_TO_EPISODE_CATALOG] = EpisodeCatalog.load(PATH_TO_EPISODE_CATALOG)
+
+
+def open_vector_index():
+    """Open the memory-mapped snapshot, exporting a float32 one from Chroma on first use"""
+    if not InMemoryVectorIndex.exists(PATH_TO_INDEX):
+        # Workers started without preloading all get here at once; one exports and the rest wait for it
+        with snapshot_lock(PATH_TO_INDEX, "export"):
+            if not InMemoryVectorIndex.exists(PATH_TO_INDEX):
+                collection = chromadb.PersistentClient(path=PATH_TO_DB).get_collection(COLLECTION_NAME)
+                InMemoryVectorIndex.from_chroma(collection).save(PATH_TO_INDEX)
+    return InMemoryVectorIndex.load(PATH_TO_INDEX)
+
+
+def open_bm25_index():
+    if not HYBRID_RETRIEVAL:
+        return None
+    if not BM25Index.exists(PATH_TO_BM25):
+        print(f"Warning: no BM25 index at {PATH_TO_BM25}, run ingest.py for hybrid retrieval")
+        return None
+    return BM25Index.load(PATH_TO_BM25)
+
+
+def _open_with_partitions(opener):
+    index = opener()
+    if index is not None:
+        # Built here if the snapshot has none stored, not on the first filtered search
+        index.partitions
+    return index
 
-llm_client = AzureOpenAI(
-    api_version=API_VERSION,
-    azure_endpoint=ENDPOINT,
-    api_key=SUBSCRIPTION_KEY,
-)
 
 class RAGService:
     def __init__(self):
-        self.vector_store = self.initialize_vector_store()
-
-    def initialize_vector_store(self):
-        embeddings = OpenAIEmbeddings(
+        self.embeddings = CachedEmbeddings(OpenAIEmbeddings(
             model="text-embedding-3-large",
             tiktoken_model_name="cl100k_base"
-        )
+        ))
+        if RETRIEVER == "memory":
+            # Serving from the snapshot never opens the Chroma database
+            self.vector_store = None
+            self.vector_index = self.initialize_vector_index()
+        else:
+            self.vector_store = self.initialize_vector_store()
+            self.vector_index = None
+        self.bm25_index = self.initialize_bm25_index()
+        self.episode_catalog = _preloaded.get(("episode_catalog", PATH_TO_EPISODE_CATALOG))
+        if self.episode_catalog is None:
+            self.episode_catalog = EpisodeCatalog.load(PATH_TO_EPISODE_CATALOG)
+        # Optional local rerank of a wider candidate set (RERANKER=lexical|onnx)
+        self.reranker = create_reranker(retrieval_executor)
+        self.answer_cache = create_semantic_cache()
+        # Answers to the most frequent questions, built offline by precompute_answers.py
+        self.precomputed = create_precomputed_answers()
+        # Loading the cl100k_base tokenizer is part of start-up warm-up, not module import
+        self.context_builder = ContextBuilder(tiktoken.get_encoding("cl100k_base"))
+        # Provider, model, sampling, timeouts and concurrency come from LLM_* settings
+        self.llm = create_llm_backend()
+        # Identical questions in flight at the same time share one retrieval and LLM call
+        self.single_flight = SingleFlight()
+        # Deadlines and circuit breakers; when one fails the answer degrades instead of erroring
+        self.embedding_upstream = Upstream("embedding", EMBEDDING_TIMEOUT_SECONDS)
+        self.retrieval_upstream = Upstream("retrieval", RETRIEVAL_DEADLINE_SECONDS)
+        # Published versions of the open indexes; a newer one is reopened in the background
+        self.index_versions = {
+            "vector_index": getattr(self.vector_index, "version", None),
+            "bm25_index": getattr(self.bm25_index, "version", None),
+        }
+        self._indexes_checked_at = time.monotonic()
+        self._reloading = None
+
+    def initialize_vector_store(self):
         chroma_client = chromadb.PersistentClient(path=PATH_TO_DB)
         vector_store = Chroma(
-            embedding_function=embeddings,
+            embedding_function=self.embeddings,
             client=chroma_client,
-            collection_name="huberman_lab"
+            collection_name=COLLECTION_NAME
         )
         return vector_store
 
-    def get_top_docs_mmr(self, query, k=6, fetch_k=20, lambda_mult=0.5):
-        return self.vector_store.max_marginal_relevance_search(
-            query,
+    def initialize_vector_index(self):
+        preloaded = _preloaded.get(("vector_index", PATH_TO_INDEX))
+        return preloaded if preloaded is not None else open_vector_index()
+
+    def initialize_bm25_index(self):
+        preloaded = _preloaded.get(("bm25", PATH_TO_BM25))
+        return preloaded if preloaded is not None else open_bm25_index()
+
+    def maybe_reload_indexes(self):
+        """Every INDEX_RELOAD_SECONDS, start reopening any index published since it was opened.
+
+        Searches keep using the open version until the new one is loaded; the
+        old version's files are never rewritten, so its mmaps stay valid.
+        """
+        now = time.monotonic()
+        if now - self._indexes_checked_at < INDEX_RELOAD_SECONDS or self._reloading is not None:
+            return
+        self._indexes_checked_at = now
+        stale = [kind for kind, version in self._published_versions().items()
+                 if version != self.index_versions.get(kind)]
+        if stale:
+            self._reloading = asyncio.create_task(self._reload_indexes(stale))
+
+    def _published_versions(self):
+        versions = {}
+        if self.vector_index is not None:
+            versions["vector_index"] = snapshot_version(PATH_TO_INDEX)
+        # Also picks up a BM25 index that ingest.py built after this server started
+        if HYBRID_RETRIEVAL and BM25Index.exists(PATH_TO_BM25):
+            versions["bm25_index"] = snapshot_version(PATH_TO_BM25)
+        return versions
+
+    async def _reload_indexes(self, stale):
+        openers = {"vector_index": open_vector_index, "bm25_index": open_bm25_index}
+        try:
+            for kind in stale:
+                index = await run_blocking(retrieval_executor, _open_with_partitions, openers[kind])
+                setattr(self, kind, index)
+                self.index_versions[kind] = getattr(index, "version", None)
+                print(f"Reopened {kind} at {self.index_versions[kind]}")
+        except Exception as e:
+            print(f"Warning: could not reopen indexes, still serving the previous version: {str(e)}")
+        finally:
+            self._reloading = None
+
+    async def embed_query(self, query):
+        with stage_timer("embedding"):
+            return await self.embeddings.aembed_query(query)
+
+    async def embed_for_retrieval(self, query, degraded=None):
+        """Query embedding, or None when it is unavailable and only lexical retrieval can answer.
+
+        "embedding" is added to `degraded` when that happens.
+        """
+        try:
+            return await self.embedding_upstream.call(lambda: self.embed_query(query))
+        except Exception as e:
+            print(f"Warning: embedding unavailable, using lexical retrieval: {str(e) or type(e).__name__}")
+            if degraded is not None:
+                degraded.append("embedding")
+            return None
+
+    async def retrieve_or_degrade(self, query, embedding, filters=None, degraded=None):
+        """retrieve() under its deadline and circuit breaker; None (and "retrieval" in
+        `degraded`) when the question has to be answered without retrieved context"""
+        try:
+            if embedding is None and self.bm25_index is None:
+                raise RuntimeError("no query embedding and no lexical index")
+            return await self.retrieval_upstream.call(
+                lambda: self.retrieve(query, embedding=embedding, filters=filters)
+            )
+        except Exception as e:
+            print(f"Warning: retrieval unavailable, answering without context: {str(e) or type(e).__name__}")
+            if degraded is not None:
+                degraded.append("retrieval")
+            return None
+
+    async def retrieve(self, query, embedding=None, k=6, filters=None):
+        """Chunks for the prompt, best first; reranked from a wider candidate set when enabled.
+
+        filters (episode ids, guests, dates) narrow the search to the matching
+        episodes' chunks before anything is scored.
+        """
+        self.maybe_reload_indexes()
+        episode_ids = self.episode_catalog.match(filters)
+        if episode_ids is not None and not episode_ids:
+            return []
+        if self.reranker is None:
+            return await self._retrieve(query, embedding, k, episode_ids)
+        candidates = await self._retrieve(query, embedding, max(k, self.reranker.candidates), episode_ids)
+        return await self.reranker.rerank(query, candidates, k)
+
+    async def _retrieve(self, query, embedding, k, episode_ids=None):
+        """Dense MMR results fused with BM25 by reciprocal rank; BM25 alone without an embedding"""
+        fetch_k = max(20, 2 * k)
+        if self.bm25_index is None:
+            return await self.get_top_docs_mmr(query, k=k, fetch_k=fetch_k, embedding=embedding, episode_ids=episode_ids)
+        if embedding is None:
+            return (await self._lexical_search(query, episode_ids))[:k]
+        dense, lexical = await asyncio.gather(
+            self.get_top_docs_mmr(query, k=k, fetch_k=fetch_k, embedding=embedding, episode_ids=episode_ids),
+            self._lexical_search(query, episode_ids)
+        )
+        return reciprocal_rank_fusion([dense, lexical])[:k]
+
+    async def retrieve_batch(self, queries, embeddings=None, k=6, filters=None):
+        """retrieve() for many queries at once, with one vectorized dense pass over the memory index"""
+        self.maybe_reload_indexes()
+        episode_ids = self.episode_catalog.match(filters)
+        if episode_ids is not None and not episode_ids:
+            return [[] for _ in queries]
+        if embeddings is None and self.bm25_index is None:
+            embeddings = await self.embeddings.aembed_queries(queries)
+        fetch = max(k, self.reranker.candidates) if self.reranker is not None else k
+        searches = []
+        if embeddings is not None:
+            searches.append(self._dense_batch(queries, embeddings, fetch, max(20, 2 * fetch), episode_ids))
+        if self.bm25_index is not None:
+            searches.append(self._lexical_batch(queries, episode_ids))
+        ranked = await asyncio.gather(*searches)
+        if len(ranked) == 2:
+            results = [reciprocal_rank_fusion([dense, lexical])[:fetch] for dense, lexical in zip(*ranked)]
+        else:
+            results = [docs[:fetch] for docs in ranked[0]]
+        if self.reranker is None:
+            return results
+        return await asyncio.gather(*(
+            self.reranker.rerank(query, candidates, k) for query, candidates in zip(queries, results)
+        ))
+
+    async def _dense_batch(self, queries, embeddings, k, fetch_k, episode_ids):
+        if self.vector_index is None:
+            # Chroma has no batched MMR; run the per-query searches side by side on the pool
+            return await asyncio.gather(*(
+                self.get_top_docs_mmr(query, k=k, fetch_k=fetch_k, embedding=embedding, episode_ids=episode_ids)
+                for query, embedding in zip(queries, embeddings)
+            ))
+        with stage_timer("vector_search_batch", retriever=RETRIEVER, queries=len(queries)):
+            return await run_blocking(
+                retrieval_executor,
+                self.vector_index.search_mmr_batch,
+                embeddings,
+                k=k,
+                fetch_k=fetch_k,
+                episode_ids=episode_ids
+            )
+
+    async def _lexical_batch(self, queries, episode_ids):
+        def search_all():
+            return [self.bm25_index.search(query, LEXICAL_FETCH_K, episode_ids) for query in queries]
+
+        with stage_timer("lexical_search_batch", queries=len(queries)):
+            return await run_blocking(retrieval_executor, search_all)
+
+    async def _lexical_search(self, query, episode_ids=None):
+        with stage_timer("lexical_search", filtered=episode_ids is not None):
+            return await run_blocking(
+                retrieval_executor, self.bm25_index.search, query, LEXICAL_FETCH_K, episode_ids
+            )
+
+    async def get_top_docs_mmr(self, query, k=6, fetch_k=20, lambda_mult=0.5, embedding=None, episode_ids=None):
+        if embedding is None:
+            embedding = await self.embed_query(query)
+        with stage_timer("vector_search", retriever=RETRIEVER, filtered=episode_ids is not None):
+            return await self._search_mmr(embedding, k, fetch_k, lambda_mult, episode_ids)
+
+    async def _search_mmr(self, embedding, k, fetch_k, lambda_mult, episode_ids=None):
+        if self.vector_index is not None:
+            # numpy releases the GIL in the matrix product, so this also runs off the loop
+            return await run_blocking(
+                retrieval_executor,
+                self.vector_index.search_mmr,
+                embedding,
+                k=k,
+                fetch_k=fetch_k,
+                lambda_mult=lambda_mult,
+                episode_ids=episode_ids
+            )
+        return await run_blocking(
+            retrieval_executor,
+            self.vector_store.max_marginal_relevance_search_by_vector,
+            list(map(float, embedding)),
             k=k,
             fetch_k=fetch_k,
-            lambda_mult=lambda_mult
+            lambda_mult=lambda_mult,
+            filter=None if episode_ids is None else {"episode_id": {"$in": list(episode_ids)}}
         )
 
-    def get_llm_response(self, question):
-        response = llm_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant.",
-                },
-                {
-                    "role": "user",
-                    "content": question,
-                }
-            ],
-            max_tokens=4096,
-            temperature=1.0,
-            top_p=1.0,
-            model=DEPLOYMENT
-        )
-        
-        return response.choices[0].message.content
+    def _build_messages(self, question, history=None):
+        return [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant.",
+            },
+            *self.context_builder.history_window(history),
+            {
+                "role": "user",
+                "content": question,
+            }
+        ]
+
+    async def get_llm_response(self, question, history=None):
+        messages = self._build_messages(question, history)
+        return await self.llm.complete(messages, self.context_builder.completion_tokens(messages))
+
+    async def stream_llm_response(self, question, history=None):
+        """Yield completion tokens as the model produces them"""
+        messages = self._build_messages(question, history)
+        async for token in self.llm.stream(messages, self.context_builder.completion_tokens(messages)):
+            yield token
+
+    def estimate_tokens(self, question, use_rag=True, history=None):
+        """Tokens a request is likely to use, known before retrieval or the LLM call"""
+        prompt_tokens = self.context_builder.count_message_tokens(self._build_messages(question, history))
+        if use_rag:
+            prompt_tokens += self.context_builder.context_budget + self.context_builder.count_tokens(RAG_PROMPT)
+        return prompt_tokens + EXPECTED_COMPLETION_TOKENS
+
+    def build_rag_query(self, user_input, retrieved_docs):
+        with stage_timer("context_build"):
+            context = self.context_builder.build(retrieved_docs)
+        return f"{RAG_PROMPT}\nRetrieved information:\n {context}\n\nQuestion: {user_input}"
+
+    async def condense_query(self, user_input, history=None):
+        """Standalone retrieval query for a possibly follow-up question"""
+        with stage_timer("query_rewrite", mode=QUERY_REWRITE):
+            if QUERY_REWRITE == "llm":
+                return await condense_query_llm(self.llm, user_input, history)
+            return condense_query_heuristic(user_input, history)
+
+    def _precomputed_answer(self, question):
+        if self.precomputed is None:
+            return None
+        with stage_timer("precomputed_lookup"):
+            return self.precomputed.lookup(question)
+
+    def _cached_answer(self, embedding):
+        if self.answer_cache is None or embedding is None:
+            return None
+        with stage_timer("answer_cache_lookup"):
+            return self.answer_cache.lookup(embedding)
+
+    def _cache_answer(self, user_input, embedding, answer):
+        if self.answer_cache is not None and embedding is not None:
+            self.answer_cache.store(user_input, embedding, answer)
+
+    def _flight_key(self, user_input, use_rag, history, filters=None):
+        """Requests coalesce when question, mode, filters and the history the model would see all match"""
+        window = self.context_builder.history_window(history)
+        filters = filters.model_dump(mode="json", exclude_none=True) if filters is not None else None
+        payload = json.dumps([normalize_query(user_input), use_rag, window, filters], sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    async def query_with_rag(self, user_input, history=None, filters=None):
+        """(answer, retrieved docs, degraded); docs are empty when the answer came from the semantic cache.
+
+        degraded names the dependencies the answer had to do without: "embedding"
+        (lexical retrieval only) and "retrieval" (answered without context).
+        """
+        key = self._flight_key(user_input, True, history, filters)
+        return await self.single_flight.do(key, lambda: self._query_with_rag(user_input, history, filters))
+
+    async def query_without_rag(self, user_input, history=None):
+        key = self._flight_key(user_input, False, history)
+        return await self.single_flight.do(key, lambda: self.get_llm_response(user_input, history))
+
+    async def stream_query(self, user_input, use_rag=True, history=None, filters=None):
+        """Yield ("degraded", names) if any, ("sources", docs) once for RAG queries, then ("token", text) events"""
+        key = self._flight_key(user_input, use_rag, history, filters)
+        async for event in self.single_flight.stream(
+            key, lambda: self._stream_query(user_input, use_rag, history, filters)
+        ):
+            yield event
+
+    async def _query_with_rag(self, user_input, history=None, filters=None):
+        retrieval_query = await self.condense_query(user_input, history)
+        # Caches are shared across users, so they only serve questions the conversation did not
+        # change the retrieval query for (returning users asking standalone questions included),
+        # and never filtered ones
+        cacheable = retrieval_query == user_input and filters is None
+        # A local hash lookup, before anything that costs an embedding or LLM call
+        precomputed = self._precomputed_answer(user_input) if cacheable else None
+        if precomputed is not None:
+            return precomputed.answer, precomputed.docs(), []
+        degraded = []
+        embedding = await self.embed_for_retrieval(retrieval_query, degraded)
+        cached_answer = self._cached_answer(embedding) if cacheable else None
+        if cached_answer is not None:
+            return cached_answer, [], degraded
+
+        retrieved_docs = await self.retrieve_or_degrade(retrieval_query, embedding, filters, degraded)
+        if retrieved_docs is None:
+            return await self.get_llm_response(user_input, history), [], degraded
+        query = self.build_rag_query(user_input, retrieved_docs)
+        answer = await self.get_llm_response(query, history)
+        if cacheable and not degraded:
+            self._cache_answer(user_input, embedding, answer)
+        return answer, retrieved_docs, degraded
+
+    async def _stream_query(self, user_input, use_rag=True, history=None, filters=None):
+        if not use_rag:
+            async for token in self.stream_llm_response(user_input, history):
+                yield "token", token
+            return
 
-    def query_with_rag(self, user_input):
-        retrieved_docs = self.get_top_docs_mmr(user_input)
-        context = "\n\n".join([doc.page_content for doc in retrieved_docs])
-        query = f"{RAG_PROMPT}\nRetrieved information:\n {context}\n\nQuestion: {user_input}"
-        return self.get_llm_response(query)
+        retrieval_query = await self.condense_query(user_input, history)
+        cacheable = retrieval_query == user_input and filters is None
+        precomputed = self._precomputed_answer(user_input) if cacheable else None
+        if precomputed is not None:
+            yield "sources", precomputed.docs()
+            yield "token", precomputed.answer
+            return
+        degraded = []
+        embedding = await self.embed_for_retrieval(retrieval_query, degraded)
+        cached_answer = self._cached_answer(embedding) if cacheable else None
+        if cached_answer is not None:
+            yield "sources", []
+            yield "token", cached_answer
+            return
 
-    def query_without_rag(self, user_input):
-        return self.get_llm_response(user_input) 
\ No newline at end of file
+        retrieved_docs = await self.retrieve_or_degrade(retrieval_query, embedding, filters, degraded)
+        if degraded:
+            yield "degraded", degraded
+        yield "sources", retrieved_docs or []
+        query = self.build_rag_query(user_input, retrieved_docs) if retrieved_docs is not None else user_input
+        tokens = []
+        async for token in self.stream_llm_response(query, history):
+            tokens.append(token)
+            yield "token", token
+        if cacheable and not degraded:
+            self._cache_answer(user_input, embedding, "".join(tokens))
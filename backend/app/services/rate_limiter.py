@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis | none
+# Any Redis-compatible server (Redis, Valkey, KeyDB); shares budgets across worker processes
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+# Budgets are in estimated LLM tokens (prompt + expected completion), refilled continuously
+USER_TOKENS_PER_MINUTE = int(os.getenv("USER_TOKENS_PER_MINUTE", "40000"))
+USER_TOKEN_BURST = int(os.getenv("USER_TOKEN_BURST", "20000"))
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "100000"))
+REDIS_KEY_PREFIX = "huberman:ratelimit:"
+
+# Refill and take atomically on the server: KEYS[1] bucket, ARGV rate/s, capacity, cost, now
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(retry_after)
+"""
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Rate limit exceeded, please retry later")
+        self.retry_after = retry_after
+
+
+class InMemoryTokenBuckets:
+    """Buckets for this process only; the least recently seen users are dropped past max_users"""
+
+    def __init__(self, max_users=RATE_LIMIT_MAX_USERS):
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+
+    async def take(self, key, cost, rate, capacity):
+        """0 when cost was taken from the bucket, otherwise seconds until it could be"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def close(self):
+        pass
+
+
+class RedisTokenBuckets:
+    """Buckets in a Redis-compatible store, updated by one Lua script per request"""
+
+    def __init__(self, url=RATE_LIMIT_REDIS_URL):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+
+    async def take(self, key, cost, rate, capacity):
+        return float(await self.script(keys=[REDIS_KEY_PREFIX + key], args=[rate, capacity, cost, time.time()]))
+
+    def __len__(self):
+        return 0
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class UserRateLimiter:
+    """Per-user token bucket over estimated LLM tokens.
+
+    A user may spend up to `burst` tokens at once and tokens_per_minute on
+    average. A single request costing more than the burst is charged the
+    burst, so it is slow to repeat but never impossible. Batches pay their
+    full cost through consume() instead. If the store is
+    unreachable requests are let through; the LLM admission gate still
+    bounds the total load.
+    """
+
+    def __init__(self, store, tokens_per_minute=USER_TOKENS_PER_MINUTE, burst=USER_TOKEN_BURST):
+        self.store = store
+        self.rate = tokens_per_minute / 60
+        self.burst = burst
+        self.allowed = 0
+        self.limited = 0
+        self.store_errors = 0
+
+    async def acquire(self, user_id, cost):
+        try:
+            retry_after = await self.store.take(user_id, min(cost, self.burst), self.rate, self.burst)
+        except Exception as e:
+            self.store_errors += 1
+            print(f"Warning: rate limit store unavailable: {str(e)}")
+            return
+        if retry_after > 0:
+            self.limited += 1
+            raise RateLimitExceeded(retry_after)
+        self.allowed += 1
+
+    async def consume(self, user_id, cost):
+        """Take the whole cost in burst-sized pieces, waiting for the bucket to refill between them.
+
+        For work that can be paced rather than refused, such as the groups of a batch.
+        """
+        while cost > 0:
+            piece = min(cost, self.burst)
+            try:
+                retry_after = await self.store.take(user_id, piece, self.rate, self.burst)
+            except Exception as e:
+                self.store_errors += 1
+                print(f"Warning: rate limit store unavailable: {str(e)}")
+                return
+            if retry_after > 0:
+                self.limited += 1
+                await asyncio.sleep(retry_after)
+                continue
+            self.allowed += 1
+            cost -= piece
+
+    async def close(self):
+        await self.store.close()
+
+    def stats(self):
+        return {
+            "users": len(self.store),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "store_errors": self.store_errors,
+        }
+
+
+class NoRateLimit:
+    """Admits everything (RATE_LIMIT_BACKEND=none)"""
+
+    async def acquire(self, user_id, cost):
+        pass
+
+    async def consume(self, user_id, cost):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def create_rate_limiter(backend_name=RATE_LIMIT_BACKEND):
+    """Build the configured limiter; a NoRateLimit when rate limiting is disabled"""
+    if backend_name == "none":
+        return NoRateLimit()
+    if backend_name == "redis":
+        return UserRateLimiter(RedisTokenBuckets())
+    if backend_name == "memory":
+        return UserRateLimiter(InMemoryTokenBuckets())
+    raise ValueError(f"Unknown rate limit backend: {backend_name}")
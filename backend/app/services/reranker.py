@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.services.bm25_index import tokenize
+from app.utils.concurrency import run_blocking
+from app.utils.metrics import stage_timer
+from app.utils.text import normalize_query
+
+# none | lexical (overlap and metadata priors only) | onnx (plus a local cross-encoder)
+RERANKER = os.getenv("RERANKER", "none")
+# Directory holding model.onnx and the matching tokenizer.json (e.g. an exported ms-marco-MiniLM-L-6-v2)
+RERANK_MODEL_PATH = os.getenv("RERANK_MODEL_PATH", "../db/reranker")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "60"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_MAX_TOKENS = int(os.getenv("RERANK_MAX_TOKENS", "256"))
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "1"))
+
+# Weights of each signal in the final score; every signal is scaled to [0, 1]
+RETRIEVAL_RANK_WEIGHT = 0.35
+LEXICAL_WEIGHT = 0.35
+EPISODE_WEIGHT = 0.15
+POSITION_WEIGHT = 0.15
+MODEL_WEIGHT = 1.0
+# Episodes open with sponsor reads and introductions, which rarely answer a question
+INTRO_CHUNKS = 2
+
+
+def chunk_key(doc):
+    if doc.id:
+        return doc.id
+    return hashlib.sha1(doc.page_content.encode()).hexdigest()
+
+
+class OnnxCrossEncoder:
+    """Scores (query, passage) pairs with a cross-encoder exported to ONNX, on CPU"""
+
+    def __init__(self, path, max_tokens=RERANK_MAX_TOKENS, threads=RERANK_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_tokens)
+        self.tokenizer.enable_padding()
+
+    def score(self, query, passages):
+        encodings = self.tokenizer.encode_batch([(query, passage) for passage in passages])
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: feed[name] for name in self.input_names})[0]
+        # One relevance logit per pair, or the "relevant" column of a two-class head
+        logits = np.asarray(logits, dtype=np.float32).reshape(len(passages), -1)[:, -1]
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+class Reranker:
+    """Reorders retrieved chunks before prompt assembly, locally and within a latency budget.
+
+    Lexical overlap with the query, the retriever's own rank, how many
+    candidates come from the same episode and the chunk's position in the
+    episode always apply; they are cheap and computed inline. An optional
+    ONNX cross-encoder adds a learned relevance score. Its scores are cached
+    per (query hash, chunk id), and if scoring the uncached chunks does not
+    finish within the budget, the cheap ranking is used for that request.
+    """
+
+    def __init__(
+        self,
+        executor,
+        model=None,
+        candidates=RERANK_CANDIDATES,
+        budget_ms=RERANK_BUDGET_MS,
+        cache_size=RERANK_CACHE_SIZE,
+    ):
+        self.executor = executor
+        self.model = model
+        self.candidates = candidates
+        self.budget = budget_ms / 1000
+        self.cache_size = cache_size
+        self.reranked = 0
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def rerank(self, query, docs, k=6):
+        if len(docs) <= 1:
+            return docs[:k]
+        start = time.perf_counter()
+        with stage_timer("rerank", candidates=len(docs)):
+            scores = self.feature_scores(query, docs)
+            if self.model is not None:
+                remaining = self.budget - (time.perf_counter() - start)
+                try:
+                    model_scores = await asyncio.wait_for(
+                        run_blocking(self.executor, self.model_scores, query, docs), max(remaining, 0)
+                    )
+                    scores = scores + MODEL_WEIGHT * model_scores
+                except asyncio.TimeoutError:
+                    # Scoring carries on in its thread and fills the cache for the next request
+                    self.timeouts += 1
+        self.reranked += 1
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [docs[i] for i in order]
+
+    def feature_scores(self, query, docs):
+        query_terms = set(tokenize(query))
+        sources = [doc.metadata.get("source") for doc in docs]
+        scores = np.empty(len(docs), dtype=np.float32)
+        for rank, doc in enumerate(docs):
+            rank_prior = 1.0 - rank / len(docs)
+            overlap = len(query_terms & set(tokenize(doc.page_content))) / len(query_terms) if query_terms else 0.0
+            # Share of the other candidates from the same episode: agreement between results
+            episode = (sources.count(sources[rank]) - 1) / (len(docs) - 1) if sources[rank] else 0.0
+            position = 0.0 if doc.metadata.get("chunk_index", INTRO_CHUNKS) < INTRO_CHUNKS else 1.0
+            scores[rank] = (
+                RETRIEVAL_RANK_WEIGHT * rank_prior
+                + LEXICAL_WEIGHT * overlap
+                + EPISODE_WEIGHT * episode
+                + POSITION_WEIGHT * position
+            )
+        return scores
+
+    def model_scores(self, query, docs):
+        query_hash = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+        keys = [(query_hash, chunk_key(doc)) for doc in docs]
+        scores = np.empty(len(docs), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+        self.hits += len(docs) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            fresh = self.model.score(query, [docs[i].page_content for i in missing])
+            with self._lock:
+                for i, score in zip(missing, fresh):
+                    scores[i] = score
+                    self._cache[keys[i]] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def stats(self):
+        return {
+            "reranked": self.reranked,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+        }
+
+
+def create_reranker(executor, kind=RERANKER):
+    """The configured reranker, or None when reranking is off"""
+    if kind == "none":
+        return None
+    if kind == "lexical":
+        return Reranker(executor)
+    if kind == "onnx":
+        try:
+            return Reranker(executor, model=OnnxCrossEncoder(RERANK_MODEL_PATH))
+        except Exception as e:
+            print(f"Warning: could not load rerank model from {RERANK_MODEL_PATH}, using lexical reranking: {str(e)}")
+            return Reranker(executor)
+    raise ValueError(f"Unknown reranker: {kind}")
@@ -0,0 +1,237 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from app.utils.text import normalize_query
+
+SEMANTIC_CACHE_BACKEND = os.getenv("SEMANTIC_CACHE_BACKEND", "memory")  # memory | sqlite | none
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "../db/semantic_cache.sqlite")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    query: str
+    embedding: np.ndarray
+    answer: str
+    created_at: float
+
+    @property
+    def size(self):
+        return self.embedding.nbytes + len(self.query.encode()) + len(self.answer.encode())
+
+
+class InMemoryCacheBackend:
+    """Keeps entries only in the process; nothing survives a restart"""
+
+    def load(self):
+        return []
+
+    def save(self, entry):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend:
+    """Persists entries to a local SQLite file so the cache survives restarts.
+
+    save() and delete() return at once; a writer thread applies everything
+    queued since its last pass in one transaction, so the event loop never
+    waits on a commit. Writes still queued when the process dies are lost,
+    which only costs cache hits.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, query TEXT, embedding BLOB, answer TEXT, created_at REAL)"
+            )
+        self._ops = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="semantic-cache-writer", daemon=True)
+        self._thread.start()
+
+    def load(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, query, embedding, answer, created_at FROM answers ORDER BY created_at"
+            ).fetchall()
+        return [
+            CacheEntry(key, query, np.frombuffer(embedding, dtype=np.float32), answer, created_at)
+            for key, query, embedding, answer, created_at in rows
+        ]
+
+    def save(self, entry):
+        self._ops.put(("save", entry))
+
+    def delete(self, key):
+        self._ops.put(("delete", key))
+
+    def close(self):
+        """Write what is queued and stop the thread; blocks, so call it off the event loop"""
+        self._ops.put(("close", None))
+        self._thread.join()
+        self.conn.close()
+
+    def _run(self):
+        while True:
+            ops = [self._ops.get()]
+            while True:
+                try:
+                    ops.append(self._ops.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.lock, self.conn:
+                    for kind, payload in ops:
+                        if kind == "save":
+                            self.conn.execute(
+                                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                                (payload.key, payload.query, payload.embedding.tobytes(), payload.answer,
+                                 payload.created_at),
+                            )
+                        elif kind == "delete":
+                            self.conn.execute("DELETE FROM answers WHERE key = ?", (payload,))
+            except sqlite3.Error as e:
+                print(f"Warning: semantic cache write failed: {str(e)}")
+            if any(kind == "close" for kind, _ in ops):
+                return
+
+
+class SemanticCache:
+    """LRU/TTL answer cache matched on cosine similarity of query embeddings"""
+
+    def __init__(
+        self,
+        backend=None,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        max_bytes=SEMANTIC_CACHE_MAX_BYTES,
+        ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+    ):
+        self.backend = backend or InMemoryCacheBackend()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Keys by creation time, oldest first; _entries is in LRU order, which hits rearrange
+        self._created = OrderedDict()
+        self._bytes = 0
+        self._matrix = None
+        self._keys = []
+        for entry in self.backend.load():
+            self._insert(entry)
+        self._evict()
+
+    def lookup(self, embedding) -> Optional[str]:
+        """Return the cached answer for the closest query above the threshold"""
+        self._expire()
+        if not self._entries:
+            self.misses += 1
+            return None
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key].embedding for key in self._keys])
+        scores = self._matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        key = self._keys[best]
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key].answer
+
+    def store(self, query, embedding, answer):
+        key = hashlib.sha1(normalize_query(query).encode()).hexdigest()
+        if key in self._entries:
+            self._remove(key)
+        entry = CacheEntry(key, query, self._normalize(embedding), answer, time.time())
+        self._insert(entry)
+        self.backend.save(entry)
+        self._evict()
+
+    def close(self):
+        """Persist writes still queued; blocks, so call it off the event loop"""
+        self.backend.close()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _insert(self, entry):
+        self._entries[entry.key] = entry
+        self._created[entry.key] = entry.created_at
+        self._bytes += entry.size
+        self._matrix = None
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        del self._created[key]
+        self._bytes -= entry.size
+        self._matrix = None
+        return entry
+
+    def _expire(self):
+        """Drop expired entries; stops at the oldest one still fresh, so a lookup costs nothing when none are"""
+        cutoff = time.time() - self.ttl_seconds
+        while self._created:
+            key, created_at = next(iter(self._created.items()))
+            if created_at >= cutoff:
+                break
+            self._remove(key)
+            self.backend.delete(key)
+            self.evictions += 1
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, _ = next(iter(self._entries.items()))
+            self._remove(key)
+            self.backend.delete(key)
+            self.evictions += 1
+
+
+def create_semantic_cache(backend_name=SEMANTIC_CACHE_BACKEND):
+    """Build the configured cache, or None when caching is disabled"""
+    if backend_name == "none":
+        return None
+    if backend_name == "sqlite":
+        return SemanticCache(SQLiteCacheBackend())
+    if backend_name == "memory":
+        return SemanticCache(InMemoryCacheBackend())
+    raise ValueError(f"Unknown semantic cache backend: {backend_name}")
@@ -0,0 +1,376 @@
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+CHROMA_PAGE_SIZE = 5000
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "float16", "int8")
+# Rows dequantized per block when scoring a float16/int8 snapshot
+SCORE_BLOCK_ROWS = 65536
+# Queries scored together in one matrix product by search_mmr_batch; bounds the rows x queries score matrix
+QUERY_BLOCK_SIZE = 32
+# Published versions kept next to a snapshot path; the one before the current may still be opening somewhere
+SNAPSHOT_KEEP_VERSIONS = 2
+
+
+def maximal_marginal_relevance(query_scores, candidate_vectors, k, lambda_mult):
+    """Vectorized MMR over candidates; returns positions into the candidate array"""
+    n = len(query_scores)
+    if n == 0:
+        return []
+    pairwise = candidate_vectors @ candidate_vectors.T
+    first = int(np.argmax(query_scores))
+    selected = [first]
+    chosen = np.zeros(n, dtype=bool)
+    chosen[first] = True
+    max_redundancy = pairwise[first].copy()
+    while len(selected) < min(k, n):
+        scores = lambda_mult * query_scores - (1 - lambda_mult) * max_redundancy
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(max_redundancy, pairwise[best], out=max_redundancy)
+    return selected
+
+
+def write_string_blob(path, name, values):
+    """Write strings as one utf-8 blob plus an int64 offsets array"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+        for value in encoded:
+            f.write(value)
+    np.save(os.path.join(path, f"{name}_offsets.npy"), offsets)
+
+
+@contextlib.contextmanager
+def snapshot_lock(path, purpose="publish"):
+    """Exclusive lock across processes for one snapshot path"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{os.path.abspath(path)}.{purpose}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _fsync(path, directory=False):
+    fd = os.open(path, os.O_RDONLY | (os.O_DIRECTORY if directory else 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish_snapshot(path, write):
+    """Write a snapshot into a new version directory with write(directory), then atomically point path at it.
+
+    path is a symlink to the current version (<name>.v<ns> next to it). Files
+    of earlier versions are never rewritten, so processes that memory-mapped
+    them keep reading consistent data until they reopen path; see
+    snapshot_version. Older versions beyond SNAPSHOT_KEEP_VERSIONS are removed.
+    """
+    path = os.path.abspath(path)
+    parent, name = os.path.split(path)
+    with snapshot_lock(path):
+        version = f"{name}.v{time.time_ns()}"
+        directory = os.path.join(parent, version)
+        os.makedirs(directory)
+        try:
+            write(directory)
+            for entry in os.scandir(directory):
+                _fsync(entry.path)
+            _fsync(directory, directory=True)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        if os.path.isdir(path) and not os.path.islink(path):
+            # Snapshots written before versioning are plain directories; moved aside once, on first publish
+            os.rename(path, os.path.join(parent, f"{name}.v0"))
+        link = f"{path}.link-{os.getpid()}"
+        os.symlink(version, link)
+        os.replace(link, path)
+        _fsync(parent, directory=True)
+        versions = sorted(
+            (entry.name for entry in os.scandir(parent)
+             if entry.name.startswith(f"{name}.v") and entry.is_dir(follow_symlinks=False)),
+            key=lambda entry_name: int(entry_name.rsplit(".v", 1)[1]),
+        )
+        for old in versions[:-SNAPSHOT_KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(parent, old), ignore_errors=True)
+
+
+def snapshot_version(path):
+    """Identifies the version published at path; changes whenever publish_snapshot swaps in a new one"""
+    return os.path.realpath(path)
+
+
+class SnapshotStrings:
+    """Read-only sequence of strings backed by a memory-mapped blob"""
+
+    def __init__(self, path, name, decode=None):
+        self.offsets = np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(path, f"{name}.bin")
+        # np.memmap cannot map an empty file
+        if os.path.getsize(blob_path):
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        value = self.blob[start:end].tobytes().decode("utf-8")
+        return self.decode(value) if self.decode else value
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+class EpisodePartitions:
+    """Row numbers of an index grouped by episode, CSR style.
+
+    The rows of episode_ids[i] are rows[indptr[i]:indptr[i + 1]], so a filtered
+    search gathers its candidate rows without looking at any metadata.
+    """
+
+    def __init__(self, episode_ids, indptr, rows):
+        self.episode_ids = list(episode_ids)
+        self.indptr = indptr
+        self.rows = rows
+        self._positions = {episode_id: i for i, episode_id in enumerate(self.episode_ids)}
+
+    @classmethod
+    def build(cls, metadatas):
+        by_episode = {}
+        for row, metadata in enumerate(metadatas):
+            episode_id = (metadata or {}).get("episode_id") or (metadata or {}).get("source") or ""
+            by_episode.setdefault(episode_id, []).append(row)
+        episode_ids = sorted(by_episode)
+        indptr = np.zeros(len(episode_ids) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(by_episode[e]) for e in episode_ids])
+        rows = np.fromiter(
+            (row for episode_id in episode_ids for row in by_episode[episode_id]), dtype=np.int32, count=indptr[-1]
+        )
+        return cls(episode_ids, indptr, rows)
+
+    def save(self, path):
+        write_string_blob(path, "partition_ids", self.episode_ids)
+        np.save(os.path.join(path, "partition_indptr.npy"), self.indptr)
+        np.save(os.path.join(path, "partition_rows.npy"), self.rows)
+
+    @classmethod
+    def load(cls, path):
+        return cls(
+            SnapshotStrings(path, "partition_ids"),
+            np.load(os.path.join(path, "partition_indptr.npy")),
+            np.load(os.path.join(path, "partition_rows.npy"), mmap_mode="r"),
+        )
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "partition_rows.npy"))
+
+    def rows_for(self, episode_ids):
+        """Sorted rows of the given episodes"""
+        spans = [
+            self.rows[self.indptr[i]:self.indptr[i + 1]]
+            for i in (self._positions.get(episode_id) for episode_id in episode_ids)
+            if i is not None
+        ]
+        if not spans:
+            return np.zeros(0, dtype=np.int32)
+        return np.sort(np.concatenate(spans))
+
+
+class InMemoryVectorIndex:
+    """Whole-collection retriever over a contiguous, row-normalized embedding matrix.
+
+    Vectors are float32, or float16/int8 when loaded from a quantized snapshot
+    (int8 rows carry a float32 scale each).
+    """
+
+    def __init__(self, ids, vectors, documents, metadatas, scales=None, partitions=None):
+        self.ids = ids
+        self.vectors = vectors
+        self.documents = documents
+        self.metadatas = metadatas
+        self.scales = scales
+        self._partitions = partitions
+        # The published snapshot directory this was loaded from, if any
+        self.version = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefault(self):
+        """Read one byte of every page of the vectors so later searches don't wait on the disk"""
+        for array in (self.vectors, self.scales):
+            if array is not None and array.size:
+                np.asarray(array).reshape(-1).view(np.uint8)[::mmap.PAGESIZE].sum()
+
+    @classmethod
+    def from_chroma(cls, collection):
+        """Load every chunk of a chromadb collection into memory"""
+        ids, vectors, documents, metadatas = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=CHROMA_PAGE_SIZE,
+                offset=offset,
+            )
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+            documents.extend(page["documents"])
+            metadatas.extend(metadata or {} for metadata in page["metadatas"])
+            offset += len(page["ids"])
+        matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+        return cls(ids, matrix, documents, metadatas)
+
+    def save(self, path, dtype="float32"):
+        """Publish a snapshot whose arrays and string blobs are all np.memmap-able.
+
+        Safe while servers have the current one open (see publish_snapshot).
+        """
+        if dtype not in SNAPSHOT_DTYPES:
+            raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+        publish_snapshot(path, lambda directory: self._write(directory, dtype))
+
+    def _write(self, path, dtype):
+        vectors = self._dequantize(np.arange(len(self)))
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            np.save(os.path.join(path, "scales.npy"), scales.astype(np.float32))
+        else:
+            quantized = vectors.astype(dtype)
+        np.save(os.path.join(path, "vectors.npy"), quantized)
+        write_string_blob(path, "ids", self.ids)
+        write_string_blob(path, "documents", self.documents)
+        write_string_blob(path, "metadatas", (json.dumps(metadata) for metadata in self.metadatas))
+        self.partitions.save(path)
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "count": len(self),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "dtype": dtype,
+        }
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+    @classmethod
+    def load(cls, path):
+        """Open a snapshot; every array is memory-mapped so workers share the page cache"""
+        # Resolve the published version once, so a publish during loading cannot mix two versions
+        path = snapshot_version(path)
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {manifest['version']}")
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scales = None
+        if manifest["dtype"] == "int8":
+            scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        index = cls(
+            SnapshotStrings(path, "ids"),
+            vectors,
+            SnapshotStrings(path, "documents"),
+            SnapshotStrings(path, "metadatas", decode=json.loads),
+            scales=scales,
+            # Snapshots exported before partitions existed build them on first filtered search
+            partitions=EpisodePartitions.load(path) if EpisodePartitions.exists(path) else None,
+        )
+        index.version = path
+        return index
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    @property
+    def partitions(self):
+        if self._partitions is None:
+            self._partitions = EpisodePartitions.build(self.metadatas)
+        return self._partitions
+
+    def top_candidates(self, query_vector, fetch_k, rows=None):
+        """Exact top-fetch_k rows by cosine similarity, best first, optionally among `rows` only"""
+        if rows is None:
+            scores = self._scores(query_vector)
+        else:
+            # Only the allowed rows are gathered and scored
+            scores = self._dequantize(rows) @ query_vector
+        return self._best(scores, fetch_k, rows)
+
+    @staticmethod
+    def _best(scores, fetch_k, rows=None):
+        if fetch_k < len(scores):
+            top = np.argpartition(-scores, fetch_k)[:fetch_k]
+        else:
+            top = np.arange(len(scores))
+        order = top[np.argsort(-scores[top])]
+        return (order if rows is None else np.asarray(rows)[order]), scores[order]
+
+    def search_mmr(self, query_embedding, k=6, fetch_k=20, lambda_mult=0.5, episode_ids=None) -> List[Document]:
+        """MMR over the whole index, or over the chunks of episode_ids when given"""
+        return self.search_mmr_batch([query_embedding], k, fetch_k, lambda_mult, episode_ids)[0]
+
+    def search_mmr_batch(self, query_embeddings, k=6, fetch_k=20, lambda_mult=0.5, episode_ids=None):
+        """search_mmr for many queries, scoring QUERY_BLOCK_SIZE of them per pass over the matrix"""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        allowed = None if episode_ids is None else self.partitions.rows_for(episode_ids)
+        candidates = None if allowed is None else self._dequantize(allowed)
+        results = []
+        for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+            block = queries[start:start + QUERY_BLOCK_SIZE].T
+            scores = self._scores(block) if candidates is None else candidates @ block
+            for column in scores.T:
+                rows, row_scores = self._best(column, fetch_k, allowed)
+                picked = maximal_marginal_relevance(row_scores, self._dequantize(rows), k, lambda_mult)
+                results.append([self._document(int(rows[i])) for i in picked])
+        return results
+
+    def _scores(self, query_vectors):
+        """Similarity of every row to one query vector, or to each column of a (dim, n) matrix"""
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query_vectors
+        # BLAS has no float16/int8 kernels; upcast block by block to bound the temporary copy
+        scores = np.empty((len(self.vectors),) + query_vectors.shape[1:], dtype=np.float32)
+        for start in range(0, len(self.vectors), SCORE_BLOCK_ROWS):
+            block = self.vectors[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_BLOCK_ROWS] = block @ query_vectors
+        if self.scales is not None:
+            scores *= np.asarray(self.scales).reshape((-1,) + (1,) * (scores.ndim - 1))
+        return scores
+
+    def _dequantize(self, rows):
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= np.asarray(self.scales[rows])[:, None]
+        return vectors
+
+    def _document(self, row):
+        return Document(id=self.ids[row], page_content=self.documents[row], metadata=dict(self.metadatas[row]))
@@ -1,12 +1,22 @@
+import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from config import API_SETTINGS
-from app.services.firebase_service import FirebaseService
+from app.utils import metrics
+from app.utils.metrics import stage_timer
+from app.utils.token_cache import TokenCache
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+# Users with the eval role, allowed to run batch jobs over HTTP (comma-separated user ids)
+EVAL_USER_IDS = frozenset(user_id.strip() for user_id in os.getenv("EVAL_USER_IDS", "").split(",") if user_id.strip())
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
-firebase_service = FirebaseService()
+# Tokens already verified skip the signature check until they (or the TTL) expire
+token_cache = TokenCache(AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL_SECONDS)
+metrics.register_stats("huberman_auth_token_cache", token_cache.stats)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -16,16 +26,27 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    claims = token_cache.get(token)
+    if claims is not None:
+        return {"user_id": claims["user_id"]}
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, API_SETTINGS["JWT_SECRET"], algorithms=[API_SETTINGS["JWT_ALGORITHM"]])
+        with stage_timer("jwt_decode"):
+            payload = jwt.decode(token, API_SETTINGS["JWT_SECRET"], algorithms=[API_SETTINGS["JWT_ALGORITHM"]])
         user_id: str = payload.get("user_id")
         if user_id is None:
             raise credentials_exception
+        token_cache.put(token, {"user_id": user_id, "exp": payload.get("exp")})
         return {"user_id": user_id}
     except JWTError:
-        raise credentials_exception 
\ No newline at end of file
+        raise credentials_exception 
+
+async def get_eval_user(current_user: dict = Depends(get_current_user)):
+    """The current user, if they have the eval role; 403 otherwise"""
+    if current_user["user_id"] not in EVAL_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Batch jobs need the eval role")
+    return current_user
@@ -0,0 +1,8 @@
+import asyncio
+import functools
+
+
+async def run_blocking(executor, func, *args, **kwargs):
+    """Run a blocking call on a bounded thread pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
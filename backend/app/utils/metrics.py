@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from opentelemetry import trace
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "huberman-rag-api")
+
+tracer = trace.get_tracer("huberman-rag")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, [[0] * len(self.buckets), 0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, count, total) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    labels = _format_labels(self.label_names, label_values, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.label_names, label_values, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_count{labels} {count}")
+                lines.append(f"{self.name}_sum{labels} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class StatsGauges:
+    """Exposes every numeric value of a component's stats() dict as a gauge"""
+
+    def __init__(self, prefix, stats_fn):
+        self.prefix = prefix
+        self.stats_fn = stats_fn
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.stats_fn().items()):
+            if isinstance(value, (int, float)):
+                name = f"{self.prefix}_{key}"
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return lines
+
+
+_registry = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def register_stats(prefix, stats_fn):
+    return _register(StatsGauges(prefix, stats_fn))
+
+
+def render_metrics():
+    """Everything registered, in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+stage_duration = _register(Histogram(
+    "huberman_stage_duration_seconds",
+    "Time spent in each request stage",
+    ["stage"],
+))
+http_request_duration = _register(Histogram(
+    "huberman_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+))
+llm_tokens = _register(Counter(
+    "huberman_llm_tokens_total",
+    "Tokens reported by the LLM backend",
+    ["backend", "type"],
+))
+llm_request_tokens = _register(Histogram(
+    "huberman_llm_request_tokens",
+    "Prompt and completion tokens per LLM request",
+    ["type"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+))
+
+
+@contextmanager
+def stage_timer(stage, **attributes):
+    """Time a request stage into the stage histogram and an OpenTelemetry span"""
+    with tracer.start_as_current_span(stage, attributes=attributes) as span:
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            stage_duration.observe(time.perf_counter() - start, stage)
+
+
+def record_llm_usage(backend, usage, span=None):
+    """Count prompt/completion tokens from an OpenAI-style usage object"""
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens is None:
+            continue
+        llm_tokens.inc(tokens, backend, kind)
+        llm_request_tokens.observe(tokens, kind)
+        if span is not None:
+            span.set_attribute(f"llm.{kind}_tokens", tokens)
+
+
+def setup_tracing(app):
+    """Export spans over OTLP (e.g. to a local collector) when OTEL_ENABLED=true"""
+    if not OTEL_ENABLED:
+        return
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTEL_EXPORTER_OTLP_ENDPOINT, insecure=True)))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
@@ -0,0 +1,219 @@
+import asyncio
+import os
+import random
+import time
+
+# Consecutive failures that open a dependency's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+# First retry waits up to this long (full jitter), doubling for each later one
+RETRY_BACKOFF_SECONDS = float(os.getenv("UPSTREAM_RETRY_BACKOFF_SECONDS", "0.1"))
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency that has been failing; retry_after is in seconds"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, please retry later")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, name, deadline):
+        super().__init__(f"{name} did not respond within {deadline:g}s")
+        self.name = name
+        self.deadline = deadline
+
+
+class UpstreamFailed(Exception):
+    """A dependency failed every attempt; the last error is the cause"""
+
+    def __init__(self, name, error):
+        super().__init__(f"{name} failed: {str(error) or type(error).__name__}")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Fails fast while a dependency is down instead of waiting on it every time.
+
+    Closed: calls go through, and failure_threshold consecutive failures open
+    the circuit. Open: calls raise CircuitOpen for recovery_seconds. Then one
+    trial call is let through (half-open); success closes the circuit and
+    failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, recovery_seconds=CIRCUIT_RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._trial_running = False
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.recovery_seconds - time.monotonic())
+
+    def is_open(self):
+        """True while calls would be rejected without trying the dependency"""
+        return self.state == "open" and self.retry_after() > 0
+
+    def check(self):
+        """Raise CircuitOpen unless a call may go ahead now"""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.retry_after())
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_running:
+                self.rejected += 1
+                raise CircuitOpen(self.name, self.recovery_seconds)
+            self._trial_running = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self._trial_running = False
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """The call was abandoned (e.g. cancelled) without telling anything about the dependency"""
+        self._trial_running = False
+
+    def stats(self):
+        return {
+            "open": int(self.is_open()),
+            "consecutive_failures": self.consecutive_failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class Upstream:
+    """Deadline, jittered retries and a circuit breaker around calls to one dependency.
+
+    Each attempt gets `deadline` seconds. Errors listed in client_errors mean
+    the dependency answered but the request was bad; they are raised at once
+    and not held against it. With retry_errors given, only those errors are
+    retried and a missed deadline is not. Once attempts run out the call
+    raises DeadlineExceeded or UpstreamFailed.
+    """
+
+    def __init__(
+        self,
+        name,
+        deadline,
+        retries=0,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        recovery_seconds=CIRCUIT_RECOVERY_SECONDS,
+        backoff=RETRY_BACKOFF_SECONDS,
+        client_errors=(),
+        retry_errors=None,
+    ):
+        self.name = name
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.client_errors = tuple(client_errors)
+        self.retry_errors = None if retry_errors is None else tuple(retry_errors)
+        self.breaker = CircuitBreaker(name, failure_threshold, recovery_seconds)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retried = 0
+
+    async def call(self, factory, deadline=None):
+        """Await factory() under the deadline (or this call's own), retrying failures while the circuit stays closed"""
+        deadline = deadline or self.deadline
+        self.calls += 1
+        for attempt in range(self.retries + 1):
+            self.breaker.check()
+            try:
+                result = await asyncio.wait_for(factory(), deadline)
+            except self.client_errors:
+                self.breaker.record_success()
+                raise
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                error, cause = DeadlineExceeded(self.name, deadline), None
+            except Exception as e:
+                error, cause = UpstreamFailed(self.name, e), e
+            else:
+                self.breaker.record_success()
+                return result
+            self.failures += 1
+            self.breaker.record_failure()
+            if attempt == self.retries or self.breaker.is_open() or not self._retryable(cause):
+                raise error from cause
+            self.retried += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _retryable(self, cause):
+        if self.retry_errors is None:
+            return True
+        return cause is not None and isinstance(cause, self.retry_errors)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retried": self.retried,
+            **self.breaker.stats(),
+        }
+
+
+class Hedge:
+    """Sends a second identical request when the first is slow, and keeps whichever answers first.
+
+    Only for idempotent calls. With hedge_after of 0 every call is made once.
+    """
+
+    def __init__(self, hedge_after):
+        self.hedge_after = hedge_after
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def run(self, factory):
+        self.calls += 1
+        if self.hedge_after <= 0:
+            return await factory()
+        first = asyncio.ensure_future(factory())
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done:
+                return first.result()
+            self.hedged += 1
+            tasks.append(asyncio.ensure_future(factory()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_wins += task is not first
+                        return task.result()
+            # Both attempts failed; report the original one's error
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        return {"hedge_calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
@@ -0,0 +1,97 @@
+import asyncio
+
+
+class _Broadcast:
+    """Events from one producer, replayed to every subscriber from the start"""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            changed = self.changed
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one upstream call.
+
+    `do` shares the awaited result; `stream` shares an async iterator, with late
+    subscribers replaying what was already produced. A caller that goes away
+    does not cancel the shared work for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(self._calls, key, task))
+        else:
+            self.coalesced_calls += 1
+        return await asyncio.shield(task)
+
+    async def stream(self, key, fn):
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.upstream_calls += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            task = asyncio.ensure_future(self._produce(broadcast, fn))
+            task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+        else:
+            self.coalesced_calls += 1
+        async for event in broadcast.subscribe():
+            yield event
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+        }
+
+    async def _produce(self, broadcast, fn):
+        try:
+            async for event in fn():
+                broadcast.publish(event)
+        except Exception as e:
+            broadcast.finish(e)
+        else:
+            broadcast.finish()
+
+    @staticmethod
+    def _forget(calls, key, value):
+        if calls.get(key) is value:
+            del calls[key]
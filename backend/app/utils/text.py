@@ -0,0 +1,3 @@
+def normalize_query(text):
+    """Lowercase and collapse whitespace so trivially different queries share cache keys"""
+    return " ".join(text.lower().split())
@@ -0,0 +1,148 @@
+"""Answer an evaluation set in bulk and score throughput and quality together.
+
+Questions come from a text file (one per line) or JSONL with a "question"
+field and optionally "expected" (a reference answer) and "expected_episodes"
+(episode ids that should be cited). Each answer is written to --output as a
+JSON line with its scores, and a per-mode summary is printed at the end:
+answers/s, p50/p95 LLM latency, token F1 against the reference, cited
+episode recall and how often the model said it did not know.
+
+Runs in-process by default (needs the same API keys as the server), or
+against a running server's POST /api/chat/batch with --url and --token.
+
+Usage:
+    python batch_eval.py questions.jsonl --modes rag no_rag --output results.jsonl
+    python batch_eval.py questions.txt --url http://localhost:8000 --token <JWT>
+"""
+import argparse
+import asyncio
+import collections
+import json
+import re
+import sys
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORD_PATTERN = re.compile(r"\w+")
+DONT_KNOW_PATTERN = re.compile(r"\b(?:i don't know|i do not know|not sure|no information)\b", re.IGNORECASE)
+
+
+def load_questions(path):
+    items = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            items.append(json.loads(line) if path.endswith(".jsonl") else {"question": line})
+    return items
+
+
+def token_f1(answer, expected):
+    answer_tokens = collections.Counter(WORD_PATTERN.findall(answer.lower()))
+    expected_tokens = collections.Counter(WORD_PATTERN.findall(expected.lower()))
+    common = sum((answer_tokens & expected_tokens).values())
+    if not common:
+        return 0.0
+    precision = common / sum(answer_tokens.values())
+    recall = common / sum(expected_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def score(record, item):
+    """Quality fields for one answer; only those the evaluation item has references for"""
+    if record.get("answer") is None:
+        return {}
+    scores = {"dont_know": bool(DONT_KNOW_PATTERN.search(record["answer"]))}
+    if item.get("expected"):
+        scores["f1"] = token_f1(record["answer"], item["expected"])
+    if item.get("expected_episodes") and record["mode"] == "rag":
+        cited = {source["episode_id"] for source in record["sources"]}
+        expected = set(map(str, item["expected_episodes"]))
+        scores["episode_recall"] = len(cited & expected) / len(expected)
+    return scores
+
+
+async def local_records(questions, args):
+    from app import dependencies
+    from app.services.batch import run_batch
+
+    rag_service = dependencies.rag_service()
+    try:
+        async for record in run_batch(rag_service, questions, args.modes, concurrency=args.concurrency):
+            yield record
+    finally:
+        await rag_service.llm.close()
+
+
+async def remote_records(questions, args):
+    import httpx
+
+    payload = {"questions": questions, "modes": args.modes, "concurrency": args.concurrency}
+    headers = {"Authorization": f"Bearer {args.token}"}
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        async with client.stream("POST", "/api/chat/batch", json=payload, headers=headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+def print_summary(records, summary, file):
+    print(f"{'mode':<8} {'answers':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'f1':>6} {'recall':>7} {'dont_know':>10}", file=file)
+    by_mode = collections.defaultdict(list)
+    for record in records:
+        by_mode[record["mode"]].append(record)
+
+    def mean(mode_records, key):
+        values = [r["scores"][key] for r in mode_records if key in r["scores"]]
+        return f"{np.mean(values):.3f}" if values else "-"
+
+    for mode, mode_records in sorted(by_mode.items()):
+        answered = [r for r in mode_records if r["error"] is None]
+        latencies = [r["latency_ms"] for r in answered] or [0.0]
+        print(
+            f"{mode:<8} {len(answered):>8} {len(mode_records) - len(answered):>7} "
+            f"{np.percentile(latencies, 50):>9.1f} {np.percentile(latencies, 95):>9.1f} "
+            f"{mean(answered, 'f1'):>6} {mean(answered, 'episode_recall'):>7} {mean(answered, 'dont_know'):>10}",
+            file=file
+        )
+    if summary:
+        print(f"{summary['answers']} answers in {summary['seconds']}s ({summary['answers_per_second']}/s)", file=file)
+
+
+async def main(args):
+    items = load_questions(args.questions)
+    questions = [item["question"] for item in items]
+    records_source = remote_records(questions, args) if args.url else local_records(questions, args)
+    output = open(args.output, "w") if args.output else sys.stdout
+    records, summary = [], None
+    try:
+        async for record in records_source:
+            if "summary" in record:
+                summary = record["summary"]
+                continue
+            record["scores"] = score(record, items[record["index"]])
+            records.append(record)
+            output.write(json.dumps(record) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    # Keep stdout pure JSONL when answers are written there
+    print_summary(records, summary, sys.stderr if output is sys.stdout else sys.stdout)
+    return summary is not None and summary["errors"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="Text file with one question per line, or .jsonl")
+    parser.add_argument("--modes", nargs="+", choices=["rag", "no_rag"], default=["rag"])
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM calls")
+    parser.add_argument("--output", help="Write scored answers here instead of stdout")
+    parser.add_argument("--url", help="Use a running server instead of answering in-process")
+    parser.add_argument("--token", help="API token for --url")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,150 @@
+"""Microbenchmark of authentication overhead per request.
+
+Measures, in-process and without network access:
+  * get_current_user with an empty token cache (JWT signature check) and with a warm one
+  * a minimal authenticated FastAPI route against the same route without auth
+  * Firebase ID-token verification against locally cached Google certificates,
+    using a throwaway RSA key served by an httpx MockTransport, cold and warm
+
+Usage (from backend/):
+    python benchmarks/auth_benchmark.py --iterations 5000
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from benchmarks.e2e_benchmark import install_placeholder_config  # noqa: E402
+
+PROJECT_ID = "benchmark-project"
+
+
+def report(label, timings):
+    micros = np.asarray(timings) * 1e6
+    print(f"{label:<40} {np.percentile(micros, 50):>9.1f} {np.percentile(micros, 99):>9.1f}")
+
+
+async def time_calls(func, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        await func(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def signing_material():
+    """A throwaway RSA key and self-signed certificate standing in for Google's"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.benchmark")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return private_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def id_token(private_pem, uid):
+    from jose import jwt
+
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": uid,
+        "auth_time": now - 10,
+        "iat": now - 10,
+        "exp": now + 3600,
+    }
+    return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": "benchmark-key"})
+
+
+async def main(args):
+    install_placeholder_config()
+    from fastapi import Depends, FastAPI
+    from app.services.google_auth import FirebaseTokenVerifier
+    from app.utils import auth
+    from app.utils.token_cache import TokenCache
+
+    print(f"{'path':<40} {'p50 us':>9} {'p99 us':>9}")
+    tokens = [auth.create_access_token({"user_id": f"user-{i}"}) for i in range(args.iterations)]
+
+    auth.token_cache = TokenCache(0, 0)
+    report("get_current_user, no cache", await time_calls(lambda i: auth.get_current_user(tokens[i]), args.iterations))
+    auth.token_cache = TokenCache(args.iterations, 300)
+    for token in tokens:
+        await auth.get_current_user(token)
+    report("get_current_user, cached", await time_calls(lambda i: auth.get_current_user(tokens[i]), args.iterations))
+
+    app = FastAPI()
+
+    @app.get("/open")
+    async def open_route():
+        return {"ok": True}
+
+    @app.get("/private")
+    async def private_route(current_user: dict = Depends(auth.get_current_user)):
+        return {"ok": True}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        report("route without auth", await time_calls(lambda i: client.get("/open"), args.iterations))
+        auth.token_cache = TokenCache(0, 0)
+        report("route with auth, no cache", await time_calls(
+            lambda i: client.get("/private", headers={"Authorization": f"Bearer {tokens[i]}"}), args.iterations
+        ))
+        auth.token_cache = TokenCache(args.iterations, 300)
+        report("route with auth, cached", await time_calls(
+            lambda i: client.get("/private", headers={"Authorization": f"Bearer {tokens[i % 100]}"}), args.iterations
+        ))
+
+    private_pem, cert_pem = signing_material()
+
+    def certs_endpoint(request):
+        return httpx.Response(200, json={"benchmark-key": cert_pem}, headers={"Cache-Control": "public, max-age=3600"})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(certs_endpoint)) as http_client:
+        verifier = FirebaseTokenVerifier(PROJECT_ID, http_client)
+        count = max(args.iterations // 10, 10)
+        google_tokens = [id_token(private_pem, f"google-user-{i}") for i in range(count)]
+        start = time.perf_counter()
+        await verifier.verify(google_tokens[0])
+        report("ID token, cold (cert fetch)", [time.perf_counter() - start])
+        report("ID token, cached certs", await time_calls(lambda i: verifier.verify(google_tokens[i]), count))
+        cache = TokenCache(count, 300)
+
+        async def verify_cached(i):
+            claims = cache.get(google_tokens[i])
+            if claims is None:
+                cache.put(google_tokens[i], await verifier.verify(google_tokens[i]))
+
+        await time_calls(verify_cached, count)
+        report("ID token, verified-token cache", await time_calls(verify_cached, count))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
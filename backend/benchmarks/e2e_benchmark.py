@@ -0,0 +1,334 @@
+"""End-to-end API benchmark with in-process fakes for Firestore, embeddings and the LLM.
+
+Runs the real FastAPI app (routers, auth, write-behind history, RAG pipeline)
+over an httpx ASGI transport. FirebaseService is replaced by a dict-backed fake,
+and query embeddings are deterministic random vectors. The LLM is the bundled
+stub server, reached in-process. Retrieval runs against a synthetic corpus
+of each requested size, so its cost can be followed as the corpus grows.
+
+Reports requests/sec and p50/p95/p99 latency for login, /history, /message
+without RAG and /message with RAG, plus retrieval alone per corpus size, both
+over the whole corpus and filtered to one guest's episodes (1/20 of it).
+Save results with --json; pass them back with --baseline to exit non-zero
+when a p95 regresses by more than --tolerance.
+
+Usage (from backend/):
+    python benchmarks/e2e_benchmark.py --corpus-sizes 10000 100000
+    python benchmarks/e2e_benchmark.py --retriever chroma --corpus-sizes 10000 --dim 3072
+    python benchmarks/e2e_benchmark.py --corpus-sizes 1000000 --dtype int8 --json after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+# Same default as app.services.rag_service
+COLLECTION_NAME = "huberman_lab"
+
+
+def install_placeholder_config():
+    """config.py holds deployment secrets and is not in the repository; stand in for it when absent"""
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType("config")
+        config.firebase_config = {
+            "apiKey": "benchmark",
+            "authDomain": "benchmark.local",
+            "databaseURL": "",
+            "storageBucket": "",
+        }
+        config.API_SETTINGS = {
+            "JWT_SECRET": "benchmark",
+            "JWT_ALGORITHM": "HS256",
+            "ACCESS_TOKEN_EXPIRE_MINUTES": 60,
+        }
+        sys.modules["config"] = config
+
+
+def corpus_paths(root, size):
+    paths = {name: os.path.join(root, f"corpus-{size}", name) for name in ("chroma", "index", "bm25")}
+    paths["catalog"] = os.path.join(root, f"corpus-{size}", "episodes.json")
+    return paths
+
+
+def build_corpus(paths, size, args):
+    """Write the synthetic corpus where the selected retriever and BM25 expect it"""
+    import chromadb
+    from app.services.bm25_index import BM25Index
+    from app.services.episodes import EpisodeCatalog
+    from app.services.vector_index import InMemoryVectorIndex
+    from benchmarks.fakes import synthetic_catalog, synthetic_chunks
+
+    start = time.perf_counter()
+    collection = None
+    if args.retriever == "chroma":
+        client = chromadb.PersistentClient(path=paths["chroma"])
+        collection = client.get_or_create_collection(COLLECTION_NAME, embedding_function=None)
+    ids, vectors, documents, metadatas = [], [], [], []
+    for batch_ids, batch_vectors, batch_documents, batch_metadatas in synthetic_chunks(
+        size, args.dim, chunk_words=args.chunk_words
+    ):
+        if collection is not None:
+            collection.add(
+                ids=batch_ids, embeddings=batch_vectors, documents=batch_documents, metadatas=batch_metadatas
+            )
+        else:
+            vectors.append(batch_vectors)
+        ids.extend(batch_ids)
+        documents.extend(batch_documents)
+        metadatas.extend(batch_metadatas)
+    if collection is None:
+        InMemoryVectorIndex(ids, np.concatenate(vectors), documents, metadatas).save(paths["index"], args.dtype)
+    if not args.no_hybrid:
+        BM25Index.build(ids, documents, metadatas).save(paths["bm25"])
+    EpisodeCatalog(synthetic_catalog()).save(paths["catalog"])
+    print(f"Built {size} synthetic chunks ({args.retriever}) in {time.perf_counter() - start:.1f}s")
+
+
+def configure_environment(paths, args):
+    """Settings read at import time by the app modules"""
+    os.environ.update({
+        "RAG_RETRIEVER": args.retriever,
+        "RAG_CHROMA_PATH": paths["chroma"],
+        "RAG_INDEX_PATH": paths["index"],
+        "RAG_BM25_PATH": paths["bm25"],
+        "RAG_EPISODE_CATALOG_PATH": paths["catalog"],
+        "RAG_HYBRID": "false" if args.no_hybrid else "true",
+        "SEMANTIC_CACHE_BACKEND": "memory" if args.semantic_cache else "none",
+        "ANSWER_STORE_PATH": "",
+        "HISTORY_WAL_PATH": "",
+        # Throughput is measured with per-user budgets off; spike_benchmark.py exercises them
+        "RATE_LIMIT_BACKEND": "none",
+        "LLM_BACKEND": "stub",
+        "OPENAI_BASE_URL": "http://stub-llm/v1",
+    })
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+
+def use_corpus(service, rag_module, paths):
+    """Point an existing RAGService at another corpus"""
+    from app.services.episodes import EpisodeCatalog
+
+    rag_module.PATH_TO_DB = paths["chroma"]
+    rag_module.PATH_TO_INDEX = paths["index"]
+    rag_module.PATH_TO_BM25 = paths["bm25"]
+    if rag_module.RETRIEVER == "memory":
+        service.vector_index = service.initialize_vector_index()
+    else:
+        service.vector_store = service.initialize_vector_store()
+    service.bm25_index = service.initialize_bm25_index()
+    service.episode_catalog = EpisodeCatalog.load(paths["catalog"])
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(np.asarray(latencies) * 1000, q))
+
+
+async def run_scenario(name, corpus_size, send, args):
+    """Call send(i) args.requests times at args.concurrency; a response >= 400 counts as an error"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_request(i, record=True):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await send(i)
+                failed = response is not None and response.status_code >= 400
+            except Exception as e:
+                print(f"{name}: {type(e).__name__}: {e}")
+                failed = True
+            if record:
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+    await asyncio.gather(*(one_request(i, record=False) for i in range(args.warmup)))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(args.warmup + i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "corpus_size": corpus_size,
+        "rps": args.requests / elapsed,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "errors": errors,
+    }
+
+
+def print_result(result):
+    corpus = result["corpus_size"] or "-"
+    print(
+        f"{result['scenario']:<18} {corpus:>9} {result['rps']:>9.1f} {result['p50_ms']:>9.1f} "
+        f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['errors']:>7}"
+    )
+
+
+def regressions(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["corpus_size"]): r for r in json.load(f)["results"]}
+    found = []
+    for result in results:
+        before = baseline.get((result["scenario"], result["corpus_size"]))
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(
+                f"{result['scenario']} (corpus {result['corpus_size']}): "
+                f"p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms"
+            )
+    return found
+
+
+async def benchmark(args, root):
+    install_placeholder_config()
+    # Module-level settings (LLM_BACKEND, RAG_*) are read on first import, so set them before anything loads
+    configure_environment(corpus_paths(root, args.corpus_sizes[0]), args)
+    # The app opens the first corpus on import
+    build_corpus(corpus_paths(root, args.corpus_sizes[0]), args.corpus_sizes[0], args)
+
+    from benchmarks.fakes import FakeEmbeddings, FakeFirebaseService, create_fake_llm, synthetic_questions
+    from app import dependencies
+    from app.main import app
+    from app.services import rag_service as rag_module
+    from app.models.models import RetrievalFilters
+    from app.services.embedding_service import CachedEmbeddings
+    from app.utils.auth import create_access_token
+
+    firebase = FakeFirebaseService(latency_ms=args.firebase_latency_ms)
+    user_ids = firebase.seed_users(args.users, history_messages=args.history_messages)
+    dependencies.install(firebase_service=firebase)
+
+    service = dependencies.rag_service()
+    service.embeddings = CachedEmbeddings(FakeEmbeddings(args.dim, latency_ms=args.embedding_latency_ms))
+    if service.vector_store is not None:
+        service.vector_store = service.initialize_vector_store()
+    service.llm = create_fake_llm(
+        latency_ms=args.llm_latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+    )
+
+    tokens = [create_access_token(data={"user_id": user_id}) for user_id in user_ids]
+
+    def headers(i):
+        return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+    results = []
+    print(f"{'scenario':<18} {'corpus':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=args.timeout
+    ) as client:
+
+        async def login(i):
+            return await client.post(
+                "/api/auth/login",
+                json={"email": f"user{i % args.users}@bench.example.com", "password": "benchmark"},
+            )
+
+        async def history(i):
+            return await client.get("/api/chat/history", headers=headers(i))
+
+        def message(questions, use_rag):
+            async def send(i):
+                return await client.post(
+                    "/api/chat/message",
+                    json={"message": questions[i % len(questions)], "use_rag": use_rag},
+                    headers=headers(i),
+                )
+            return send
+
+        total = args.warmup + args.requests
+        for name, send in (
+            ("login", login),
+            ("history", history),
+            ("message_no_rag", message(synthetic_questions(total, seed=1), False)),
+        ):
+            results.append(await run_scenario(name, None, send, args))
+            print_result(results[-1])
+
+        for n, size in enumerate(args.corpus_sizes):
+            if n > 0:
+                build_corpus(corpus_paths(root, size), size, args)
+                use_corpus(service, rag_module, corpus_paths(root, size))
+            questions = synthetic_questions(total, seed=100 + n)
+            # Embedded up front, concurrently so they share micro-batches, to time retrieval alone
+            embeddings = await asyncio.gather(*(service.embed_query(q) for q in questions))
+
+            async def retrieve(i):
+                await service.retrieve(questions[i], embedding=embeddings[i])
+
+            results.append(await run_scenario("retrieval", size, retrieve, args))
+            print_result(results[-1])
+            one_guest = RetrievalFilters(guests=["Dr. Guest 7"])
+
+            async def retrieve_filtered(i):
+                await service.retrieve(questions[i], embedding=embeddings[i], filters=one_guest)
+
+            results.append(await run_scenario("retrieval_filtered", size, retrieve_filtered, args))
+            print_result(results[-1])
+            rag_questions = synthetic_questions(total, seed=200 + n)
+            results.append(await run_scenario("message_rag", size, message(rag_questions, True), args))
+            print_result(results[-1])
+
+    await service.llm.close()
+    return results
+
+
+def main(args):
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = asyncio.run(benchmark(args, args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="huberman-bench-") as root:
+            results = asyncio.run(benchmark(args, root))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        found = regressions(results, args.baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[10000], help="Synthetic chunks, e.g. 10000 1000000")
+    parser.add_argument("--retriever", choices=["memory", "chroma"], default="memory")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding size (production uses 3072)")
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default="float32", help="Snapshot dtype for --retriever memory")
+    parser.add_argument("--chunk-words", type=int, default=120)
+    parser.add_argument("--no-hybrid", action="store_true", help="Dense retrieval only, no BM25 index")
+    parser.add_argument("--semantic-cache", action="store_true", help="Keep the semantic answer cache enabled")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--history-messages", type=int, default=40, help="Messages already in each user's history")
+    parser.add_argument("--firebase-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--workdir", help="Keep synthetic corpora here instead of a temporary directory")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Results file from an earlier run to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown vs --baseline")
+    main(parser.parse_args())
@@ -0,0 +1,247 @@
+"""In-process stand-ins for Firestore, Firebase auth, the embedding API and Azure OpenAI.
+
+Used by e2e_benchmark.py to run the real FastAPI app and RAG pipeline with
+no network access. Each fake sleeps for a configurable latency so results
+stay comparable to production shapes without depending on them.
+"""
+import asyncio
+import datetime
+import hashlib
+import time
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from openai import AsyncOpenAI
+
+from app.services.firebase_service import (
+    FIRESTORE_CLIENT_ERRORS, FIRESTORE_DEADLINE_SECONDS, FIRESTORE_RETRIES, FirebaseService
+)
+from app.services.llm_backends import LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS, LLMBackend
+from app.utils.resilience import Upstream
+from app.utils.token_cache import TokenCache
+from stub_llm_server import create_stub_app
+
+# Vocabulary for synthetic chunks and questions, so BM25 and context building see realistic text
+TOPIC_WORDS = (
+    "sleep circadian sunlight morning dopamine serotonin cortisol melatonin caffeine adenosine "
+    "exercise zone cardio resistance training hypertrophy strength endurance recovery protein "
+    "fasting glucose insulin metabolism nutrition omega fish oil creatine magnesium zinc vitamin "
+    "focus attention motivation habit learning memory neuroplasticity stress breathing cold "
+    "exposure heat sauna testosterone estrogen hormone gut microbiome alcohol cannabis nicotine "
+    "meditation anxiety depression mood light temperature nap dreams rem deep tools protocol"
+).split()
+FILLER_WORDS = "the a of and to in is that for with on it as by can this your at from".split()
+SYNTHETIC_GUESTS = 20
+QUESTION_TEMPLATES = (
+    "How does {} affect {} and {} in the long term?",
+    "What protocol does Huberman recommend for {} {} and {}?",
+    "Explain the relationship between {} {} and {} according to the podcast",
+    "Which tools improve {} while reducing {} and {}?",
+)
+
+
+def _seeded_unit_vector(text, dim):
+    # Same scheme as stub_llm_server, so repeated texts embed identically
+    seed = int.from_bytes(hashlib.sha256(str(text).encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic random unit vectors after a fixed per-request latency"""
+
+    def __init__(self, dim, latency_ms=50.0):
+        self.dim = dim
+        self.latency = latency_ms / 1000
+        self.requests = 0
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        self.requests += 1
+        return [_seeded_unit_vector(text, self.dim).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        self.requests += 1
+        return [_seeded_unit_vector(text, self.dim).tolist() for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+def create_fake_llm(
+    latency_ms=300.0,
+    tokens_per_second=60.0,
+    completion_tokens=200,
+    max_concurrency=64,
+    max_queue=LLM_MAX_QUEUE,
+    queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+    wrap_transport=None,
+):
+    """An LLMBackend whose OpenAI client talks to stub_llm_server over an in-process ASGI transport.
+
+    wrap_transport, if given, wraps that transport (e.g. to inject faults).
+    """
+    stub = create_stub_app(latency_ms, tokens_per_second, completion_tokens)
+    transport = httpx.ASGITransport(app=stub)
+    if wrap_transport is not None:
+        transport = wrap_transport(transport)
+    client = AsyncOpenAI(
+        base_url="http://stub-llm/v1",
+        api_key="stub",
+        http_client=httpx.AsyncClient(transport=transport, base_url="http://stub-llm"),
+        max_retries=0,
+    )
+    return LLMBackend(
+        "stub", client, "stub", max_concurrency=max_concurrency, max_queue=max_queue, queue_timeout=queue_timeout
+    )
+
+
+class FakeFirebaseService(FirebaseService):
+    """FirebaseService backed by dicts instead of Firestore and Firebase auth.
+
+    Only the network calls are replaced; message validation, the
+    (messages, next_cursor) paging contract and the deadline, retries and
+    circuit breaker around each Firestore round trip are the real ones.
+    """
+
+    def __init__(self, latency_ms=20.0):
+        self.latency = latency_ms / 1000
+        self.users = {}
+        self.histories = {}
+        self.id_token_cache = TokenCache(0, 0)
+        self._migrated_users = set()
+        self.firestore = Upstream(
+            "firestore", FIRESTORE_DEADLINE_SECONDS, FIRESTORE_RETRIES, client_errors=FIRESTORE_CLIENT_ERRORS
+        )
+
+    async def _round_trip(self):
+        """Stands in for one Firestore request"""
+        await asyncio.sleep(self.latency)
+
+    def seed_users(self, count, history_messages=0):
+        """Create users user{i}@bench.example.com (password "benchmark") with alternating history"""
+        user_ids = []
+        for i in range(count):
+            user_id = f"bench-user-{i}"
+            self.users[f"user{i}@bench.example.com"] = ("benchmark", user_id)
+            self.histories[user_id] = [
+                {
+                    "role": "user" if seq % 2 == 0 else "assistant",
+                    "content": f"Earlier message {seq} about {TOPIC_WORDS[seq % len(TOPIC_WORDS)]}",
+                    "seq": seq,
+                }
+                for seq in range(history_messages)
+            ]
+            user_ids.append(user_id)
+        return user_ids
+
+    async def create_user(self, email, password):
+        await asyncio.sleep(self.latency)
+        if email in self.users:
+            raise ValueError("EMAIL_EXISTS")
+        user_id = f"bench-user-{len(self.users)}"
+        self.users[email] = (password, user_id)
+        self.histories[user_id] = []
+        return {"localId": user_id, "email": email, "idToken": f"id-token-{user_id}"}
+
+    async def login_user(self, email, password):
+        await asyncio.sleep(self.latency)
+        stored = self.users.get(email)
+        if stored is None or stored[0] != password:
+            raise ValueError("INVALID_LOGIN_CREDENTIALS")
+        return {"localId": stored[1], "email": email, "idToken": f"id-token-{stored[1]}"}
+
+    async def verify_token(self, id_token):
+        await asyncio.sleep(self.latency)
+        return {"uid": id_token.removeprefix("id-token-"), "email": ""}
+
+    async def get_chat_history(self, user_id, limit=50, cursor=None):
+        await self.firestore.call(self._round_trip)
+        messages = self.histories.get(user_id, [])
+        if cursor is not None:
+            messages = [m for m in messages if m["seq"] < int(cursor)]
+        page = messages[-limit:]
+        next_cursor = str(page[0]["seq"]) if len(page) == limit else None
+        return self._validate_messages([dict(m) for m in page]), next_cursor
+
+    async def save_many(self, messages_by_user):
+        for messages in messages_by_user.values():
+            for message in messages:
+                if not self._is_valid_message(message):
+                    raise ValueError("Invalid message format. Must have 'role' and 'content' fields")
+        await self.firestore.call(self._round_trip)
+        base_seq = time.time_ns()
+        for user_id, messages in messages_by_user.items():
+            history = self.histories.setdefault(user_id, [])
+            for offset, message in enumerate(messages):
+                history.append({
+                    "role": message["role"],
+                    "content": message["content"],
+                    "seq": message.get("seq", base_seq + offset),
+                })
+            history.sort(key=lambda m: m["seq"])
+
+    async def migrate_legacy_history(self, user_id):
+        return None
+
+    async def prefetch_certs(self):
+        return None
+
+    async def close(self):
+        return None
+
+
+def synthetic_chunks(size, dim, chunk_words=120, episodes=200, seed=0, batch_size=5000):
+    """Yield (ids, vectors, documents, metadatas) batches of a random corpus.
+
+    Vectors are unit-normalized float32; documents mix topic and filler words
+    so term statistics resemble transcript chunks.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(TOPIC_WORDS + FILLER_WORDS * 3)
+    for start in range(0, size, batch_size):
+        count = min(batch_size, size - start)
+        vectors = rng.standard_normal((count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        picks = words[rng.integers(0, len(words), (count, chunk_words))]
+        documents = [" ".join(row) for row in picks]
+        ids = [f"chunk-{i}" for i in range(start, start + count)]
+        metadatas = [
+            {
+                "source": f"episode_{i % episodes:04d}.txt",
+                "chunk_index": i // episodes,
+                "start_index": 0,
+                **synthetic_episode(i % episodes),
+            }
+            for i in range(start, start + count)
+        ]
+        yield ids, vectors, documents, metadatas
+
+
+def synthetic_episode(number):
+    """Episode metadata as ingestion writes it: one of SYNTHETIC_GUESTS guests, weekly dates"""
+    return {
+        "episode_id": str(number),
+        "title": f"Episode #{number}",
+        "guest": f"Dr. Guest {number % SYNTHETIC_GUESTS}",
+        "date": (datetime.date(2021, 1, 4) + datetime.timedelta(weeks=number)).isoformat(),
+    }
+
+
+def synthetic_catalog(episodes=200):
+    return {str(number): synthetic_episode(number) for number in range(episodes)}
+
+
+def synthetic_questions(count, seed=1):
+    rng = np.random.default_rng(seed)
+    questions = []
+    for i in range(count):
+        template = QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)]
+        topics = rng.choice(TOPIC_WORDS, size=3, replace=False)
+        questions.append(template.format(*topics))
+    return questions
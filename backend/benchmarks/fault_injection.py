@@ -0,0 +1,334 @@
+"""Fault injection against the deadlines, hedging, circuit breakers and degraded modes.
+
+Runs the real app in-process with the same fakes as e2e_benchmark.py, wrapped
+so each dependency can be made to hang, fail, or (embeddings) answer every
+other request slowly. Scenarios, each followed by healing the dependency and
+waiting out its circuit:
+
+  healthy            everything answers; no response is degraded
+  embedding_slow     hedged requests hide a slow tail
+  embedding_down     answers use lexical retrieval only ("embedding")
+  retrieval_hang     answers come without context ("retrieval"), streams too
+  llm_hang           504 after the deadline, then fast 503s once the circuit opens
+  llm_down           502 while retries fail, then 503s, then answers again once the LLM heals
+  firestore_down     answers without history ("history"); the queue is bounded
+                     and drains once Firestore is back
+  firestore_hang     history reads give up at the deadline
+
+Exits non-zero if any request gets a 500, takes longer than --max-latency,
+or a scenario's expected behaviour is not observed.
+
+Usage (from backend/):
+    python benchmarks/fault_injection.py
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from benchmarks.e2e_benchmark import (  # noqa: E402
+    build_corpus,
+    configure_environment,
+    corpus_paths,
+    install_placeholder_config,
+)
+
+
+class InjectedFault(Exception):
+    pass
+
+
+class Faults:
+    """Current fault per dependency: None, "hang", "error" or "slow_tail" (every other call hangs)"""
+
+    def __init__(self, hang_seconds):
+        self.hang_seconds = hang_seconds
+        self.modes = {}
+        self.calls = collections.Counter()
+
+    def set(self, name, mode):
+        self.modes[name] = mode
+
+    def _hangs(self, name):
+        mode = self.modes.get(name)
+        self.calls[name] += 1
+        if mode == "error":
+            raise InjectedFault(f"injected {name} failure")
+        return mode == "hang" or (mode == "slow_tail" and self.calls[name] % 2 == 1)
+
+    async def apply(self, name):
+        if self._hangs(name):
+            await asyncio.sleep(self.hang_seconds)
+
+    def apply_blocking(self, name):
+        if self._hangs(name):
+            time.sleep(self.hang_seconds)
+
+
+class FaultyIndex:
+    """Vector or BM25 index whose searches pass through the "retrieval" fault first"""
+
+    def __init__(self, index, faults):
+        self.index = index
+        self.faults = faults
+
+    def __getattr__(self, name):
+        attr = getattr(self.index, name)
+        if not name.startswith("search"):
+            return attr
+
+        def search(*args, **kwargs):
+            self.faults.apply_blocking("retrieval")
+            return attr(*args, **kwargs)
+
+        return search
+
+
+class FaultyTransport(httpx.AsyncBaseTransport):
+    """Transport to the stub LLM that hangs or answers 500 when told to"""
+
+    def __init__(self, transport, faults):
+        self.transport = transport
+        self.faults = faults
+
+    async def handle_async_request(self, request):
+        try:
+            await self.faults.apply("llm")
+        except InjectedFault as e:
+            return httpx.Response(500, json={"error": {"message": str(e)}})
+        return await self.transport.handle_async_request(request)
+
+
+def summarize(label, outcomes):
+    statuses = collections.Counter(status for status, _, _ in outcomes)
+    latencies = np.asarray([latency for _, latency, _ in outcomes]) * 1000
+    degraded = collections.Counter(name for _, _, body in outcomes for name in body.get("degraded", []))
+    counts = " ".join(f"{status}:{count}" for status, count in sorted(statuses.items()))
+    flags = " ".join(f"{name}:{count}" for name, count in sorted(degraded.items())) or "-"
+    print(
+        f"{label:<16} {counts:<16} p50 {np.percentile(latencies, 50):>7.1f} ms  "
+        f"p95 {np.percentile(latencies, 95):>7.1f} ms  degraded {flags}"
+    )
+    return statuses
+
+
+async def run(args, root):
+    install_placeholder_config()
+    paths = corpus_paths(root, args.corpus_size)
+    configure_environment(paths, args)
+    # Short deadlines and quick recovery so every scenario finishes in seconds
+    os.environ.update({
+        "RAG_EMBEDDING_TIMEOUT_SECONDS": "0.5",
+        "EMBEDDING_HEDGE_AFTER_MS": "100",
+        "RAG_RETRIEVAL_DEADLINE_SECONDS": "0.5",
+        "LLM_DEADLINE_SECONDS": "1.0",
+        "LLM_MIN_TOKENS_PER_SECOND": "100000",
+        "LLM_RETRIES": "1",
+        "FIRESTORE_DEADLINE_SECONDS": "0.3",
+        "FIRESTORE_RETRIES": "1",
+        "CIRCUIT_FAILURE_THRESHOLD": "3",
+        "CIRCUIT_RECOVERY_SECONDS": str(args.recovery_seconds),
+        "HISTORY_MAX_QUEUE": str(args.history_max_queue),
+        "HISTORY_MAX_BACKOFF_SECONDS": "0.5",
+        # Read history on every request so Firestore faults reach the request path
+        "CONVERSATION_TTL_SECONDS": "0",
+    })
+    build_corpus(paths, args.corpus_size, args)
+
+    from benchmarks.fakes import FakeEmbeddings, FakeFirebaseService, create_fake_llm, synthetic_questions
+    from app import dependencies
+    from app.main import app
+    from app.services.embedding_service import CachedEmbeddings
+    from app.utils.auth import create_access_token
+
+    faults = Faults(args.hang_seconds)
+
+    class FaultyEmbeddings(FakeEmbeddings):
+        async def aembed_documents(self, texts):
+            await faults.apply("embedding")
+            return await super().aembed_documents(texts)
+
+    class FaultyFirebaseService(FakeFirebaseService):
+        async def _round_trip(self):
+            await faults.apply("firestore")
+            await super()._round_trip()
+
+    firebase = FaultyFirebaseService(latency_ms=5)
+    user_ids = firebase.seed_users(args.users, history_messages=4)
+    dependencies.install(firebase_service=firebase)
+    service = dependencies.rag_service()
+    service.embeddings = CachedEmbeddings(FaultyEmbeddings(args.dim, latency_ms=10))
+    service.vector_index = FaultyIndex(service.vector_index, faults)
+    service.bm25_index = FaultyIndex(service.bm25_index, faults)
+    service.llm = create_fake_llm(
+        latency_ms=50,
+        tokens_per_second=1000,
+        completion_tokens=50,
+        wrap_transport=lambda transport: FaultyTransport(transport, faults),
+    )
+    history_writer = dependencies.history_writer()
+    tokens = [create_access_token(data={"user_id": user_id}) for user_id in user_ids]
+    questions = iter(synthetic_questions(10000, seed=11))
+    failures = []
+    all_outcomes = []
+
+    def expect(condition, message):
+        if not condition:
+            failures.append(message)
+
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://faults", timeout=args.hang_seconds * 4
+    ) as client:
+
+        async def timed(method, url, user, **kwargs):
+            start = time.perf_counter()
+            response = await client.request(
+                method, url, headers={"Authorization": f"Bearer {tokens[user % len(tokens)]}"}, **kwargs
+            )
+            latency = time.perf_counter() - start
+            body = response.json() if response.headers.get("content-type") == "application/json" else {}
+            all_outcomes.append((url, response.status_code, latency))
+            return response.status_code, latency, body
+
+        async def messages(label, count, concurrency=1):
+            """count /message calls, `concurrency` at a time, each with a new question"""
+            outcomes = []
+            for start in range(0, count, concurrency):
+                outcomes += await asyncio.gather(*(
+                    timed("POST", "/api/chat/message", user, json={"message": next(questions)})
+                    for user in range(start, min(start + concurrency, count))
+                ))
+            return summarize(label, outcomes), outcomes
+
+        async def heal(name):
+            faults.set(name, None)
+            await asyncio.sleep(args.recovery_seconds + 0.2)
+
+        def degraded_all(outcomes, name):
+            return all(name in body.get("degraded", []) for status, _, body in outcomes if status == 200)
+
+        statuses, outcomes = await messages("healthy", 8)
+        expect(statuses.get(200) == 8, "healthy: not every request succeeded")
+        expect(not any(body.get("degraded") for _, _, body in outcomes), "healthy: answers were degraded")
+
+        faults.set("embedding", "slow_tail")
+        statuses, outcomes = await messages("embedding_slow", 8)
+        hedge = service.embeddings.hedge.stats()
+        expect(statuses.get(200) == 8, "embedding_slow: not every request succeeded")
+        expect(hedge["hedge_wins"] > 0, f"embedding_slow: no hedged request won ({hedge})")
+        expect(
+            max(latency for _, latency, _ in outcomes) < args.hang_seconds / 2,
+            "embedding_slow: a slow embedding was waited for despite hedging"
+        )
+        expect(not any(body.get("degraded") for _, _, body in outcomes), "embedding_slow: answers were degraded")
+        await heal("embedding")
+
+        faults.set("embedding", "error")
+        statuses, outcomes = await messages("embedding_down", 8)
+        expect(statuses.get(200) == 8, "embedding_down: not every request succeeded")
+        expect(degraded_all(outcomes, "embedding"), "embedding_down: answers not marked degraded")
+        expect(all(body.get("sources") for _, _, body in outcomes), "embedding_down: lexical retrieval found nothing")
+        expect(service.embedding_upstream.breaker.opens > 0, "embedding_down: circuit never opened")
+        await heal("embedding")
+
+        faults.set("retrieval", "hang")
+        statuses, outcomes = await messages("retrieval_hang", 8)
+        expect(statuses.get(200) == 8, "retrieval_hang: not every request succeeded")
+        expect(degraded_all(outcomes, "retrieval"), "retrieval_hang: answers not marked degraded")
+        expect(service.retrieval_upstream.breaker.rejected > 0, "retrieval_hang: circuit never failed fast")
+        async with client.stream(
+            "POST", "/api/chat/message/stream", json={"message": next(questions)},
+            headers={"Authorization": f"Bearer {tokens[0]}"}
+        ) as response:
+            events = [line async for line in response.aiter_lines() if line.startswith("event: ")]
+        expect("event: degraded" in events and "event: done" in events, f"retrieval_hang: stream events {events}")
+        # Searches still sleeping on the retrieval pool finish before the next scenario
+        await asyncio.sleep(args.hang_seconds)
+        await heal("retrieval")
+
+        faults.set("llm", "hang")
+        statuses, outcomes = await messages("llm_hang", 6)
+        expect(statuses.get(504, 0) > 0, "llm_hang: no request hit the deadline")
+        expect(statuses.get(503, 0) > 0, "llm_hang: circuit never opened")
+        fast_503 = [latency for status, latency, _ in outcomes if status == 503]
+        expect(max(fast_503, default=0) < 0.5, "llm_hang: 503s were not immediate")
+        await heal("llm")
+
+        faults.set("llm", "error")
+        statuses, _ = await messages("llm_down", 6)
+        expect(statuses.get(502, 0) > 0, "llm_down: provider errors were not reported as 502")
+        expect(statuses.get(503, 0) > 0, "llm_down: circuit never opened")
+        await heal("llm")
+        statuses, _ = await messages("llm_recovered", 4)
+        expect(statuses.get(200) == 4, "llm_recovered: answers did not resume after the circuit's recovery time")
+
+        await asyncio.sleep(0.5)
+        flushed_before = history_writer.flushed_messages
+        faults.set("firestore", "error")
+        statuses, outcomes = await messages("firestore_down", 12)
+        history_status, _, _ = await timed("GET", "/api/chat/history", 0)
+        print(f"{'':<16} /history while down: {history_status}; queue {history_writer.stats()}")
+        expect(statuses.get(200) == 12, "firestore_down: not every request succeeded")
+        expect(degraded_all(outcomes, "history"), "firestore_down: answers not marked degraded")
+        expect(history_status in (503, 504), f"firestore_down: /history returned {history_status}")
+        expect(history_writer.dropped > 0, "firestore_down: history queue was not bounded")
+        expect(history_writer.depth <= args.history_max_queue, "firestore_down: queue grew past its limit")
+        await heal("firestore")
+        deadline = time.perf_counter() + 10
+        while history_writer.depth and time.perf_counter() < deadline:
+            await asyncio.sleep(0.2)
+        expect(history_writer.depth == 0, "firestore_down: queued messages were not written after recovery")
+        expect(history_writer.flushed_messages > flushed_before, "firestore_down: nothing was written after recovery")
+
+        faults.set("firestore", "hang")
+        statuses, outcomes = await messages("firestore_hang", 4)
+        expect(statuses.get(200) == 4, "firestore_hang: not every request succeeded")
+        expect(degraded_all(outcomes, "history"), "firestore_hang: answers not marked degraded")
+        faults.set("firestore", None)
+
+        upstreams = (service.llm.upstream, service.embedding_upstream, service.retrieval_upstream, firebase.firestore)
+        for upstream in upstreams:
+            print(f"{upstream.name:<16} {upstream.stats()}")
+
+    await service.llm.close()
+
+    for url, status, latency in all_outcomes:
+        if status == 500:
+            failures.append(f"{url} returned 500")
+        if latency > args.max_latency:
+            failures.append(f"{url} took {latency:.1f}s")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return not failures
+
+
+def main(args):
+    with tempfile.TemporaryDirectory(prefix="huberman-faults-") as root:
+        ok = asyncio.run(run(args, root))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hang-seconds", type=float, default=3.0, help="How long a hung dependency takes")
+    parser.add_argument(
+        "--max-latency", type=float, default=3.0,
+        help="No request may take longer; every deadline and retry together stay under it"
+    )
+    parser.add_argument("--recovery-seconds", type=float, default=1.0)
+    parser.add_argument("--history-max-queue", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=64)
+    # Corpus and environment settings shared with e2e_benchmark.py
+    parser.set_defaults(retriever="memory", dtype="float32", chunk_words=120, no_hybrid=False, semantic_cache=False)
+    main(parser.parse_args())
@@ -0,0 +1,103 @@
+"""Offline recall/latency comparison of dense, lexical (BM25) and hybrid retrieval.
+
+Each query is a random window of words cut from a random chunk; that chunk is
+the relevant result. Query embeddings are computed once with the production
+embedding model and cached in --embedding-cache, so later runs make no API
+calls. Needs the vector snapshot (export_snapshot.py) and BM25 index (ingest.py).
+
+Usage (from backend/):
+    python benchmarks/hybrid_benchmark.py --queries 300 --k 6
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion  # noqa: E402
+from app.services.vector_index import InMemoryVectorIndex  # noqa: E402
+
+# Same defaults as app.services.rag_service, which is not imported to avoid creating API clients
+PATH_TO_INDEX = "../db/index"
+PATH_TO_BM25 = "../db/bm25"
+
+
+def make_queries(bm25_index, count, words, seed=0):
+    rng = np.random.default_rng(seed)
+    queries = []
+    while len(queries) < count:
+        row = int(rng.integers(len(bm25_index)))
+        tokens = bm25_index.documents[row].split()
+        if len(tokens) < words:
+            continue
+        start = int(rng.integers(len(tokens) - words + 1))
+        queries.append((" ".join(tokens[start:start + words]), bm25_index.ids[row]))
+    return queries
+
+
+def load_query_embeddings(queries, cache_path):
+    if os.path.exists(cache_path):
+        embeddings = np.load(cache_path)
+        if len(embeddings) == len(queries):
+            return embeddings
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+
+    load_dotenv()
+    model = OpenAIEmbeddings(model="text-embedding-3-large", tiktoken_model_name="cl100k_base")
+    embeddings = np.asarray(model.embed_documents([text for text, _ in queries]), dtype=np.float32)
+    np.save(cache_path, embeddings)
+    return embeddings
+
+
+def main(args):
+    vector_index = InMemoryVectorIndex.load(args.index)
+    bm25_index = BM25Index.load(args.bm25)
+    queries = make_queries(bm25_index, args.queries, args.words)
+    embeddings = load_query_embeddings(queries, args.embedding_cache)
+
+    results = {name: {"hits": 0, "times": []} for name in ("dense", "lexical", "hybrid")}
+    for (text, relevant_id), embedding in zip(queries, embeddings):
+        start = time.perf_counter()
+        dense = vector_index.search_mmr(embedding, k=args.k, fetch_k=args.fetch_k)
+        dense_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lexical = bm25_index.search(text, args.fetch_k)
+        lexical_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hybrid = reciprocal_rank_fusion([dense, lexical])[:args.k]
+        fusion_time = time.perf_counter() - start
+
+        for name, docs, elapsed in (
+            ("dense", dense, dense_time),
+            ("lexical", lexical[:args.k], lexical_time),
+            ("hybrid", hybrid, dense_time + lexical_time + fusion_time),
+        ):
+            results[name]["hits"] += any(doc.id == relevant_id for doc in docs)
+            results[name]["times"].append(elapsed)
+
+    print(f"{len(queries)} queries over {len(bm25_index)} chunks (dense latency excludes the embedding call)")
+    print(f"{'method':<8} {f'recall@{args.k}':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, result in results.items():
+        times = np.asarray(result["times"]) * 1000
+        print(
+            f"{name:<8} {result['hits'] / len(queries):>10.3f} "
+            f"{np.percentile(times, 50):>8.2f} {np.percentile(times, 95):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=PATH_TO_INDEX)
+    parser.add_argument("--bm25", default=PATH_TO_BM25)
+    parser.add_argument("--embedding-cache", default="../db/hybrid_benchmark_queries.npy")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--words", type=int, default=8, help="Words per query window")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""Concurrency load test for a running Huberman RAG API.
+
+Fires the same number of requests at increasing concurrency levels and
+reports throughput. With a non-blocking request path, requests/sec should
+grow with concurrency until an upstream limit is hit; if it stays flat, some
+route is still serializing on the event loop.
+
+Usage:
+    python benchmarks/load_test.py --token <JWT> --endpoint /api/chat/history
+    python benchmarks/load_test.py --token <JWT> --endpoint /api/chat/message \
+        --message "How can I improve my sleep?" --requests 32
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def _run_level(client, args, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            if args.message is None:
+                response = await client.get(args.endpoint)
+            else:
+                response = await client.post(
+                    args.endpoint,
+                    json={"message": args.message, "use_rag": not args.no_rag},
+                )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "rps": args.requests / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "max": latencies[-1],
+        "errors": errors,
+    }
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(
+        base_url=args.base_url, headers=headers, limits=limits, timeout=args.timeout
+    ) as client:
+        baseline = None
+        print(f"{'conc':>5} {'req/s':>9} {'p50 (s)':>9} {'max (s)':>9} {'errors':>7} {'speedup':>8}")
+        for concurrency in args.concurrency:
+            result = await _run_level(client, args, concurrency)
+            baseline = baseline or result["rps"]
+            print(
+                f"{result['concurrency']:>5} {result['rps']:>9.2f} {result['p50']:>9.3f} "
+                f"{result['max']:>9.3f} {result['errors']:>7} {result['rps'] / baseline:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", help="JWT returned by /api/auth/login")
+    parser.add_argument("--endpoint", default="/api/chat/history")
+    parser.add_argument("--message", help="Send POST requests with this chat message")
+    parser.add_argument("--no-rag", action="store_true")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(parser.parse_args()))
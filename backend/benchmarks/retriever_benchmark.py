@@ -0,0 +1,107 @@
+"""Compare the Chroma MMR path with the in-memory vectorized retriever.
+
+Queries are perturbed copies of stored chunk embeddings, so no embedding
+API calls are needed. Reports per-query latency for both paths plus two
+recall checks. The in-memory search is exact, so it is the ground truth for
+Chroma's approximate HNSW candidates; the final MMR picks are compared too.
+
+Usage (from backend/):
+    python benchmarks/retriever_benchmark.py                      # ../db/chroma
+    python benchmarks/retriever_benchmark.py --synthetic 50000    # random corpus
+"""
+import argparse
+import os
+import sys
+import time
+
+import chromadb
+import numpy as np
+from langchain_chroma import Chroma
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.vector_index import InMemoryVectorIndex  # noqa: E402
+
+# Same defaults as app.services.rag_service, which is not imported to avoid creating API clients
+PATH_TO_DB = "../db/chroma"
+COLLECTION_NAME = "huberman_lab"
+
+
+def synthetic_collection(client, size, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    collection = client.get_or_create_collection(COLLECTION_NAME, embedding_function=None)
+    batch = 5000
+    for start in range(0, size, batch):
+        count = min(batch, size - start)
+        vectors = rng.standard_normal((count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, start + count)],
+            embeddings=vectors,
+            documents=[f"synthetic chunk {i}" for i in range(start, start + count)],
+        )
+    return collection
+
+
+def percentile(values, q):
+    return float(np.percentile(np.asarray(values) * 1000, q))
+
+
+def main(args):
+    if args.synthetic:
+        client = chromadb.EphemeralClient()
+        collection = synthetic_collection(client, args.synthetic, args.dim)
+    else:
+        client = chromadb.PersistentClient(path=args.db)
+        collection = client.get_collection(COLLECTION_NAME)
+    vector_store = Chroma(client=client, collection_name=collection.name)
+
+    start = time.perf_counter()
+    index = InMemoryVectorIndex.from_chroma(collection)
+    print(f"Loaded {len(index)} chunks into memory in {time.perf_counter() - start:.2f}s")
+
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(index), size=min(args.queries, len(index)), replace=False)
+    queries = np.asarray(index.vectors[rows]) + args.noise * rng.standard_normal((len(rows), index.vectors.shape[1]))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    chroma_times, memory_times, candidate_recall, pick_overlap = [], [], [], []
+    for query in queries:
+        query_list = query.tolist()
+
+        start = time.perf_counter()
+        chroma_docs = vector_store.max_marginal_relevance_search_by_vector(
+            query_list, k=args.k, fetch_k=args.fetch_k, lambda_mult=args.lambda_mult
+        )
+        chroma_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        memory_docs = index.search_mmr(query, k=args.k, fetch_k=args.fetch_k, lambda_mult=args.lambda_mult)
+        memory_times.append(time.perf_counter() - start)
+
+        chroma_candidates = set(collection.query(query_embeddings=[query_list], n_results=args.fetch_k, include=[])["ids"][0])
+        exact_rows, _ = index.top_candidates(query, args.fetch_k)
+        candidate_recall.append(len(chroma_candidates & {index.ids[r] for r in exact_rows}) / args.fetch_k)
+        pick_overlap.append(
+            len({d.page_content for d in chroma_docs} & {d.page_content for d in memory_docs}) / args.k
+        )
+
+    print(f"{'path':<8} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, times in (("chroma", chroma_times), ("memory", memory_times)):
+        print(f"{name:<8} {percentile(times, 50):>8.2f} {percentile(times, 95):>8.2f} {np.mean(times) * 1000:>8.2f}")
+    print(f"speedup (mean): {np.mean(chroma_times) / np.mean(memory_times):.1f}x")
+    print(f"Chroma fetch_k recall vs exact search: {np.mean(candidate_recall):.3f}")
+    print(f"final MMR pick overlap:                {np.mean(pick_overlap):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=PATH_TO_DB)
+    parser.add_argument("--synthetic", type=int, help="Benchmark a random corpus of this many chunks instead")
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    main(parser.parse_args())
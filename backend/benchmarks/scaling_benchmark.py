@@ -0,0 +1,217 @@
+"""Requests/sec of the retrieval-heavy chat path as serve.py goes from 1 to N worker processes.
+
+Builds one synthetic corpus, then for each worker count starts serve.py in a
+subprocess on a free local port, waits until every worker is ready and drives
+POST /api/chat/message (with RAG) over real TCP connections. Firestore, the
+embedding API and the LLM are the in-process fakes from benchmarks/fakes.py
+with no added latency, so the time per request is the CPU work this app does
+itself: hybrid retrieval and MMR over the memory-mapped index, prompt and
+context building, JSON and HTTP handling. Reports req/s, speedup over one
+worker, parallel efficiency and p50/p95 latency per worker count.
+
+The load generator is a single process and takes CPU time itself, so on a
+machine with N cores the step at N workers understates the server.
+
+Usage (from backend/):
+    python benchmarks/scaling_benchmark.py
+    python benchmarks/scaling_benchmark.py --workers 1 2 4 8 --corpus-size 500000 --json scaling.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from benchmarks.e2e_benchmark import (  # noqa: E402
+    build_corpus,
+    configure_environment,
+    corpus_paths,
+    install_placeholder_config,
+)
+
+
+def default_worker_counts():
+    cpus = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < cpus:
+        counts.append(counts[-1] * 2)
+    return counts + [cpus] if cpus > 1 else counts
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_server(args):
+    """Subprocess side: serve.py with the fakes installed in every worker"""
+    import serve
+
+    install_placeholder_config()
+    configure_environment(corpus_paths(args.root, args.corpus_size), args)
+
+    def install_fakes(worker_id):
+        from benchmarks.fakes import FakeEmbeddings, FakeFirebaseService, create_fake_llm
+        from app import dependencies
+        from app.services.embedding_service import CachedEmbeddings
+
+        firebase = FakeFirebaseService(latency_ms=0)
+        firebase.seed_users(args.users)
+        dependencies.install(firebase_service=firebase)
+        service = dependencies.rag_service()
+        service.embeddings = CachedEmbeddings(FakeEmbeddings(args.dim, latency_ms=0))
+        service.llm = create_fake_llm(latency_ms=0, tokens_per_second=1e6, completion_tokens=20)
+
+    serve.serve(args.server_workers, "127.0.0.1", args.port, log_level="warning", on_worker_start=install_fakes)
+
+
+async def wait_until_ready(base_url, workers, timeout=120):
+    """Every worker warms up on its own; new connections land on different ones, so require a run of 200s"""
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    async with httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(max_keepalive_connections=0)) as client:
+        while streak < 4 * workers:
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"{workers} worker(s) not ready after {timeout}s")
+            try:
+                ready = (await client.get("/ready")).status_code == 200
+            except httpx.TransportError:
+                ready = False
+            streak = streak + 1 if ready else 0
+            if not ready:
+                await asyncio.sleep(0.1)
+
+
+async def drive(base_url, seconds, concurrency, tokens, questions):
+    """Closed loop: `concurrency` clients each send their next request as soon as the last one returns"""
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=concurrency)
+    ) as client:
+
+        async def client_loop(user):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                i = next(counter)
+                start = time.perf_counter()
+                response = await client.post(
+                    "/api/chat/message",
+                    json={"message": questions[i % len(questions)]},
+                    headers={"Authorization": f"Bearer {tokens[user % len(tokens)]}"},
+                )
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(user) for user in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+async def measure(args, workers, tokens, questions):
+    port = free_port()
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--server-workers", str(workers), "--port", str(port), "--root", args.root,
+        "--corpus-size", str(args.corpus_size), "--dim", str(args.dim), "--users", str(args.users),
+    ]
+    # numpy is imported before serve.py could limit BLAS threads, so set the limits here
+    env = {**os.environ, "OPENBLAS_NUM_THREADS": "1", "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_ready(base_url, workers)
+        await drive(base_url, args.warmup, args.concurrency, tokens, questions)
+        latencies, errors, elapsed = await drive(base_url, args.duration, args.concurrency, tokens, questions)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    latencies_ms = np.asarray(latencies or [0.0]) * 1000
+    return {
+        "workers": workers,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "errors": errors,
+    }
+
+
+async def benchmark(args):
+    from benchmarks.fakes import synthetic_questions
+    from app.utils.auth import create_access_token
+
+    tokens = [create_access_token(data={"user_id": f"bench-user-{i}"}) for i in range(args.users)]
+    questions = synthetic_questions(5000, seed=3)
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'efficiency':>10} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    results = []
+    for workers in args.workers:
+        result = await measure(args, workers, tokens, questions)
+        baseline = results[0]["requests_per_second"] if results else result["requests_per_second"]
+        result["speedup"] = result["requests_per_second"] / baseline if baseline else 0.0
+        result["efficiency"] = result["speedup"] * args.workers[0] / workers
+        results.append(result)
+        print(
+            f"{workers:>7} {result['requests_per_second']:>9.1f} {result['speedup']:>7.2f}x "
+            f"{result['efficiency']:>9.0%} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['errors']:>7}"
+        )
+    return results
+
+
+def main(args):
+    if args.serve:
+        run_server(args)
+        return
+    with tempfile.TemporaryDirectory(prefix="huberman-scaling-") as root:
+        args.root = root
+        install_placeholder_config()
+        paths = corpus_paths(root, args.corpus_size)
+        configure_environment(paths, args)
+        build_corpus(paths, args.corpus_size, args)
+        args.concurrency = args.concurrency or 4 * max(args.workers)
+        print(f"{args.concurrency} concurrent clients, {args.duration}s per worker count")
+        results = asyncio.run(benchmark(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus_size": args.corpus_size, "dim": args.dim, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_worker_counts())
+    parser.add_argument("--concurrency", type=int, help="Concurrent clients (default: 4 x the most workers)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds measured per worker count")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of unmeasured load first")
+    parser.add_argument("--corpus-size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--dtype", default="int8", choices=["float32", "float16", "int8"])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--json", help="Write results here")
+    # Used by the benchmark to start each server subprocess
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--server-workers", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    # Corpus and environment settings shared with e2e_benchmark.py
+    parser.set_defaults(retriever="memory", chunk_words=120, no_hybrid=False, semantic_cache=False)
+    main(parser.parse_args())
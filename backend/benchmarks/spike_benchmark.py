@@ -0,0 +1,181 @@
+"""Simulated load spike against per-user rate limiting and LLM admission control.
+
+Runs the real app in-process with the same fakes as e2e_benchmark.py, then:
+  1. one user sends --abuser-requests /message calls at once while --users
+     other users keep chatting one request at a time
+  2. --flood-users distinct users, each within budget, send one call at the
+     same moment, far more than the LLM concurrency plus queue
+
+Prints status counts and latencies per group and exits non-zero unless:
+  * no request fails with a 500
+  * the abusive user is held to about their token burst (the rest get 429)
+  * the other users never see a 429 and nearly all get answers during the spike
+  * the flood overflow is turned away with 503 quickly instead of queueing
+
+Usage (from backend/):
+    python benchmarks/spike_benchmark.py
+    python benchmarks/spike_benchmark.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from benchmarks.e2e_benchmark import (  # noqa: E402
+    build_corpus,
+    configure_environment,
+    corpus_paths,
+    install_placeholder_config,
+)
+
+
+def summarize(label, outcomes):
+    statuses = collections.Counter(status for status, _ in outcomes)
+    latencies = np.asarray([latency for _, latency in outcomes]) * 1000
+    counts = " ".join(f"{status}:{count}" for status, count in sorted(statuses.items()))
+    print(f"{label:<22} {counts:<28} p50 {np.percentile(latencies, 50):>7.1f} ms  p95 {np.percentile(latencies, 95):>7.1f} ms")
+    return statuses
+
+
+def rejection_p95_ms(outcomes, status):
+    latencies = [latency for code, latency in outcomes if code == status]
+    return float(np.percentile(np.asarray(latencies) * 1000, 95)) if latencies else 0.0
+
+
+async def spike(args, root):
+    install_placeholder_config()
+    paths = corpus_paths(root, args.corpus_size)
+    configure_environment(paths, args)
+    os.environ.update({
+        "RATE_LIMIT_BACKEND": "redis" if args.redis_url else "memory",
+        "RATE_LIMIT_REDIS_URL": args.redis_url or "",
+        "USER_TOKENS_PER_MINUTE": str(args.tokens_per_minute),
+        "USER_TOKEN_BURST": str(args.burst),
+    })
+    build_corpus(paths, args.corpus_size, args)
+
+    from benchmarks.fakes import FakeEmbeddings, FakeFirebaseService, create_fake_llm, synthetic_questions
+    from app import dependencies
+    from app.main import app
+    from app.services.embedding_service import CachedEmbeddings
+    from app.utils.auth import create_access_token
+
+    firebase = FakeFirebaseService(latency_ms=5)
+    total_users = 1 + args.users + args.flood_users
+    user_ids = firebase.seed_users(total_users, history_messages=4)
+    dependencies.install(firebase_service=firebase)
+    service = dependencies.rag_service()
+    service.embeddings = CachedEmbeddings(FakeEmbeddings(args.dim, latency_ms=20))
+    service.llm = create_fake_llm(
+        latency_ms=args.llm_latency_ms,
+        tokens_per_second=1000,
+        completion_tokens=50,
+        max_concurrency=args.llm_concurrency,
+        max_queue=args.llm_queue,
+        queue_timeout=args.queue_timeout,
+    )
+    tokens = [create_access_token(data={"user_id": user_id}) for user_id in user_ids]
+    questions = synthetic_questions(args.abuser_requests + args.flood_users + args.users * args.rounds, seed=7)
+    cost = service.estimate_tokens(questions[0], True, [])
+    print(f"Estimated cost per RAG request: ~{cost} tokens; burst {args.burst}, {args.tokens_per_minute}/min")
+
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://spike", timeout=120
+    ) as client:
+
+        async def send(user, i, use_rag=True):
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/chat/message",
+                json={"message": questions[i % len(questions)], "use_rag": use_rag},
+                headers={"Authorization": f"Bearer {tokens[user]}"},
+            )
+            return response.status_code, time.perf_counter() - start
+
+        async def steady_user(user):
+            outcomes = []
+            for round_number in range(args.rounds):
+                outcomes.append(await send(user, user * args.rounds + round_number))
+                await asyncio.sleep(args.think_time)
+            return outcomes
+
+        # 1. One user bursts while everyone else chats normally
+        abuser = asyncio.gather(*(send(0, i) for i in range(args.abuser_requests)))
+        steady = asyncio.gather(*(steady_user(1 + u) for u in range(args.users)))
+        abuser_outcomes, steady_outcomes = await asyncio.gather(abuser, steady)
+        steady_outcomes = [outcome for outcomes in steady_outcomes for outcome in outcomes]
+        abuser_statuses = summarize("abusive user", abuser_outcomes)
+        steady_statuses = summarize("other users", steady_outcomes)
+
+        # 2. Many distinct users at once: within budget each, over capacity together
+        first_flood_user = 1 + args.users
+        flood_outcomes = await asyncio.gather(
+            *(send(first_flood_user + u, u, use_rag=False) for u in range(args.flood_users))
+        )
+        flood_statuses = summarize("flood", flood_outcomes)
+        print(f"503 rejection p95: {rejection_p95_ms(flood_outcomes, 503):.1f} ms")
+        print(f"admission: {service.llm.admission.stats()}")
+        print(f"rate limit: {dependencies.rate_limiter().stats()}")
+
+    await service.llm.close()
+
+    failures = []
+    for label, statuses in (("abusive user", abuser_statuses), ("other users", steady_statuses), ("flood", flood_statuses)):
+        if statuses.get(500):
+            failures.append(f"{label}: {statuses[500]} responses were 500")
+    allowed_abuser = abuser_statuses.get(200, 0)
+    if allowed_abuser > args.burst // cost + 1:
+        failures.append(f"abusive user got {allowed_abuser} answers, burst allows about {args.burst // cost}")
+    if not abuser_statuses.get(429):
+        failures.append("abusive user was never rate limited")
+    if steady_statuses.get(429):
+        failures.append(f"other users were rate limited {steady_statuses[429]} times")
+    if steady_statuses.get(200, 0) < 0.95 * len(steady_outcomes):
+        failures.append(f"only {steady_statuses.get(200, 0)}/{len(steady_outcomes)} other-user requests succeeded")
+    if args.flood_users > args.llm_concurrency + args.llm_queue and not flood_statuses.get(503):
+        failures.append("flood beyond concurrency + queue was never rejected with 503")
+    if rejection_p95_ms(flood_outcomes, 503) > args.max_rejection_ms:
+        failures.append(f"503s took over {args.max_rejection_ms} ms at p95")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return not failures
+
+
+def main(args):
+    with tempfile.TemporaryDirectory(prefix="huberman-spike-") as root:
+        ok = asyncio.run(spike(args, root))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", help="Use a Redis-compatible store for the buckets instead of process memory")
+    parser.add_argument("--tokens-per-minute", type=int, default=40000)
+    parser.add_argument("--burst", type=int, default=20000)
+    parser.add_argument("--abuser-requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20, help="Users chatting normally during the spike")
+    parser.add_argument("--rounds", type=int, default=3, help="Requests per normal user")
+    parser.add_argument("--think-time", type=float, default=0.2, help="Seconds between a normal user's requests")
+    parser.add_argument("--flood-users", type=int, default=300)
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--llm-queue", type=int, default=32)
+    parser.add_argument("--queue-timeout", type=float, default=5.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument(
+        "--max-rejection-ms", type=float, default=1500.0,
+        help="Allowed p95 latency of a 503; well under --queue-timeout, but the whole flood shares one event loop here"
+    )
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=64)
+    # Corpus and environment settings shared with e2e_benchmark.py
+    parser.set_defaults(retriever="memory", dtype="float32", chunk_words=120, no_hybrid=False, semantic_cache=False)
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+"""Measure how long the API takes to import, start accepting requests and become ready.
+
+Each run is a fresh Python process. It times `import app.main`, then enters
+the app lifespan (the point uvicorn starts accepting connections) and polls
+/ready until the background warm-up has created the services. Warm-up covers
+the tokenizer, the vector snapshot or Chroma client, BM25 and the LLM client.
+
+Firebase is replaced by the benchmark fake because the real service needs
+credentials. Retrieval uses a synthetic corpus built once before the runs,
+so no API keys or network access are needed.
+
+Usage (from backend/):
+    python benchmarks/startup_benchmark.py --runs 5
+    python benchmarks/startup_benchmark.py --corpus-size 1000000 --dtype int8
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from benchmarks.e2e_benchmark import (  # noqa: E402
+    build_corpus,
+    configure_environment,
+    corpus_paths,
+    install_placeholder_config,
+)
+
+
+async def measure_startup(args):
+    """One cold start in this process; returns timings in seconds"""
+    install_placeholder_config()
+    configure_environment(corpus_paths(args.workdir, args.corpus_size), args)
+
+    start = time.perf_counter()
+    from app import dependencies
+    from app.main import app
+    import_seconds = time.perf_counter() - start
+
+    from benchmarks.fakes import FakeFirebaseService
+    dependencies.install(firebase_service=FakeFirebaseService(latency_ms=0))
+
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+    ) as client:
+        accepting_seconds = time.perf_counter() - start
+        while (await client.get("/ready")).status_code != 200:
+            if dependencies.readiness()["error"]:
+                raise RuntimeError(dependencies.readiness()["error"])
+            await asyncio.sleep(0.005)
+        ready_seconds = time.perf_counter() - start
+    return {
+        "import": import_seconds,
+        "accepting": accepting_seconds,
+        "ready": ready_seconds,
+        "warmup": dependencies.readiness()["warmup_seconds"],
+    }
+
+
+def run_child(args):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child",
+        "--workdir", args.workdir,
+        "--corpus-size", str(args.corpus_size),
+        "--retriever", args.retriever,
+    ]
+    if args.no_hybrid:
+        command.append("--no-hybrid")
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=BACKEND_DIR).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    if args.child:
+        # Fields configure_environment expects but startup does not depend on
+        args.semantic_cache = False
+        print(json.dumps(asyncio.run(measure_startup(args))))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="huberman-startup-") as root:
+        args.workdir = args.workdir or root
+        install_placeholder_config()
+        args.semantic_cache = False
+        configure_environment(corpus_paths(args.workdir, args.corpus_size), args)
+        build_corpus(corpus_paths(args.workdir, args.corpus_size), args.corpus_size, args)
+
+        runs = [run_child(args) for _ in range(args.runs)]
+
+    print(f"{'stage':<22} {'median s':>9} {'max s':>9}")
+    for key, label in (
+        ("import", "import app.main"),
+        ("accepting", "lifespan to accepting"),
+        ("warmup", "warm-up"),
+        ("ready", "lifespan to ready"),
+    ):
+        values = [run[key] for run in runs]
+        print(f"{label:<22} {np.median(values):>9.3f} {max(values):>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--corpus-size", type=int, default=100000)
+    parser.add_argument("--retriever", choices=["memory", "chroma"], default="memory")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default="float32")
+    parser.add_argument("--chunk-words", type=int, default=120)
+    parser.add_argument("--no-hybrid", action="store_true")
+    parser.add_argument("--workdir", help="Keep the synthetic corpus here instead of a temporary directory")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    main(parser.parse_args())
@@ -0,0 +1,36 @@
+"""Export the huberman_lab Chroma collection to a memory-mappable snapshot.
+
+The snapshot is written to a new version directory and published with an
+atomic symlink swap, so it can be re-exported while servers are running;
+they reopen the new version within RAG_INDEX_RELOAD_SECONDS.
+
+Usage:
+    python export_snapshot.py --dtype int8
+    RAG_RETRIEVER=memory python run.py
+"""
+import argparse
+
+import chromadb
+
+from app.services.vector_index import SNAPSHOT_DTYPES, InMemoryVectorIndex
+
+# Mirrors app.services.rag_service, which is not imported so no API clients are created
+PATH_TO_DB = "../db/chroma"
+COLLECTION_NAME = "huberman_lab"
+PATH_TO_INDEX = "../db/index"
+
+
+def export_snapshot(db_path, output_path, dtype):
+    collection = chromadb.PersistentClient(path=db_path).get_collection(COLLECTION_NAME)
+    vector_index = InMemoryVectorIndex.from_chroma(collection)
+    vector_index.save(output_path, dtype=dtype)
+    print(f"Exported {len(vector_index)} chunks to {output_path} ({dtype})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=PATH_TO_DB)
+    parser.add_argument("--output", default=PATH_TO_INDEX)
+    parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="int8")
+    args = parser.parse_args()
+    export_snapshot(args.db, args.output, args.dtype)
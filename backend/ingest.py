@@ -0,0 +1,48 @@
+"""Incrementally (re)index the podcast transcripts into the huberman_lab collection.
+
+Only files whose content hash changed since the last run are chunked and
+embedded, so adding one episode only embeds that episode.
+
+Every chunk carries its episode id, title, guest and date, read from an
+optional episodes.json in the data folder and otherwise parsed from the
+filename. Editing episodes.json only rewrites chunk metadata, without
+re-embedding. The catalog used for filtered retrieval is written to
+../db/episodes.json.
+
+Collections built by notebooks/indexing_data.ipynb hold chunks with random
+ids and no metadata. The first run re-embeds every file (there is no
+manifest yet) and then deletes those chunks, so the corpus is never
+duplicated and answers keep working while it runs. Re-export the snapshot
+afterwards if you serve with RAG_RETRIEVER=memory.
+
+Usage:
+    python ingest.py
+    python ingest.py --data ../data --workers 8 --prune
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+
+from app.services.ingestion import DATA_FOLDER, EMBED_BATCH_SIZE, EMBED_CONCURRENCY, IngestionPipeline
+
+load_dotenv()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DATA_FOLDER)
+    parser.add_argument("--workers", type=int, help="Chunking processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="Parallel embedding requests")
+    parser.add_argument("--prune", action="store_true", help="Remove chunks of files deleted from --data")
+    args = parser.parse_args()
+
+    pipeline = IngestionPipeline(
+        data_folder=args.data,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+    )
+    indexed = asyncio.run(pipeline.run(prune=args.prune))
+    if indexed:
+        print(f"Indexed {indexed} file(s). Re-run export_snapshot.py if you serve with RAG_RETRIEVER=memory.")
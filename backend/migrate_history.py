@@ -0,0 +1,31 @@
+"""Migrate chat histories from the single-document format to the messages subcollection.
+
+Before: history/{user_id} = {"messages": [...]}
+After:  history/{user_id}/messages/{seq} = {"role", "content", "seq", ...}
+
+Users are also migrated lazily on their first read or write, so running this
+is optional; it is safe to re-run.
+"""
+import asyncio
+import sys
+
+from app.services.firebase_service import FirebaseService
+
+
+async def migrate_all():
+    firebase_service = FirebaseService()
+    migrated = 0
+    async for doc in firebase_service.db.collection("history").stream():
+        if "messages" in (doc.to_dict() or {}):
+            await firebase_service.migrate_legacy_history(doc.id)
+            migrated += 1
+            print(f"Migrated history for {doc.id}")
+    print(f"Migrated {migrated} user(s)")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(migrate_all())
+    except Exception as e:
+        print(f"Error migrating chat history: {e}")
+        sys.exit(1)
@@ -0,0 +1,183 @@
+"""Precompute RAG answers for the most frequently asked questions.
+
+Counts the user questions in every chat history in Firestore, groups them by
+normalized text and then by near-duplicate SimHash, and answers the --top
+most frequent groups asked at least --min-count times. Questions from
+--questions files (one per line, or JSONL with a "question" field) are always
+answered, whatever their count.
+
+Each answer is stored with the chunks it was built from in the answer store
+(ANSWER_STORE_PATH), replacing the previous set. Servers pick the new set up
+within ANSWER_STORE_RELOAD_SECONDS and answer matching standalone questions
+(no filters, and not a follow-up in the conversation) without an embedding or
+LLM call. ingest.py deletes answers whose chunks it re-indexes, so re-run
+this after ingesting.
+
+Needs the same API keys and Firebase credentials as the server.
+
+Usage:
+    python precompute_answers.py --top 500
+    python precompute_answers.py --questions sample_questions.txt --no-history
+    python precompute_answers.py --dry-run
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.answer_store import (  # noqa: E402
+    ANSWER_STORE_MAX_DISTANCE,
+    ANSWER_STORE_PATH,
+    PrecomputedAnswer,
+    SQLiteAnswerStore,
+    near_hash,
+    question_key,
+    simhash_bands,
+)
+
+
+async def history_questions():
+    """Every question users asked, from the messages subcollections and any legacy message arrays"""
+    from app.services.firebase_service import FirebaseService
+
+    firebase_service = FirebaseService()
+    try:
+        async for doc in firebase_service.db.collection_group("messages").stream():
+            message = doc.to_dict() or {}
+            if message.get("role") == "user" and message.get("content"):
+                yield message["content"]
+        async for doc in firebase_service.db.collection("history").stream():
+            for message in (doc.to_dict() or {}).get("messages") or []:
+                if message.get("role") == "user" and message.get("content"):
+                    yield message["content"]
+    finally:
+        await firebase_service.close()
+
+
+def file_questions(paths):
+    from batch_eval import load_questions
+
+    return [item["question"] for path in paths for item in load_questions(path)]
+
+
+class QuestionGroups:
+    """Question counts merged by exact normalized text, then by near-duplicate SimHash"""
+
+    def __init__(self, max_distance=ANSWER_STORE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.phrasings = {}
+
+    def add(self, question, count=1):
+        phrasings = self.phrasings.setdefault(question_key(question), {})
+        phrasings[question.strip()] = phrasings.get(question.strip(), 0) + count
+
+    def ranked(self):
+        """[(question, count)], most frequent first; each group is asked as its most common phrasing"""
+        exact = sorted(
+            ((max(phrasings, key=phrasings.get), sum(phrasings.values())) for phrasings in self.phrasings.values()),
+            key=lambda group: -group[1],
+        )
+        groups, by_band = [], {}
+        for question, count in exact:
+            value = near_hash(question)
+            group = None
+            if value is not None:
+                for band_key in simhash_bands(value, self.max_distance):
+                    for candidate in by_band.get(band_key, ()):
+                        if bin(candidate[1] ^ value).count("1") <= self.max_distance:
+                            group = candidate
+                            break
+                    if group is not None:
+                        break
+            if group is not None:
+                group[2] += count
+                continue
+            group = [question, value, count]
+            groups.append(group)
+            if value is not None:
+                for band_key in simhash_bands(value, self.max_distance):
+                    by_band.setdefault(band_key, []).append(group)
+        return sorted(((question, count) for question, _, count in groups), key=lambda group: -group[1])
+
+
+async def select_questions(args):
+    groups = QuestionGroups()
+    asked = 0
+    if not args.no_history:
+        async for question in history_questions():
+            groups.add(question)
+            asked += 1
+    selected = [(question, count) for question, count in groups.ranked() if count >= args.min_count][:args.top]
+    print(f"{asked} question(s) in chat history, {len(groups.phrasings)} distinct, "
+          f"{len(selected)} asked at least {args.min_count} time(s) selected")
+    seen = {question_key(question) for question, _ in selected}
+    for question in file_questions(args.questions):
+        if question_key(question) not in seen:
+            seen.add(question_key(question))
+            selected.append((question, 0))
+    return selected
+
+
+async def answer_all(selected, concurrency):
+    from app import dependencies
+
+    rag_service = dependencies.rag_service()
+    # Every answer is generated fresh from the current index, not served from an earlier one
+    rag_service.precomputed = None
+    rag_service.answer_cache = None
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question, count):
+        async with semaphore:
+            try:
+                text, docs, degraded = await rag_service.query_with_rag(question)
+            except Exception as e:
+                print(f"Skipped {question!r}: {str(e) or type(e).__name__}")
+                return None
+        if degraded or not docs:
+            print(f"Skipped {question!r}: answered without full retrieval ({', '.join(degraded) or 'no chunks'})")
+            return None
+        return PrecomputedAnswer.build(question, text, docs, count)
+
+    try:
+        results = await asyncio.gather(*(answer(question, count) for question, count in selected))
+    finally:
+        await rag_service.llm.close()
+    return [entry for entry in results if entry is not None]
+
+
+async def main(args):
+    selected = await select_questions(args)
+    if args.dry_run:
+        for question, count in selected:
+            print(f"{count:>6}  {question}")
+        return True
+    start = time.perf_counter()
+    entries = await answer_all(selected, args.concurrency)
+    store = SQLiteAnswerStore(args.store)
+    try:
+        store.replace_all(entries)
+    finally:
+        store.close()
+    print(f"Stored {len(entries)} of {len(selected)} answer(s) in {args.store} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return len(entries) == len(selected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=500, help="Most frequent question groups to answer")
+    parser.add_argument("--min-count", type=int, default=2, help="Times a question must have been asked")
+    parser.add_argument("--questions", nargs="*", default=[], help="Files of questions to answer regardless")
+    parser.add_argument("--no-history", action="store_true", help="Only answer --questions")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions answered at once")
+    parser.add_argument("--store", default=ANSWER_STORE_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Print the selected questions and stop")
+    args = parser.parse_args()
+    if not args.store:
+        parser.error("ANSWER_STORE_PATH is empty; pass --store")
+    sys.exit(0 if asyncio.run(main(args)) else 1)
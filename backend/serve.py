@@ -0,0 +1,148 @@
+"""Production launcher: several uvicorn worker processes sharing one listening socket.
+
+The parent binds the port, opens the read-only indexes (memory-mapped vector
+snapshot, BM25 index, episode catalog) and then forks the workers, which
+inherit both. Each worker creates its own clients and warms its tokenizer in
+the app lifespan; /ready answers 200 once the worker that serves it is warm.
+A worker that dies is replaced. SIGTERM or SIGINT stops every worker
+gracefully.
+
+run.py is still the development server (one process, auto-reload).
+
+Usage (from backend/):
+    python serve.py                      # one worker per CPU on 0.0.0.0:8000
+    python serve.py --workers 4 --port 8080
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS") or 0) or os.cpu_count() or 1
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_BACKLOG = 2048
+RESTART_DELAY_SECONDS = 1.0
+APP = "app.main:app"
+
+
+def limit_native_threads():
+    """One process per core already; BLAS thread pools in every worker would oversubscribe the CPUs.
+
+    Must run before numpy is first imported.
+    """
+    for name in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(name, "1")
+
+
+def bind_socket(host, port):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(SERVE_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload():
+    """Import the app and open the read-only indexes once, before forking"""
+    import app.main  # noqa: F401  (creates no services at import)
+    from app.services import rag_service
+
+    start = time.perf_counter()
+    rag_service.preload_indexes()
+    print(f"Preloaded indexes in {time.perf_counter() - start:.1f}s")
+    # Keep the garbage collector from writing to (and so copying) inherited objects in every worker
+    gc.freeze()
+
+
+def run_worker(sock, worker_id, log_level, on_start=None):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.environ["SERVE_WORKER_ID"] = str(worker_id)
+    if on_start is not None:
+        on_start(worker_id)
+    import uvicorn
+
+    config = uvicorn.Config(APP, log_level=log_level, timeout_graceful_shutdown=30)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(workers=SERVE_WORKERS, host=SERVE_HOST, port=SERVE_PORT, preload_indexes=True, log_level="info",
+          on_worker_start=None):
+    """Fork `workers` uvicorn servers on one socket and keep them running until signalled.
+
+    on_worker_start(worker_id) runs in each worker before its server starts.
+    """
+    sock = bind_socket(host, port)
+    if preload_indexes:
+        preload()
+    if workers > 1 and os.getenv("RATE_LIMIT_BACKEND", "memory") == "memory":
+        print("Note: RATE_LIMIT_BACKEND=memory keeps separate budgets per worker; use redis to share them")
+
+    children = {}
+    stopping = False
+
+    def spawn(worker_id):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(sock, worker_id, log_level, on_worker_start)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = worker_id
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker_id in range(workers):
+        spawn(worker_id)
+    print(f"Serving {APP} on {host}:{sock.getsockname()[1]} with {workers} worker(s), pids {sorted(children)}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        if worker_id is None or stopping:
+            continue
+        print(f"Worker {worker_id} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        time.sleep(RESTART_DELAY_SECONDS)
+        if not stopping:
+            spawn(worker_id)
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Worker processes (default: CPU count)")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--no-preload", action="store_true", help="Let each worker open the indexes itself")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    limit_native_threads()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    serve(args.workers, args.host, args.port, not args.no_preload, args.log_level)
@@ -0,0 +1,123 @@
+"""Local OpenAI-compatible stub for offline load testing.
+
+Serves /v1/chat/completions (plain and streamed) and /v1/embeddings with
+configurable latency and token rate, so the whole /api/chat/message
+pipeline can be measured with no network or API spend.
+
+Usage:
+    python stub_llm_server.py --port 8001 --latency-ms 300 --tokens-per-second 60
+    LLM_BACKEND=stub LLM_STUB_URL=http://localhost:8001/v1 python run.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_WORDS = (
+    "Morning sunlight viewing within the first hour after waking sets the circadian clock "
+    "and improves sleep quality later that night while also increasing alertness"
+).split()
+
+
+def create_stub_app(latency_ms=300.0, tokens_per_second=60.0, completion_tokens=200, embedding_dim=3072):
+    app = FastAPI(title="Stub LLM")
+
+    def completion_id():
+        return f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    def completion_length(body):
+        return min(completion_tokens, body.get("max_tokens") or completion_tokens)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        length = completion_length(body)
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        words = [STUB_WORDS[i % len(STUB_WORDS)] for i in range(length)]
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000 + length / tokens_per_second)
+            return {
+                "id": completion_id(),
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "length" if length == body.get("max_tokens") else "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": length,
+                    "total_tokens": prompt_tokens + length,
+                },
+            }
+
+        async def events():
+            chunk_id = completion_id()
+            await asyncio.sleep(latency_ms / 1000)
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1 / tokens_per_second)
+            final = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency_ms / 1000 / 4)
+        data = []
+        for index, text in enumerate(inputs):
+            # Deterministic per input, so repeated queries embed identically
+            seed = int.from_bytes(hashlib.sha256(str(text).encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(embedding_dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            data.append({"object": "embedding", "index": index, "embedding": vector.tolist()})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--embedding-dim", type=int, default=3072)
+    args = parser.parse_args()
+    app = create_stub_app(args.latency_ms, args.tokens_per_second, args.completion_tokens, args.embedding_dim)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")